@@ -1,284 +1,37 @@
 # Import librairies
-from pathlib import Path
-from typing import Optional
-from uuid import uuid4
-import hashlib
-import json
 import gradio as gr
-import gemmi
 from gradio_molecule3d import Molecule3D
-from modal_app import app, chai1_inference, download_inference_dependencies, here
-from numpy import load
-from typing import List
+from modal_app import here
+from chai1_tools import (
+    CASCADE_METRICS,
+    INDEX_COLUMNS,
+    REPRESENTATIVE_COLUMNS,
+    cancel_chai1,
+    compute_Chai1,
+    compute_Chai1_batch,
+    compute_Chai1_cascade,
+    compute_Chai1_sweep,
+    create_fasta_file,
+    create_json_config,
+    fetch_model_cif,
+    filter_models,
+    get_chai1_result,
+    get_chai1_status,
+    job_metrics,
+    plot_protein,
+    rank_models,
+    representative_models,
+    show_cif_file,
+    submit_chai1,
+)
+import result_cache
+import score_index
 
 theme = gr.themes.Default(
     text_size="md",
     radius_size="lg",
 )
 
-# Helper functions
-def select_best_model(
-    run_id: str,
-    number_of_scores: int=5,
-    scores_to_print: List[str]=None,
-    results_dir: str="results/score",
-    prefix: str="-scores.model_idx_",
-):
-    """
-    Selects the best model based on the aggregate score among several simulation results.
-
-    Args:
-        run_id (str): Unique identifier for the inference run.
-        number_of_scores (int, optional): Number of models to evaluate (number of score files to read). Default is 5.
-        scores_to_print (List[str], optional): List of score names to display for each model (e.g., ["aggregate_score", "ptm", "iptm"]). Default is ["aggregate_score", "ptm", "iptm"].
-        results_dir (str, optional): Directory where the result files are located. Default is "results/score".
-        prefix (str, optional): Prefix used in the score file names. Default is "-scores.model_idx_".
-
-    Returns:
-        Tuple[int, float]: 
-            - best_model (int): Index of the best model (the one with the highest aggregate score and without inter-chain clashes).
-            - max_aggregate_score (float): Value of the highest aggregate score.
-    """
-    print(f"🧬 Start reading scores for each inference...")
-    if scores_to_print is None:
-        scores_to_print = ["aggregate_score", "ptm", "iptm"]
-    max_aggregate_score = 0
-    best_model = None
-    for model_index in range(number_of_scores):
-        print(f"    🧬 Reading scores for model {model_index}...")
-        data = load(f"{results_dir}/{run_id}{prefix}{model_index}.npz")
-        if data["has_inter_chain_clashes"][0] == False:
-            for item in scores_to_print:
-                print(f"{item}: {data[item][0]}")
-        else:
-            print(f"        🧬 Model {model_index} has inter-chain clashes, skipping scores.")
-            continue
-        if data["aggregate_score"][0] > max_aggregate_score:
-            max_aggregate_score = data["aggregate_score"][0]
-            best_model = int(model_index)
-    print(
-        f"🧬 Best model is {best_model} with an aggregate score of {max_aggregate_score}."
-    )
-    return best_model, max_aggregate_score
-
-# Definition of the tools for the MCP server 
-# Function to return a fasta file
-def create_fasta_file(file_content: str, name: Optional[str] = None, seq_name: Optional[str] = None) -> str:
-    """Create a FASTA file from a biomolecule sequence string with a unique name.
-    
-    Args:
-        file_content (str): The content of the FASTA file required with optional line breaks
-        name (str, optional): FASTA file name ending with .fasta ideally. If not provided, a unique ID will be generated
-        seq_name (str, optional): The name/identifier for the sequence. Defaults to "protein"
-        
-    
-    Returns:
-        str: Name of the created FASTA file
-    """
-    # If the file_content is empty, raise an error
-    if not file_content.strip():
-        print("Fasta file content cannot be empty so the example fasta file will be used")
-        file_content = ">protein|name=example-protein\nAGSHSMRYFSTSVSRPGRGEPRFIAVGYVDDTQFVRFD"
-    
-    # Remove any trailing/leading whitespace but preserve line breaks
-    lines = file_content.strip().split('\n')
-    
-    # Check if the first line is a FASTA header
-    if not lines[0].startswith('>'):
-        # If no header provided, add one
-        if seq_name is None:
-            seq_name = "protein"
-        file_content = f">{seq_name}\n{file_content}"
-    
-    # Create FASTA content (preserving line breaks)
-    fasta_content = file_content
-    
-    # Generate a unique file name
-    unique_id = hashlib.sha256(uuid4().bytes).hexdigest()[:8]
-    if name:
-        file_name = name
-    else:
-        file_name = f"chai1_{unique_id}.fasta"
-    file_path = here / "inputs/fasta" / file_name
-    
-    # Write the FASTA file
-    with open(file_path, "w") as f:
-        f.write(fasta_content)
-
-
-# Function to create a JSON file
-def create_json_config(
-    num_diffn_timesteps: int,
-    num_trunk_recycles: int,
-    seed: int,
-    options: list,
-    name: Optional[str] = None
-    ) -> str:
-    """Create a JSON configuration file from the Gradio interface inputs.
-    
-    Args:
-        num_diffn_timesteps (int): Number of diffusion timesteps from slider
-        num_trunk_recycles (int): Number of trunk recycles from slider
-        seed (int): Random seed from slider
-        options (list): List of selected options from checkbox group
-        name (str, optional): JSON config file name ending with .json ideally. If not provided, a unique ID will be generated
-    
-    Returns:
-        str: Name of the created JSON file
-    """
-    # Convert checkbox options to boolean flags
-    use_esm_embeddings = "ESM_embeddings" in options
-    use_msa_server = "MSA_server" in options
-    
-    # Create config dictionary
-    config = {
-        "num_trunk_recycles": num_trunk_recycles,
-        "num_diffn_timesteps": num_diffn_timesteps,
-        "seed": seed,
-        "use_esm_embeddings": use_esm_embeddings,
-        "use_msa_server": use_msa_server
-    }
-    
-    # Generate file name based on provided name or unique ID
-    unique_id = hashlib.sha256(uuid4().bytes).hexdigest()[:8]
-    if name:
-        file_name = name
-    else:
-        file_name = f"chai1_{unique_id}.json"
-    file_path = here / "inputs/config" / file_name
-    
-    # Write the JSON file 
-    with open(file_path, "w") as f:
-        json.dump(config, f, indent=4)
-
-
-# Function to compute Chai1 inference
-def compute_Chai1(
-    fasta_file_name: Optional[str] = "",
-    inference_config_file_name: Optional[str] = "",
-):
-    """Compute a Chai1 simulation.
-
-    Args:
-        fasta_file_name (str, optional): FASTA file name to use for the Chai1 simulation.
-            If not provided, uses the default input file.
-        inference_config_file_name (str, optional): JSON configuration file name for inference.
-            If not provided, uses the default quick inference configuration.
-
-    Returns:
-        pd.DataFrame: DataFrame containing model scores and CIF file paths
-    """
-    import pandas as pd
-    with app.run():
-        force_redownload = False
-        
-        print("🧬 checking inference dependencies")
-        download_inference_dependencies.remote(force=force_redownload)
-
-        # Define fasta file
-        if not fasta_file_name:
-            fasta_file_name = here / "inputs/fasta" / "chai1_default_input.fasta"   
-        print(f"🧬 running Chai inference on {fasta_file_name}")
-        fasta_file_name = here / "inputs/fasta" / fasta_file_name
-        print(fasta_file_name)
-        fasta_content = Path(fasta_file_name).read_text()
-
-        # Define inference config file
-        if not inference_config_file_name:
-            inference_config_file_name = here / "inputs/config" / "chai1_quick_inference.json"
-        inference_config_file_name = here / "inputs/config" / inference_config_file_name
-        print(f"🧬 loading Chai inference config from {inference_config_file_name}")
-        inference_config = json.loads(Path(inference_config_file_name).read_text())
-
-        # Generate a unique run ID
-        run_id = hashlib.sha256(uuid4().bytes).hexdigest()[:8]  # short id
-        print(f"🧬 running inference with {run_id=}")
-
-        results = chai1_inference.remote(fasta_content, inference_config, run_id)
-
-        # Define output directory
-        output_dir = Path("./results")
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        print(f"🧬 saving results to disk locally in {output_dir}")
-        
-        # Create lists to store data for DataFrame
-        model_data = []
-        
-        for ii, (scores, cif) in enumerate(results):
-            score_file = Path(output_dir, "score") / f"{run_id}-scores.model_idx_{ii}.npz"
-            cif_file = Path(output_dir, "molecules") / f"{run_id}-preds.model_idx_{ii}.cif"
-            
-            score_file.write_bytes(scores)
-            cif_file.write_text(cif)
-            
-            # Load score data
-            data = load(str(score_file))
-            
-            if not data["has_inter_chain_clashes"][0]:
-                model_data.append({
-                    "Model Index": ii,
-                    "Aggregate Score": float(data["aggregate_score"][0]),
-                    "PTM": float(data["ptm"][0]),
-                    "IPTM": float(data["iptm"][0]),
-                    "CIF File": str(cif_file).split("/")[-1],  # Get just the file name
-                })
-        
-        # Create DataFrame from collected data
-        results_df = pd.DataFrame(model_data).sort_values("Aggregate Score", ascending=False)
-        
-        return results_df
-
-
-# Function to plot the 3D protein structure
-def plot_protein(result_df) -> str:
-    """Plot the 3D structure of a biomolecule using the DataFrame from compute_Chai1.
-
-    Args:
-        result_df (pd.DataFrame): DataFrame containing model information and scores
-
-    Returns:
-        str: Path to the generated PDB file of the best model.
-    """
-    if result_df.empty:
-        return ""  # Return empty string instead of None for type safety
-    
-    # Get the CIF file path of the model with highest aggregate score (already sorted)
-    best_cif = str(Path("results/molecules") / result_df.iloc[0]["CIF File"])
-    
-    # Generate PDB file name
-    pdb_file = best_cif.replace('.cif', '.pdb')
-    
-    # Convert CIF to PDB if it doesn't exist
-    if not Path(pdb_file).exists():
-        st = gemmi.read_structure(best_cif)
-        st.write_minimal_pdb(pdb_file)
-    
-    return pdb_file
-
-
-# Function to plot a CIF file
-def show_cif_file(cif_file):
-    """Plot a 3D structure from a CIF file with the Molecule3D library.
-
-    Args:
-        cif_file: A biomolecule structure file in CIF format. This can be a file uploaded by the user.
-            If None, the function will return None.
-
-    Returns:
-        str or None: PDB file name if successful, None if no file was provided
-            or if conversion failed.
-    """
-    if not cif_file:
-        return None
-    
-    cif_path = Path(cif_file.name)
-    st = gemmi.read_structure(str(cif_path))
-    pdb_file = cif_path.with_suffix('.pdb')
-    st.write_minimal_pdb(str(pdb_file))  # Convert PosixPath to string
-    
-    return str(pdb_file)
-
 
 # Create the Gradio interface
 reps = [{"model": 0,"style": "cartoon","color": "hydrophobicity"}]
@@ -354,9 +107,21 @@ with gr.Blocks(theme=theme) as demo:
         # MCP tools
         1. `create_fasta_file`: Create a FASTA file from a biomolecule sequence string with a unique name.
         2. `create_json_config`: Create a JSON configuration file from the Gradio interface inputs.
-        3. `compute_Chai1`: Compute a Chai-1 simulation on Modal labs server. Return a DataFrame with protein scores.
+        3. `compute_Chai1`: Compute a Chai-1 simulation on Modal labs server. Return a DataFrame with protein scores and the 3D structure of the best model, streamed as each model is ready. Identical jobs are served from a local result cache unless `use_cache` is False.
         4. `plot_protein`: Plot the 3D structure of a biomolecule using the DataFrame from `compute_Chai1` (Use for Gradio interface).
         5. `show_cif_file`: Plot a 3D structure from a CIF file with the Molecule3D library (Use for the Gradio interface).
+        6. `compute_Chai1_batch`: Compute Chai-1 simulations for a list of FASTA files in parallel on Modal labs server. Return a combined DataFrame updated as each job finishes.
+        7. `compute_Chai1_sweep`: Compute a grid of Chai-1 simulations over seeds, diffusion timesteps and trunk recycles in parallel. Return a single DataFrame ranked by aggregate score with the config of each row.
+        8. `submit_chai1`: Submit a Chai-1 simulation to the deployed Modal app without waiting for it. Return a run ID.
+        9. `get_chai1_status`: Get the status of a submitted simulation.
+        10. `get_chai1_result`: Get the DataFrame of scores of a completed simulation.
+        11. `cancel_chai1`: Cancel a submitted simulation.
+        12. `rank_models`: Rank the models of all previous runs by aggregate score, pTM or ipTM, optionally for one FASTA input.
+        13. `filter_models`: Filter the models of all previous runs by minimum scores and config values.
+        14. `fetch_model_cif`: Get the CIF file of one model of a previous run, fetched on demand from the Modal volume.
+        15. `compute_Chai1_cascade`: Screen a library with the quick config and run only the promising inputs with the full config, reporting the GPU time saved.
+        16. `representative_models`: Cluster the models of all previous runs by structure and keep only the best model of each cluster.
+        17. `job_metrics`: Get the time of each stage of a run (MSA, trunk, diffusion, transfer, ...) with its GPU memory peak and payload sizes, or the p50/p95 of each stage over all runs.
         """)
         
         with open("introduction_page.md", "r") as f:
@@ -453,14 +218,237 @@ with gr.Blocks(theme=theme) as demo:
         )
         out2 = Molecule3D(label="Plot the 3D Molecule", reps=reps)
         
+        cache_checkbox = gr.Checkbox(value=True, label="Use result cache", info="Reuse the results of an identical previous run instead of running a new simulation")
+        shards_slider = gr.Slider(1, 5, value=1, step=1, label="Diffusion shards", info="Spread the 5 diffusion samples over parallel containers, faster for long inputs")
         btn = gr.Button("Run Simulation")
-        btn.click(fn=compute_Chai1, inputs=[inp1 , inp2], outputs=[out]).then(
+        btn.click(fn=compute_Chai1, inputs=[inp1 , inp2, cache_checkbox, shards_slider], outputs=[out, out2])
+    
+    
+    with gr.Tab("Batch folding 🧪"):
+        
+        gr.Markdown(
+        """
+        ## Fold a library of FASTA files in parallel
+        Each selected FASTA file is one complex. If the split option is checked, a file can hold several complexes separated by a blank line or a `//` line, the records of a complex (partner chains, ligands) being folded together. The table is updated each time a job finishes.
+        """)
+        
+        with gr.Row():
+            with gr.Column(scale=1):
+                batch_config = gr.FileExplorer(root_dir=here / "inputs/config", 
+                                value="chai1_quick_inference.json",
+                                label="Configuration file", 
+                                file_count='single')
+                
+            with gr.Column(scale=1):
+                batch_fasta = gr.FileExplorer(root_dir=here / "inputs/fasta", 
+                                label="Input Fasta files", 
+                                file_count='multiple')
+        
+        with gr.Row():
+            batch_split = gr.Checkbox(value=False, label="Split complexes", info="Fold each complex of a FASTA file as its own job, complexes separated by a blank line or //")
+            batch_concurrency = gr.Slider(1, 50, value=10, label="Maximum concurrency", info="Maximum number of simulations running at the same time", step=1, interactive=True)
+            batch_cache = gr.Checkbox(value=True, label="Use result cache", info="Reuse the results of identical previous runs")
+        
+        batch_out = gr.DataFrame(
+            headers=["Input", "Run ID", "Model Index", "Aggregate Score", "PTM", "IPTM", "CIF File"],
+            datatype=["str", "str", "number", "number", "number", "number", "str"],
+            label="Batch results sorted by Aggregate Score",
+            visible=True,
+        )
+        batch_out2 = Molecule3D(label="Plot the best 3D Molecule", reps=reps)
+        
+        batch_btn = gr.Button("Run Batch")
+        batch_btn.click(fn=compute_Chai1_batch, inputs=[batch_fasta, batch_config, batch_split, batch_concurrency, batch_cache], outputs=[batch_out]).then(
             fn=plot_protein, 
-            inputs=out, 
-            outputs=out2
+            inputs=batch_out, 
+            outputs=batch_out2
         )
     
     
+    with gr.Tab("Cascade screening 🪜"):
+        
+        gr.Markdown(
+        """
+        ## Screen a library with the quick config, then run the promising inputs with the full config
+        An input goes on to the full config if the best score of its quick models clears the threshold, or if it ranks in the top-k inputs.
+        """)
+        
+        with gr.Row():
+            with gr.Column(scale=1):
+                cascade_quick_config = gr.FileExplorer(root_dir=here / "inputs/config", 
+                                value="chai1_quick_inference.json",
+                                label="Quick configuration file", 
+                                file_count='single')
+                cascade_full_config = gr.FileExplorer(root_dir=here / "inputs/config", 
+                                value="chai1_default_inference.json",
+                                label="Full configuration file", 
+                                file_count='single')
+                
+            with gr.Column(scale=1):
+                cascade_fasta = gr.FileExplorer(root_dir=here / "inputs/fasta", 
+                                label="Input Fasta files", 
+                                file_count='multiple')
+        
+        with gr.Row():
+            cascade_metric = gr.Dropdown(list(CASCADE_METRICS), value="iptm", label="Escalation score")
+            cascade_threshold = gr.Number(value=0.5, label="Threshold")
+            cascade_top_k = gr.Number(value=0, precision=0, label="Top-k", info="0 to only use the threshold")
+        with gr.Row():
+            cascade_split = gr.Checkbox(value=False, label="Split complexes", info="Screen each complex of a FASTA file as its own job, complexes separated by a blank line or //")
+            cascade_concurrency = gr.Slider(1, 50, value=10, label="Maximum concurrency", info="Maximum number of simulations running at the same time", step=1, interactive=True)
+            cascade_cache = gr.Checkbox(value=True, label="Use result cache", info="Reuse the results of identical previous runs")
+        
+        cascade_out = gr.DataFrame(
+            headers=["Stage", "Input", "Run ID", "Model Index", "Aggregate Score", "PTM", "IPTM", "CIF File"],
+            datatype=["str", "str", "str", "number", "number", "number", "number", "str"],
+            label="Cascade results, full pass first",
+            visible=True,
+        )
+        cascade_report = gr.JSON(label="GPU time report")
+        cascade_out2 = Molecule3D(label="Plot the best 3D Molecule", reps=reps)
+        
+        cascade_btn = gr.Button("Run Cascade")
+        cascade_btn.click(fn=compute_Chai1_cascade, inputs=[cascade_fasta, cascade_quick_config, cascade_full_config, cascade_metric, cascade_threshold, cascade_top_k, cascade_split, cascade_concurrency, cascade_cache], outputs=[cascade_out, cascade_report]).then(
+            fn=plot_protein, 
+            inputs=cascade_out, 
+            outputs=cascade_out2
+        )
+    
+    
+    with gr.Tab("Parameter sweep 🎛️"):
+        
+        gr.Markdown(
+        """
+        ## Sweep seeds, diffusion timesteps and trunk recycles
+        Values can be a list (`1,2,5`), a range (`1-5`) or a stepped range (`10:200:50`). All the points run in parallel and the table is ranked by Aggregate Score.
+        """)
+        
+        with gr.Row():
+            with gr.Column(scale=1):
+                sweep_fasta = gr.FileExplorer(root_dir=here / "inputs/fasta", 
+                                value="chai1_default_input.fasta",
+                                label="Input Fasta file", 
+                                file_count='single')
+                
+            with gr.Column(scale=1):
+                sweep_seeds = gr.Textbox(value="1-5", label="Seeds")
+                sweep_timesteps = gr.Textbox(value="200", label="Number of diffusion time steps")
+                sweep_recycles = gr.Textbox(value="3", label="Number of trunk recycles")
+                sweep_options = gr.CheckboxGroup(["ESM_embeddings", "MSA_server"], value=["ESM_embeddings",], label="Additional options")
+                sweep_concurrency = gr.Slider(1, 50, value=10, label="Maximum concurrency", info="Maximum number of containers running at the same time", step=1, interactive=True)
+                sweep_share = gr.Checkbox(value=True, label="Share setup across seeds", info="Run the points that only differ by seed in the same container")
+                sweep_cache = gr.Checkbox(value=True, label="Use result cache", info="Reuse the results of identical previous runs")
+        
+        sweep_out = gr.DataFrame(
+            headers=["seed", "num_diffn_timesteps", "num_trunk_recycles", "Run ID", "Model Index", "Aggregate Score", "PTM", "IPTM", "CIF File"],
+            datatype=["number", "number", "number", "str", "number", "number", "number", "number", "str"],
+            label="Sweep results sorted by Aggregate Score",
+            visible=True,
+        )
+        sweep_out2 = Molecule3D(label="Plot the best 3D Molecule", reps=reps)
+        
+        sweep_btn = gr.Button("Run Sweep")
+        sweep_btn.click(fn=compute_Chai1_sweep, inputs=[sweep_fasta, sweep_seeds, sweep_timesteps, sweep_recycles, sweep_options, sweep_concurrency, sweep_share, sweep_cache], outputs=[sweep_out]).then(
+            fn=plot_protein, 
+            inputs=sweep_out, 
+            outputs=sweep_out2
+        )
+    
+    
+    with gr.Tab("Jobs 📋"):
+        
+        gr.Markdown(
+        """
+        ## Submit simulations and come back for the results
+        Requires the Modal app to be deployed with `modal deploy modal_app.py`.
+        """)
+        
+        with gr.Row():
+            with gr.Column(scale=1):
+                job_config = gr.FileExplorer(root_dir=here / "inputs/config", 
+                                value="chai1_quick_inference.json",
+                                label="Configuration file", 
+                                file_count='single')
+                
+            with gr.Column(scale=1):
+                job_fasta = gr.FileExplorer(root_dir=here / "inputs/fasta", 
+                                value="chai1_default_input.fasta",
+                                label="Input Fasta file", 
+                                file_count='single')
+        
+        job_cache = gr.Checkbox(value=True, label="Use result cache", info="Reuse the results of an identical previous run")
+        job_submit_btn = gr.Button("Submit Simulation")
+        job_run_id = gr.Textbox(label="Run ID", interactive=True)
+        job_submit_btn.click(fn=submit_chai1, inputs=[job_fasta, job_config, job_cache], outputs=[job_run_id])
+        
+        with gr.Row():
+            job_status_btn = gr.Button("Get status")
+            job_result_btn = gr.Button("Get result")
+            job_cancel_btn = gr.Button("Cancel")
+            job_metrics_btn = gr.Button("Job metrics")
+        job_status = gr.JSON(label="Job status")
+        job_result = gr.DataFrame(
+            headers=["Model Index", "Aggregate Score", "PTM", "IPTM", "CIF File"],
+            datatype=["number", "number", "number", "number", "str"],
+            label="Inference Results sorted by Aggregate Score",
+            visible=True,
+        )
+        job_status_btn.click(fn=get_chai1_status, inputs=[job_run_id], outputs=[job_status])
+        job_result_btn.click(fn=get_chai1_result, inputs=[job_run_id], outputs=[job_result])
+        job_cancel_btn.click(fn=cancel_chai1, inputs=[job_run_id], outputs=[job_status])
+        job_metrics_btn.click(fn=job_metrics, inputs=[job_run_id], outputs=[job_status])
+    
+    
+    with gr.Tab("Score index 🗂️"):
+        
+        gr.Markdown(
+        """
+        ## Rank and filter the models of all previous runs
+        """)
+        
+        index_fasta = gr.FileExplorer(root_dir=here / "inputs/fasta", 
+                                label="Only models of this Fasta file (optional)", 
+                                file_count='single')
+        index_clashes = gr.Checkbox(value=False, label="Include models with inter-chain clashes")
+        index_out = gr.DataFrame(
+            headers=INDEX_COLUMNS,
+            label="Indexed models",
+            visible=True,
+        )
+        
+        with gr.Row():
+            with gr.Column(scale=1):
+                index_metric = gr.Dropdown(score_index.METRICS, value="aggregate_score", label="Rank by")
+                index_top_k = gr.Slider(1, 100, value=10, step=1, label="Number of models")
+                index_rank_btn = gr.Button("Rank models")
+                index_rank_btn.click(fn=rank_models, inputs=[index_fasta, index_metric, index_top_k, index_clashes], outputs=[index_out])
+            
+            with gr.Column(scale=1):
+                index_min_aggregate = gr.Number(value=0.0, label="Minimum aggregate score")
+                index_min_ptm = gr.Number(value=0.0, label="Minimum pTM")
+                index_min_iptm = gr.Number(value=0.0, label="Minimum ipTM")
+                index_config = gr.Textbox(placeholder='{"seed": 42}', label="Config filter (JSON)")
+                index_filter_btn = gr.Button("Filter models")
+                index_filter_btn.click(fn=filter_models, inputs=[index_fasta, index_min_aggregate, index_min_ptm, index_min_iptm, index_config, index_clashes], outputs=[index_out])
+        
+        with gr.Row():
+            index_rmsd = gr.Number(value=2.0, label="RMSD threshold (Å)", info="Models closer than this to a better model are near-duplicates")
+            index_representatives_btn = gr.Button("Representatives only")
+        index_representatives_out = gr.DataFrame(
+            headers=REPRESENTATIVE_COLUMNS,
+            label="One model per structural cluster",
+            visible=True,
+        )
+        index_representatives_btn.click(fn=representative_models, inputs=[index_fasta, index_rmsd, index_metric, index_clashes], outputs=[index_representatives_out])
+        
+        with gr.Row():
+            fetch_run_id = gr.Textbox(label="Run ID")
+            fetch_model_index = gr.Number(value=0, precision=0, label="Model index")
+            fetch_btn = gr.Button("Get CIF file")
+        fetch_out = gr.File(label="CIF file")
+        fetch_btn.click(fn=fetch_model_cif, inputs=[fetch_run_id, fetch_model_index], outputs=[fetch_out])
+    
+    
     with gr.Tab("Plot CIF file 💻"):     
         
         gr.Markdown(
@@ -469,9 +457,12 @@ with gr.Blocks(theme=theme) as demo:
         """)
         
         cif_input = gr.File(label="Input CIF file", file_count='single')
+        cif_detail = gr.Radio(["auto", "trace", "backbone", "full"], value="auto", label="Level of detail", info="auto shows a trace or a backbone first for large structures, then all the atoms")
         cif_output = Molecule3D(label="Plot the 3D Molecule", reps=reps)        
-        cif_input.change(fn=show_cif_file, inputs=cif_input, outputs=cif_output)
+        cif_input.change(fn=show_cif_file, inputs=[cif_input, cif_detail], outputs=cif_output)
+        cif_detail.change(fn=show_cif_file, inputs=[cif_input, cif_detail], outputs=cif_output)
 
 # Launch both the Gradio web interface and the MCP server
 if __name__ == "__main__":
+    score_index.rebuild(result_cache.entries())  # index the runs written before the score index existed
     demo.launch(mcp_server=True)
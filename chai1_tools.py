@@ -0,0 +1,1393 @@
+# Import libraries
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+from contextlib import contextmanager
+import atexit
+import hashlib
+import json
+import threading
+import time
+import gradio as gr
+from modal_app import app, Chai1Service, deployed_function, deployed_service, download_inference_dependencies, here, service_timings, shard_plan
+from typing import List, Tuple
+from itertools import product
+from concurrent.futures import Future, ThreadPoolExecutor
+import io
+import modal
+import jobs
+import pdb_cache
+import result_cache
+import routing
+import score_index
+import structure_format
+import tracing
+from structure_format import WIRE_FORMAT
+from weights_manifest import check_inference_dependencies
+
+# Tools of the MCP server, shared by the Gradio interface (app.py) and the headless server (mcp_server.py).
+# numpy and gemmi are imported by the tools that need them, so that the servers start without loading them.
+
+# Background pool persisting the results on disk while the tables are built
+RESULT_WRITERS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chai1-writer")
+
+# Modal app session kept open by long-running servers, see start_app_session
+_app_session = None
+_app_session_opening = None  # threading.Event set once the session requested by start_app_session is open or failed
+_app_session_lock = threading.Lock()
+
+# Helper functions
+def select_best_model(
+    run_id: str,
+    number_of_scores: int=5,
+    scores_to_print: List[str]=None,
+    results_dir: str="results/score",
+    prefix: str="-scores.model_idx_",
+    results: Optional[list]=None,
+):
+    """
+    Selects the best model based on the aggregate score among several simulation results.
+
+    Args:
+        run_id (str): Unique identifier for the inference run.
+        number_of_scores (int, optional): Number of models to evaluate (number of score files to read). Default is 5.
+        scores_to_print (List[str], optional): List of score names to display for each model (e.g., ["aggregate_score", "ptm", "iptm"]). Default is ["aggregate_score", "ptm", "iptm"].
+        results_dir (str, optional): Directory where the result files are located. Default is "results/score".
+        prefix (str, optional): Prefix used in the score file names. Default is "-scores.model_idx_".
+        results (list, optional): In-memory scores of the models (dicts from parse_scores or raw npz bytes).
+            If provided, the score files are not read. Default is None.
+
+    Returns:
+        Tuple[int, float]: 
+            - best_model (int): Index of the best model (the one with the highest aggregate score and without inter-chain clashes).
+            - max_aggregate_score (float): Value of the highest aggregate score.
+    """
+    from numpy import load
+
+    print(f"🧬 Start reading scores for each inference...")
+    if scores_to_print is None:
+        scores_to_print = ["aggregate_score", "ptm", "iptm"]
+    max_aggregate_score = 0
+    best_model = None
+    if results is not None:
+        number_of_scores = len(results)
+    for model_index in range(number_of_scores):
+        print(f"    🧬 Reading scores for model {model_index}...")
+        if results is None:
+            data = load(f"{results_dir}/{run_id}{prefix}{model_index}.npz")
+        elif isinstance(results[model_index], bytes):
+            data = parse_scores(results[model_index])
+        else:
+            data = results[model_index]
+        if data["has_inter_chain_clashes"][0] == False:
+            for item in scores_to_print:
+                print(f"{item}: {data[item][0]}")
+        else:
+            print(f"        🧬 Model {model_index} has inter-chain clashes, skipping scores.")
+            continue
+        if data["aggregate_score"][0] > max_aggregate_score:
+            max_aggregate_score = data["aggregate_score"][0]
+            best_model = int(model_index)
+    print(
+        f"🧬 Best model is {best_model} with an aggregate score of {max_aggregate_score}."
+    )
+    return best_model, max_aggregate_score
+
+# Definition of the tools for the MCP server 
+# Function to return a fasta file
+def create_fasta_file(file_content: str, name: Optional[str] = None, seq_name: Optional[str] = None) -> str:
+    """Create a FASTA file from a biomolecule sequence string with a unique name.
+    
+    Args:
+        file_content (str): The content of the FASTA file required with optional line breaks
+        name (str, optional): FASTA file name ending with .fasta ideally. If not provided, a unique ID will be generated
+        seq_name (str, optional): The name/identifier for the sequence. Defaults to "protein"
+        
+    
+    Returns:
+        str: Name of the created FASTA file
+    """
+    # If the file_content is empty, raise an error
+    if not file_content.strip():
+        print("Fasta file content cannot be empty so the example fasta file will be used")
+        file_content = ">protein|name=example-protein\nAGSHSMRYFSTSVSRPGRGEPRFIAVGYVDDTQFVRFD"
+    
+    # Remove any trailing/leading whitespace but preserve line breaks
+    lines = file_content.strip().split('\n')
+    
+    # Check if the first line is a FASTA header
+    if not lines[0].startswith('>'):
+        # If no header provided, add one
+        if seq_name is None:
+            seq_name = "protein"
+        file_content = f">{seq_name}\n{file_content}"
+    
+    # Create FASTA content (preserving line breaks)
+    fasta_content = file_content
+    
+    # Generate a unique file name
+    unique_id = hashlib.sha256(uuid4().bytes).hexdigest()[:8]
+    if name:
+        file_name = name
+    else:
+        file_name = f"chai1_{unique_id}.fasta"
+    file_path = here / "inputs/fasta" / file_name
+    
+    # Write the FASTA file
+    with open(file_path, "w") as f:
+        f.write(fasta_content)
+
+
+# Function to create a JSON file
+def create_json_config(
+    num_diffn_timesteps: int,
+    num_trunk_recycles: int,
+    seed: int,
+    options: list,
+    name: Optional[str] = None
+    ) -> str:
+    """Create a JSON configuration file from the Gradio interface inputs.
+    
+    Args:
+        num_diffn_timesteps (int): Number of diffusion timesteps from slider
+        num_trunk_recycles (int): Number of trunk recycles from slider
+        seed (int): Random seed from slider
+        options (list): List of selected options from checkbox group
+        name (str, optional): JSON config file name ending with .json ideally. If not provided, a unique ID will be generated
+    
+    Returns:
+        str: Name of the created JSON file
+    """
+    # Convert checkbox options to boolean flags
+    use_esm_embeddings = "ESM_embeddings" in options
+    use_msa_server = "MSA_server" in options
+    
+    # Create config dictionary
+    config = {
+        "num_trunk_recycles": num_trunk_recycles,
+        "num_diffn_timesteps": num_diffn_timesteps,
+        "seed": seed,
+        "use_esm_embeddings": use_esm_embeddings,
+        "use_msa_server": use_msa_server
+    }
+    
+    # Generate file name based on provided name or unique ID
+    unique_id = hashlib.sha256(uuid4().bytes).hexdigest()[:8]
+    if name:
+        file_name = name
+    else:
+        file_name = f"chai1_{unique_id}.json"
+    file_path = here / "inputs/config" / file_name
+    
+    # Write the JSON file 
+    with open(file_path, "w") as f:
+        json.dump(config, f, indent=4)
+
+
+# Functions to build the results table of a run
+RESULT_COLUMNS = ["Model Index", "Aggregate Score", "PTM", "IPTM", "CIF File"]
+
+
+def parse_scores(scores: bytes) -> dict:
+    """Parse the content of a scores.model_idx_N.npz file in memory, without writing it to disk."""
+    from numpy import load
+
+    with load(io.BytesIO(scores)) as data:
+        return {key: data[key] for key in data.files}
+
+
+def model_row(run_id: str, model_index: int, scores: dict, cif_file: Optional[str]=None) -> Optional[dict]:
+    """Build the row of the results table of one model from its scores.
+
+    The CIF file name defaults to the one written for the current CHAI1_STRUCTURE_FORMAT.
+
+    Returns:
+        dict or None: Row of the results table, None if the model has inter-chain clashes
+    """
+    if scores["has_inter_chain_clashes"][0]:
+        return None
+    return {
+        "Model Index": model_index,
+        "Aggregate Score": float(scores["aggregate_score"][0]),
+        "PTM": float(scores["ptm"][0]),
+        "IPTM": float(scores["iptm"][0]),
+        "CIF File": cif_file or structure_format.cif_file_name(run_id, model_index),
+    }
+
+
+def read_model_scores(run_id: str, model_index: int, output_dir: str="results") -> Optional[dict]:
+    """Read the scores of one model written on disk.
+
+    Args:
+        run_id (str): Unique identifier for the inference run.
+        model_index (int): Index of the model.
+        output_dir (str, optional): Directory where the result files are located. Default is "results".
+
+    Returns:
+        dict or None: Row of the results table, None if the model has inter-chain clashes
+    """
+    from numpy import load
+
+    score_file = Path(output_dir, "score") / f"{run_id}-scores.model_idx_{model_index}.npz"
+    cif_file = structure_format.find_cif_file(Path(output_dir, "molecules"), run_id, model_index)
+
+    # Load score data
+    return model_row(run_id, model_index, load(str(score_file)), cif_file.name if cif_file else None)
+
+
+def results_dataframe(model_data: list):
+    """Build the results table from rows of model_row, skipping the models with inter-chain clashes."""
+    import pandas as pd
+
+    return pd.DataFrame(
+        [row for row in model_data if row is not None], columns=RESULT_COLUMNS
+    ).sort_values("Aggregate Score", ascending=False)
+
+
+def build_results_dataframe(run_id: str, number_of_models: int=5, output_dir: str="results"):
+    """Build the DataFrame of model scores from the result files of a run written on disk.
+
+    Args:
+        run_id (str): Unique identifier for the inference run.
+        number_of_models (int, optional): Number of models to read. Default is 5.
+        output_dir (str, optional): Directory where the result files are located. Default is "results".
+
+    Returns:
+        pd.DataFrame: DataFrame containing model scores and CIF file names, sorted by aggregate score
+    """
+    return results_dataframe([read_model_scores(run_id, ii, output_dir) for ii in range(number_of_models)])
+
+
+# Helpers to load the inputs of a simulation
+def load_fasta_content(fasta_file_name: Optional[str] = "") -> str:
+    """Read a FASTA file from inputs/fasta, defaulting to the Chai1 example input."""
+    if not fasta_file_name:
+        fasta_file_name = here / "inputs/fasta" / "chai1_default_input.fasta"
+    fasta_file_name = here / "inputs/fasta" / fasta_file_name
+    print(f"🧬 running Chai inference on {fasta_file_name}")
+    return Path(fasta_file_name).read_text()
+
+
+def load_inference_config(inference_config_file_name: Optional[str] = "") -> dict:
+    """Read a JSON inference config from inputs/config, defaulting to the quick inference config."""
+    if not inference_config_file_name:
+        inference_config_file_name = here / "inputs/config" / "chai1_quick_inference.json"
+    inference_config_file_name = here / "inputs/config" / inference_config_file_name
+    print(f"🧬 loading Chai inference config from {inference_config_file_name}")
+    return json.loads(Path(inference_config_file_name).read_text())
+
+
+def _write_model(run_id: str, model_index: int, scores_bytes: bytes, scores: dict, cif, seq_hash: Optional[str], inference_config: Optional[dict], output_dir: str):
+    score_file = Path(output_dir, "score") / f"{run_id}-scores.model_idx_{model_index}.npz"
+    # Stored as received, compressed structures are not decoded until they are viewed
+    cif_format = structure_format.STRUCTURE_FORMAT if cif is None else structure_format.payload_format(cif)
+    cif_file = Path(output_dir, "molecules") / structure_format.cif_file_name(run_id, model_index, cif_format)
+
+    payload_bytes = len(scores_bytes) + len(cif or b"")
+    with tracing.span(run_id, "persistence", model_index=model_index, payload_bytes=payload_bytes):
+        score_file.write_bytes(scores_bytes)
+        if isinstance(cif, str):
+            cif_file.write_text(cif)
+        elif cif is not None:  # None with CHAI1_LAZY_STRUCTURES, fetched from the volume when needed
+            cif_file.write_bytes(cif)
+
+        score_index.add_model(run_id, model_index, scores, seq_hash, inference_config, cif_file.name)
+
+
+def save_model(run_id: str, model_index: int, scores: bytes, cif, seq_hash: Optional[str], inference_config: Optional[dict], output_dir: str="results") -> Tuple[dict, Future]:
+    """Parse the scores of one model in memory and persist the model in the background.
+
+    The score and CIF files and the score index row are written by the writer pool, so that disk
+    I/O overlaps with building the tables and rendering. Wait on the returned future before
+    reading the files back.
+
+    Returns:
+        Tuple[dict, Future]: Parsed scores and future of the background write
+    """
+    parsed_scores = parse_scores(scores)
+    future = RESULT_WRITERS.submit(
+        _write_model, run_id, model_index, scores, parsed_scores, cif, seq_hash, inference_config, output_dir
+    )
+    return parsed_scores, future
+
+
+def save_results(run_id: str, results: list, seq_hash: Optional[str], inference_config: Optional[dict], output_dir: str="results") -> Tuple[List[dict], List[Future]]:
+    """Parse the (scores, cif) pairs returned by Chai1Service.inference and persist them in the background.
+
+    Returns:
+        Tuple[List[dict], List[Future]]: Parsed scores of each model and futures of the background writes
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🧬 saving results of {run_id=} to disk locally in {output_dir}")
+    RESULT_WRITERS.submit(tracing.collect_container_spans, run_id)
+
+    saved = [
+        save_model(run_id, ii, scores, cif, seq_hash, inference_config, output_dir)
+        for ii, (scores, cif) in enumerate(results)
+    ]
+    return [scores for scores, _ in saved], [future for _, future in saved]
+
+
+def wait_for_writes(futures: List[Future]):
+    """Wait for background writes to finish, raising the first error."""
+    for future in futures:
+        future.result()
+
+
+def start_app_session(background: bool=False):
+    """Open the Modal app session once for the life of the process, instead of once per tool call.
+
+    Called by the headless MCP server: the tool calls then skip the app startup of app.run().
+    Calling it again has no effect. Tool calls made while the session is being opened wait for it
+    in app_session, so that they never open an app.run() of their own.
+
+    Args:
+        background (bool, optional): Open the session in a daemon thread and return at once. Default is False.
+    """
+    global _app_session_opening
+    with _app_session_lock:
+        opening = _app_session_opening
+        if opening is None:
+            _app_session_opening = threading.Event()
+    if opening is not None:  # already requested
+        if not background:
+            opening.wait()
+        return
+    if background:
+        threading.Thread(target=_open_app_session, args=(_app_session_opening,), daemon=True).start()
+    else:
+        _open_app_session(_app_session_opening)
+
+
+def _open_app_session(opening: threading.Event):
+    global _app_session, _app_session_opening
+    try:
+        start = time.perf_counter()
+        session = app.run()
+        session.__enter__()
+        atexit.register(session.__exit__, None, None, None)
+        _app_session = session
+        print(f"🧬 Modal app session opened in {time.perf_counter() - start:.2f}s")
+    except Exception:
+        with _app_session_lock:
+            _app_session_opening = None  # the next request tries again, tool calls fall back to app.run()
+        raise
+    finally:
+        opening.set()
+
+
+@contextmanager
+def app_session():
+    """Run the Modal functions of a tool call in the long-lived app session if requested, in a new app.run() otherwise."""
+    with _app_session_lock:
+        opening = _app_session_opening
+    if opening is not None:
+        opening.wait()  # the long-lived session is being opened
+    if _app_session is not None:
+        yield
+    else:
+        with app.run():
+            yield
+
+
+def routed_service(fasta_content: str, jobs_per_call: int=1, deployed: bool=False, max_containers: Optional[int]=None):
+    """Chai1Service with the GPU class and timeout routed from the number of tokens of the input.
+
+    Args:
+        fasta_content (str): FASTA content of the job
+        jobs_per_call (int, optional): Number of jobs run by each call, scaling the timeout. Default is 1.
+        deployed (bool, optional): Look up the service of the deployed app instead of the local one. Default is False.
+        max_containers (int, optional): Maximum number of containers of the service. Default is no limit.
+
+    Returns:
+        Tuple: Service instance and routing decision
+    """
+    decision = routing.route(fasta_content)
+    options = routing.service_options(decision, jobs_per_call)
+    if max_containers is not None:
+        options["max_containers"] = max_containers
+    service = deployed_service(**options) if deployed else Chai1Service.with_options(**options)()
+    return service, decision
+
+
+def inference_seconds(run_id: str, wall: bool = False) -> Optional[float]:
+    """Inference time of a run in its containers, None if it was not recorded.
+
+    Sharded runs count the time of every shard, or of the slowest one with wall=True.
+    """
+    timing = service_timings.get(run_id)
+    if timing is None:
+        return None
+    return timing.get("wall_seconds", timing["inference_seconds"]) if wall else timing["inference_seconds"]
+
+
+def new_run_id() -> str:
+    """Generate a unique short run ID."""
+    return hashlib.sha256(uuid4().bytes).hexdigest()[:8]
+
+
+# Function to compute Chai1 inference
+def compute_Chai1(
+    fasta_file_name: Optional[str] = "",
+    inference_config_file_name: Optional[str] = "",
+    use_cache: bool = True,
+    diffusion_shards: int = 1,
+):
+    """Compute a Chai1 simulation.
+
+    Results are streamed: the table and the 3D structure of the best model so far are updated
+    each time a model is ready on Modal. Identical jobs (same FASTA content and same inference
+    configuration, seed included) are served from the local result cache without starting the Modal app.
+
+    Args:
+        fasta_file_name (str, optional): FASTA file name to use for the Chai1 simulation.
+            If not provided, uses the default input file.
+        inference_config_file_name (str, optional): JSON configuration file name for inference.
+            If not provided, uses the default quick inference configuration.
+        use_cache (bool, optional): Reuse the results of an identical previous run if available.
+            Set to False to force a new simulation. Default is True.
+        diffusion_shards (int, optional): Spread the 5 diffusion samples over up to 5 containers running
+            at the same time, each with a seed derived from the configured one. Cuts the latency of long
+            inputs at the cost of running the trunk once per shard. Default is 1 (no sharding).
+
+    Yields:
+        Tuple[pd.DataFrame, str]: DataFrame containing model scores and CIF file paths,
+            and the PDB file of the best model so far
+    """
+    fasta_content = load_fasta_content(fasta_file_name)
+    inference_config = load_inference_config(inference_config_file_name)
+    diffusion_shards = int(diffusion_shards)
+
+    # Sharded runs sample other trajectories, they are cached and indexed with their number of shards
+    run_config = {**inference_config, "diffusion_shards": diffusion_shards} if diffusion_shards > 1 else inference_config
+
+    # Look for an identical previous run
+    cache_key = result_cache.compute_cache_key(fasta_content, run_config)
+    if use_cache:
+        entry = result_cache.lookup(cache_key)
+        if entry is not None:
+            print(f"🧬 result cache hit, reusing results of run_id={entry['run_id']}")
+            results_df = build_results_dataframe(entry["run_id"], entry["number_of_models"])
+            yield results_df, plot_protein(results_df, "auto")  # a coarse level first for large complexes
+            yield results_df, plot_protein(results_df)
+            return
+        print("🧬 result cache miss")
+
+    # Define output directory
+    output_dir = Path("./results")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with app_session():
+        # Generate a unique run ID
+        run_id = new_run_id()
+        with tracing.span(run_id, "dependency_check") as span:
+            span["remote_check"] = check_inference_dependencies(download_inference_dependencies)
+
+        print(f"🧬 running inference with {run_id=}")
+
+        model_data = []
+        writes = {}
+        transfer = {"wait_seconds": 0.0, "payload_bytes": 0}
+        seq_hash = score_index.sequence_hash(fasta_content)
+        service, decision = routed_service(fasta_content)
+        if diffusion_shards > 1:
+            models = sharded_inference(service, fasta_content, inference_config, run_id, diffusion_shards)
+        else:
+            models = service.inference_stream.remote_gen(fasta_content, inference_config, run_id, WIRE_FORMAT)
+        start = time.perf_counter()
+        try:
+            for ii, scores, cif in tracing.timed_iter(models, transfer):
+                transfer["payload_bytes"] += len(scores) + len(cif or b"")
+                print(f"🧬 saving model {ii} to disk locally in {output_dir}")
+                parsed_scores, writes[ii] = save_model(run_id, ii, scores, cif, seq_hash, run_config, output_dir)
+
+                model_data.append(model_row(run_id, ii, parsed_scores))
+                results_df = results_dataframe(model_data)
+                if not results_df.empty:
+                    writes[int(results_df.iloc[0]["Model Index"])].result()  # the viewer reads the best CIF from disk
+                with tracing.span(run_id, "conversion", detail="auto"):
+                    pdb_file = plot_protein(results_df, "auto")  # coarse for large complexes until the last model
+                yield results_df, pdb_file
+        except Exception:
+            routing.log_route(run_id, decision, time.perf_counter() - start, status="failed")
+            raise
+        latency_seconds = time.perf_counter() - start
+        container_seconds = inference_seconds(run_id, wall=True)
+        routing.log_route(run_id, decision, latency_seconds, container_seconds)
+        if container_seconds is not None:  # the client waits for the stream, less the time the containers worked on it
+            tracing.record_span(run_id, "transfer", max(transfer["wait_seconds"] - container_seconds, 0.0), **transfer)
+        with tracing.span(run_id, "conversion", detail="full"):
+            pdb_file = plot_protein(results_df)
+        yield results_df, pdb_file
+
+    wait_for_writes(writes.values())
+    result_cache.store(cache_key, run_id, len(writes), run_config)
+    RESULT_WRITERS.submit(tracing.collect_container_spans, run_id, diffusion_shards)
+
+
+def sharded_inference(service, fasta_content: str, inference_config: dict, run_id: str, diffusion_shards: int):
+    """Run the diffusion samples of a run in parallel shards and yield (model_index, scores, cif) as shards finish.
+
+    The shards write their samples to /preds/<run_id> under their index in the run, so the models
+    come back in the usual model_idx_0..4 layout.
+    """
+    shards = [
+        (fasta_content, inference_config, run_id, shard_index, diffusion_shards, WIRE_FORMAT)
+        for shard_index in range(len(shard_plan(diffusion_shards)))
+    ]
+    print(f"🧬 spreading the diffusion samples of {run_id=} over {len(shards)} containers")
+    for models in service.inference_shard.starmap(shards, order_outputs=False):
+        yield from models
+    record_shard_timings(run_id, len(shards))
+
+
+def record_shard_timings(run_id: str, n_shards: int):
+    """Record the timings of the shards of a run under its run_id, as the sum of their container times."""
+    timings = [service_timings.get(f"{run_id}/shard_{shard_index}") for shard_index in range(n_shards)]
+    timings = [timing for timing in timings if timing is not None]
+    if not timings:
+        return
+    service_timings[run_id] = {
+        "cold_start": any(timing["cold_start"] for timing in timings),
+        "setup_seconds": sum(timing["setup_seconds"] for timing in timings),
+        "inference_seconds": sum(timing["inference_seconds"] for timing in timings),
+        "wall_seconds": max(timing["inference_seconds"] for timing in timings),
+        "container_age_seconds": max(timing["container_age_seconds"] for timing in timings),
+        "time": max(timing["time"] for timing in timings),
+        "shards": len(timings),
+    }
+
+
+# Functions to run Chai1 inferences asynchronously on the deployed Modal app
+def submit_chai1(
+    fasta_file_name: Optional[str] = "",
+    inference_config_file_name: Optional[str] = "",
+    use_cache: bool = True,
+) -> str:
+    """Submit a Chai1 simulation without waiting for it to finish. Use get_chai1_status and get_chai1_result with the returned run ID.
+
+    Requires the Modal app to be deployed with `modal deploy modal_app.py`.
+
+    Args:
+        fasta_file_name (str, optional): FASTA file name to use for the Chai1 simulation.
+            If not provided, uses the default input file.
+        inference_config_file_name (str, optional): JSON configuration file name for inference.
+            If not provided, uses the default quick inference configuration.
+        use_cache (bool, optional): Reuse the results of an identical previous run if available. Default is True.
+
+    Returns:
+        str: Run ID of the submitted job
+    """
+    fasta_content = load_fasta_content(fasta_file_name)
+    inference_config = load_inference_config(inference_config_file_name)
+
+    # Identical jobs are completed right away from the result cache
+    cache_key = result_cache.compute_cache_key(fasta_content, inference_config)
+    entry = result_cache.lookup(cache_key) if use_cache else None
+    if entry is not None:
+        print(f"🧬 result cache hit, job completed with run_id={entry['run_id']}")
+        if jobs.get_job(entry["run_id"]) is None:
+            jobs.add_job(entry["run_id"], None, fasta_file_name, inference_config, cache_key, score_index.sequence_hash(fasta_content), status=jobs.COMPLETED)
+            jobs.update_job(entry["run_id"], number_of_models=entry["number_of_models"])
+        return entry["run_id"]
+
+    check_inference_dependencies(deployed_function("download_inference_dependencies"))
+
+    run_id = new_run_id()
+    service, decision = routed_service(fasta_content, deployed=True)
+    function_call = service.inference.spawn(fasta_content, inference_config, run_id, WIRE_FORMAT)
+    jobs.add_job(run_id, function_call.object_id, fasta_file_name, inference_config, cache_key, score_index.sequence_hash(fasta_content))
+    jobs.update_job(run_id, route=decision)
+    print(f"🧬 submitted {run_id=} as function call {function_call.object_id}")
+    return run_id
+
+
+def _refresh_job(run_id: str) -> dict:
+    """Poll the Modal function call of a job and ingest its results once it is finished."""
+    job = jobs.get_job(run_id)
+    if job is None:
+        raise gr.Error(f"Unknown run ID {run_id}")
+    if job["status"] in jobs.FINISHED_STATUSES:
+        return job
+
+    function_call = modal.FunctionCall.from_id(job["function_call_id"])
+    try:
+        results = function_call.get(timeout=0)
+    except TimeoutError:
+        return jobs.update_job(run_id, status=jobs.RUNNING)
+    except Exception as e:
+        print(f"🧬 job {run_id} failed: {e}")
+        if job.get("route"):
+            routing.log_route(run_id, job["route"], time.time() - job["submitted"], status="failed")
+        return jobs.update_job(run_id, status=jobs.FAILED, error=str(e))
+
+    if job.get("route"):  # latency up to the poll that found the job finished
+        routing.log_route(run_id, job["route"], time.time() - job["submitted"], inference_seconds(run_id))
+    _, writes = save_results(run_id, results, job.get("sequence_hash"), job["inference_config"])
+    wait_for_writes(writes)
+    result_cache.store(job["cache_key"], run_id, len(results), job["inference_config"])
+    return jobs.update_job(run_id, status=jobs.COMPLETED, number_of_models=len(results))
+
+
+def get_chai1_status(run_id: str) -> dict:
+    """Get the status of a Chai1 simulation submitted with submit_chai1.
+
+    Args:
+        run_id (str): Run ID returned by submit_chai1
+
+    Returns:
+        dict: Job entry with its status ("submitted", "running", "completed", "failed" or "cancelled"),
+            submission time, inputs and error message if any
+    """
+    return _refresh_job(run_id)
+
+
+def get_chai1_result(run_id: str):
+    """Get the scores of a Chai1 simulation submitted with submit_chai1, once its status is "completed".
+
+    Args:
+        run_id (str): Run ID returned by submit_chai1
+
+    Returns:
+        pd.DataFrame: DataFrame containing model scores and CIF file paths
+    """
+    job = _refresh_job(run_id)
+    if job["status"] != jobs.COMPLETED:
+        raise gr.Error(f"Job {run_id} is {job['status']}, no result available")
+    return build_results_dataframe(run_id, job["number_of_models"])
+
+
+def cancel_chai1(run_id: str) -> dict:
+    """Cancel a Chai1 simulation submitted with submit_chai1.
+
+    Args:
+        run_id (str): Run ID returned by submit_chai1
+
+    Returns:
+        dict: Job entry with its updated status
+    """
+    job = _refresh_job(run_id)
+    if job["status"] in jobs.FINISHED_STATUSES:
+        return job
+    modal.FunctionCall.from_id(job["function_call_id"]).cancel()
+    print(f"🧬 cancelled job {run_id}")
+    return jobs.update_job(run_id, status=jobs.CANCELLED)
+
+
+# Function to split a FASTA file into its complexes
+COMPLEX_DELIMITER = "//"
+
+
+def split_fasta_complexes(fasta_content: str) -> List[Tuple[str, str]]:
+    """Split a FASTA string into complexes separated by a blank line or a "//" line.
+
+    The records of a complex stay together, so a protein is folded with its partner chains and ligands:
+
+        >protein|name=receptor
+        MKTAYIAKQR...
+        >ligand|name=inhibitor
+        CC(=O)Oc1ccccc1C(=O)O
+        //
+        >protein|name=other-receptor
+        ...
+
+    Args:
+        fasta_content (str): FASTA content with one or more complexes
+
+    Returns:
+        List[Tuple[str, str]]: (complex name, FASTA content of the complex) pairs, the complex name
+            joining the names of its records with "+"
+    """
+    blocks, block = [], []
+    for line in fasta_content.splitlines() + [""]:
+        line = line.strip()
+        if line and line != COMPLEX_DELIMITER:
+            block.append(line)
+        elif block:
+            blocks.append(block)
+            block = []
+
+    complexes = []
+    for block in blocks:
+        if not block[0].startswith(">"):
+            raise gr.Error(f"Complex {len(complexes) + 1} does not start with a FASTA header: {block[0][:40]!r}")
+        headers = [line[1:] for line in block if line.startswith(">")]
+        names = [header.split("name=")[-1] if "name=" in header else header.split("|")[-1] for header in headers]
+        complexes.append(("+".join(name.strip() for name in names), "\n".join(block)))
+    return complexes
+
+
+# Function to dispatch remote calls of several services at the same time
+def starmap_as_completed(calls: list, max_concurrency: int):
+    """Map Modal functions over their argument tuples at the same time and yield the outputs as they finish.
+
+    Each function is mapped by one unordered starmap consumed in its own thread, so a slow call never
+    holds up the outputs of the other calls or of the other functions. The max_concurrency containers
+    are shared between the functions by container_caps, and the functions left without containers are
+    queued until a running one finishes and frees its containers. Failed calls yield their exception
+    instead of stopping the other calls.
+
+    Args:
+        calls (list): (tag, function factory, argument tuples) triples, e.g. one per routing class. The factory
+            is called with the container cap of the tag and returns the Modal function or method to map.
+        max_concurrency (int): Maximum number of containers running at the same time, over all the tags
+
+    Yields:
+        Tuple: (tag, output) of each call, in the order they finish
+    """
+    import queue
+
+    outputs = queue.Queue()
+    done = object()
+    queued, running = list(calls), {}  # tag -> containers of the running tags
+
+    def consume(tag, function, args_list):
+        try:
+            for output in function.starmap(args_list, order_outputs=False, return_exceptions=True):
+                outputs.put((tag, output))
+        except Exception as e:
+            outputs.put((tag, e))
+        finally:
+            outputs.put((tag, done))
+
+    def start_queued():
+        free = max(1, int(max_concurrency)) - sum(running.values())
+        caps = container_caps({tag: len(args_list) for tag, _, args_list in queued}, free)
+        for call in list(queued):
+            tag, function_factory, args_list = call
+            if caps[tag]:
+                queued.remove(call)
+                running[tag] = caps[tag]
+                threading.Thread(target=consume, args=(tag, function_factory(caps[tag]), args_list), daemon=True).start()
+        if queued:
+            print(f"🧬 {len(queued)} services queued until containers are free")
+
+    start_queued()
+    while running:
+        tag, output = outputs.get()
+        if output is done:
+            running.pop(tag)
+            if queued:
+                start_queued()
+        else:
+            yield tag, output
+
+
+def container_caps(calls_per_tag: dict, max_concurrency: int) -> dict:
+    """Share max_concurrency containers between tags in proportion to their number of calls.
+
+    Every tag gets one container, then the rest is split by largest remainder, so the caps never add
+    up to more than max_concurrency and never exceed the number of calls of a tag. If there are more
+    tags than containers, the first tags get one each and the others get 0, to be queued by the caller.
+
+    Returns:
+        dict: Number of containers of each tag
+    """
+    max_concurrency = max(0, int(max_concurrency))
+    tags = list(calls_per_tag)
+    caps = {tag: 1 if ii < max_concurrency else 0 for ii, tag in enumerate(tags)}
+    served = [tag for tag in tags if caps[tag]]
+    spare = max_concurrency - len(served)
+    total_calls = sum(calls_per_tag[tag] for tag in served)
+    if spare <= 0 or not total_calls:
+        return caps
+
+    quotas = {tag: spare * calls_per_tag[tag] / total_calls for tag in served}
+    for tag in served:
+        caps[tag] += int(quotas[tag])
+    leftover = spare - sum(int(quota) for quota in quotas.values())
+    for tag in sorted(served, key=lambda tag: quotas[tag] - int(quotas[tag]), reverse=True)[:leftover]:
+        caps[tag] += 1
+    return {tag: min(cap, calls_per_tag[tag]) for tag, cap in caps.items()}
+
+
+# Functions shared by the batch tools
+def load_batch_inputs(fasta_file_names: List[str], split_complexes: bool=False) -> List[Tuple[str, str]]:
+    """Build the list of (input name, FASTA content) jobs of a batch, one per file or one per complex, see split_fasta_complexes."""
+    if isinstance(fasta_file_names, str):
+        fasta_file_names = [fasta_file_names]
+    batch_jobs = []
+    for fasta_file_name in fasta_file_names:
+        fasta_content = load_fasta_content(fasta_file_name)
+        if split_complexes:
+            for complex_name, complex_content in split_fasta_complexes(fasta_content):
+                batch_jobs.append((f"{Path(fasta_file_name).name}#{complex_name}", complex_content))
+        else:
+            batch_jobs.append((Path(fasta_file_name).name, fasta_content))
+    return batch_jobs
+
+
+def run_batch(batch_jobs: List[Tuple[str, str]], inference_config: dict, max_concurrency: int=10, use_cache: bool=True):
+    """Run the same config on a list of (input name, FASTA content) jobs, serving identical jobs from the result cache.
+
+    The routing classes run at the same time, sharing max_concurrency containers, and each job is
+    yielded as soon as its call finishes.
+
+    Yields:
+        Tuple[str, str, pd.DataFrame, bool]: Input name, run ID, results table of each finished job and
+            whether it was served from the result cache, cache hits first. Failed jobs are logged and skipped.
+    """
+    pending = []
+    for input_name, fasta_content in batch_jobs:
+        cache_key = result_cache.compute_cache_key(fasta_content, inference_config)
+        entry = result_cache.lookup(cache_key) if use_cache else None
+        if entry is not None:
+            print(f"🧬 result cache hit for {input_name}, reusing run_id={entry['run_id']}")
+            yield input_name, entry["run_id"], build_results_dataframe(entry["run_id"], entry["number_of_models"]), True
+        else:
+            pending.append((input_name, fasta_content, cache_key, new_run_id()))
+    if not pending:
+        return
+
+    # Route the jobs by size, small jobs share a container call
+    routes = {}
+    for job in pending:
+        decision = routing.route(job[1])
+        routes.setdefault(decision["name"], (decision, []))[1].append(job)
+    chunks = {}
+    for name, (decision, class_jobs) in routes.items():
+        batch_size = max(1, int(decision["batch_size"]))
+        chunks[name] = [class_jobs[start:start + batch_size] for start in range(0, len(class_jobs), batch_size)]
+
+    with app_session():
+        check_inference_dependencies(download_inference_dependencies)
+
+        def batch_function(name):
+            decision, class_jobs = routes[name]
+            options = routing.service_options(decision, max(1, int(decision["batch_size"])))
+
+            def make_function(max_containers):
+                print(f"🧬 {len(class_jobs)} {name} jobs on {decision['gpu']} in {len(chunks[name])} calls, up to {max_containers} containers")
+                return Chai1Service.with_options(**options, max_containers=max_containers)().inference_batch
+
+            return make_function
+
+        calls = [
+            (
+                name,
+                batch_function(name),
+                [([(fasta_content, inference_config, run_id) for _, fasta_content, _, run_id in chunk], WIRE_FORMAT) for chunk in chunks[name]],
+            )
+            for name in routes
+        ]
+
+        # Outputs are keyed by run ID, so they are handled in the order the calls finish
+        in_flight = {job[3]: (job, routes[name][0]) for name, (_, class_jobs) in routes.items() for job in class_jobs}
+        start = time.perf_counter()
+        for name, output in starmap_as_completed(calls, max_concurrency):
+            latency = time.perf_counter() - start  # since the jobs were dispatched
+            if isinstance(output, Exception):
+                print(f"🧬 a call of {name} jobs failed: {output}")
+                continue
+            for run_id, results in output.items():
+                (input_name, fasta_content, cache_key, _), decision = in_flight.pop(run_id)
+                if isinstance(results, Exception):
+                    routing.log_route(run_id, decision, latency, status="failed")
+                    print(f"🧬 job {input_name} ({run_id=}) failed: {results}")
+                    continue
+                routing.log_route(run_id, decision, latency, inference_seconds(run_id))
+                scores, writes = save_results(run_id, results, score_index.sequence_hash(fasta_content), inference_config)
+                table = results_dataframe([model_row(run_id, ii, s) for ii, s in enumerate(scores)])
+                yield input_name, run_id, table.copy(), False
+                wait_for_writes(writes)
+                prefetch_best_pdb(table)
+                result_cache.store(cache_key, run_id, len(results), inference_config)
+
+        # Jobs of the failed calls
+        for run_id, ((input_name, _, _, _), decision) in in_flight.items():
+            routing.log_route(run_id, decision, time.perf_counter() - start, status="failed")
+            print(f"🧬 job {input_name} ({run_id=}) failed")
+
+
+# Function to compute several Chai1 inferences in parallel
+def compute_Chai1_batch(
+    fasta_file_names: List[str],
+    inference_config_file_name: Optional[str] = "",
+    split_complexes: bool = False,
+    max_concurrency: int = 10,
+    use_cache: bool = True,
+):
+    """Compute Chai1 simulations for a library of FASTA inputs in parallel on Modal.
+
+    All the jobs share one Modal app session and are dispatched with Chai1Service.inference_batch.starmap,
+    on at most max_concurrency containers at a time. The combined score table is yielded again each time a job finishes.
+
+    Args:
+        fasta_file_names (List[str]): FASTA file names to fold, each file being one complex.
+        inference_config_file_name (str, optional): JSON configuration file name shared by all the jobs.
+            If not provided, uses the default quick inference configuration.
+        split_complexes (bool, optional): Fold each complex of the FASTA files as its own job instead of
+            one complex per file. Complexes are separated by a blank line or a line with only "//",
+            and all the records of a complex (partner chains, ligands) are folded together. Default is False.
+        max_concurrency (int, optional): Maximum number of containers running at the same time. Default is 10.
+        use_cache (bool, optional): Reuse the results of identical previous runs if available. Default is True.
+
+    Yields:
+        pd.DataFrame: Combined DataFrame of the model scores of all finished jobs, sorted by aggregate score
+    """
+    import pandas as pd
+
+    inference_config = load_inference_config(inference_config_file_name)
+    batch_jobs = load_batch_inputs(fasta_file_names, split_complexes)
+    print(f"🧬 batch of {len(batch_jobs)} Chai1 jobs")
+
+    tables = []
+    for input_name, run_id, table, _ in run_batch(batch_jobs, inference_config, max_concurrency, use_cache):
+        table.insert(0, "Run ID", run_id)
+        table.insert(0, "Input", input_name)
+        tables.append(table)
+        yield pd.concat(tables).sort_values("Aggregate Score", ascending=False)
+
+
+# Function to screen a library with a quick pass and escalate the promising inputs
+CASCADE_METRICS = {"aggregate_score": "Aggregate Score", "ptm": "PTM", "iptm": "IPTM"}
+
+
+def compute_Chai1_cascade(
+    fasta_file_names: List[str],
+    quick_config_file_name: Optional[str] = "chai1_quick_inference.json",
+    full_config_file_name: Optional[str] = "chai1_default_inference.json",
+    metric: str = "iptm",
+    threshold: float = 0.5,
+    top_k: int = 0,
+    split_complexes: bool = False,
+    max_concurrency: int = 10,
+    use_cache: bool = True,
+):
+    """Screen a library of FASTA inputs with the quick config and run only the promising ones with the full config.
+
+    Every input runs with the quick config first. An input is escalated to the full config if the best
+    score of its quick models clears the threshold, or if it ranks in the top_k inputs.
+
+    Args:
+        fasta_file_names (List[str]): FASTA file names to screen, each file being one complex.
+        quick_config_file_name (str, optional): JSON configuration of the quick pass. Default is "chai1_quick_inference.json".
+        full_config_file_name (str, optional): JSON configuration of the full pass. Default is "chai1_default_inference.json".
+        metric (str, optional): Score deciding the escalation: "aggregate_score", "ptm" or "iptm". Default is "iptm".
+        threshold (float, optional): Minimum best quick score to escalate an input. Default is 0.5.
+        top_k (int, optional): Also escalate the top_k inputs by best quick score, 0 to only use the threshold. Default is 0.
+        split_complexes (bool, optional): Screen each complex of the FASTA files as its own job instead of one
+            complex per file. Complexes are separated by a blank line or a line with only "//". Default is False.
+        max_concurrency (int, optional): Maximum number of containers running at the same time. Default is 10.
+        use_cache (bool, optional): Reuse the results of identical previous runs if available. Default is True.
+
+    Yields:
+        Tuple[pd.DataFrame, dict]: Model scores of both passes with their stage, full pass first, sorted by aggregate score,
+            and the GPU time report: GPU seconds of each pass and GPU seconds saved compared with running
+            every input with the full config
+    """
+    import pandas as pd
+
+    if metric not in CASCADE_METRICS:
+        raise gr.Error(f"Unknown metric {metric!r}, expected one of {list(CASCADE_METRICS)}")
+    column = CASCADE_METRICS[metric]
+    quick_config = load_inference_config(quick_config_file_name)
+    full_config = load_inference_config(full_config_file_name)
+    batch_jobs = load_batch_inputs(fasta_file_names, split_complexes)
+    print(f"🧬 cascade of {len(batch_jobs)} Chai1 jobs")
+
+    tables = []
+    gpu_seconds = {"quick": [], "full": []}
+
+    def add_table(stage, input_name, run_id, table, cached):
+        table.insert(0, "Run ID", run_id)
+        table.insert(0, "Input", input_name)
+        table.insert(0, "Stage", stage)
+        tables.append(table)
+        if cached:
+            return  # cache hits cost no GPU time, even if the timing of their original run is still recorded
+        timing = service_timings.get(run_id)
+        if timing is not None:
+            gpu_seconds[stage].append(timing["inference_seconds"])
+
+    def cascade_table():
+        return pd.concat(tables).sort_values(["Stage", "Aggregate Score"], ascending=[True, False])  # full before quick
+
+    # Quick pass on every input
+    best_scores = {}
+    for input_name, run_id, table, cached in run_batch(batch_jobs, quick_config, max_concurrency, use_cache):
+        best_scores[input_name] = float(table[column].max()) if not table.empty else float("-inf")
+        add_table("quick", input_name, run_id, table, cached)
+        yield cascade_table(), {}
+
+    # Escalate the inputs clearing the threshold or ranking in the top_k
+    ranking = sorted(best_scores, key=best_scores.get, reverse=True)
+    escalated = {name for name in ranking if best_scores[name] >= threshold} | set(ranking[:max(0, int(top_k))])
+    print(f"🧬 escalating {len(escalated)} of {len(batch_jobs)} inputs to the full config")
+    for input_name, run_id, table, cached in run_batch(
+        [job for job in batch_jobs if job[0] in escalated], full_config, max_concurrency, use_cache
+    ):
+        add_table("full", input_name, run_id, table, cached)
+        yield cascade_table(), {}
+
+    # GPU time of the cascade against every input at full fidelity
+    quick_seconds, full_seconds = sum(gpu_seconds["quick"]), sum(gpu_seconds["full"])
+    if gpu_seconds["full"]:
+        full_per_input = full_seconds / len(gpu_seconds["full"])
+        full_time_source = "measured on the escalated inputs"
+    else:
+        # No full run measured, scale the quick pass by the number of diffusion steps
+        steps_ratio = full_config.get("num_diffn_timesteps", 200) / quick_config.get("num_diffn_timesteps", 200)
+        full_per_input = quick_seconds / max(len(gpu_seconds["quick"]), 1) * steps_ratio
+        full_time_source = "estimated from the quick pass and the number of diffusion steps"
+    all_full_seconds = full_per_input * len(batch_jobs)
+    report = {
+        "inputs": len(batch_jobs),
+        "escalated": len(escalated),
+        "quick_gpu_seconds": round(quick_seconds, 1),
+        "full_gpu_seconds": round(full_seconds, 1),
+        "cascade_gpu_seconds": round(quick_seconds + full_seconds, 1),
+        "all_full_gpu_seconds": round(all_full_seconds, 1),
+        "gpu_seconds_saved": round(all_full_seconds - quick_seconds - full_seconds, 1),
+        "full_gpu_seconds_per_input": round(full_per_input, 1),
+        "full_time_source": full_time_source,
+    }
+    print(f"🧬 cascade saved {report['gpu_seconds_saved']} GPU seconds ({full_time_source})")
+    yield (cascade_table() if tables else pd.DataFrame()), report
+
+
+# Function to parse the values of a sweep parameter
+def parse_sweep_values(values: str) -> List[int]:
+    """Parse sweep values given as a list ("1,2,5"), a range ("1-5") or a stepped range ("10:200:50").
+
+    Args:
+        values (str): Values of the parameter, items can be combined with commas (e.g. "1-3,10")
+
+    Returns:
+        List[int]: Sorted unique values
+    """
+    parsed = set()
+    for item in str(values).replace(" ", "").split(","):
+        if not item:
+            continue
+        if ":" in item:
+            start, stop, step = (item.split(":") + ["1"])[:3]
+            parsed.update(range(int(start), int(stop) + 1, int(step)))
+        elif "-" in item[1:]:
+            start, stop = item.split("-", 1)
+            parsed.update(range(int(start), int(stop) + 1))
+        else:
+            parsed.add(int(item))
+    if not parsed:
+        raise ValueError(f"No sweep values found in {values!r}")
+    return sorted(parsed)
+
+
+# Function to run a parameter sweep of Chai1 inferences
+def compute_Chai1_sweep(
+    fasta_file_name: Optional[str] = "",
+    seeds: str = "42",
+    num_diffn_timesteps: str = "200",
+    num_trunk_recycles: str = "3",
+    options: Optional[list] = None,
+    max_concurrency: int = 10,
+    share_setup: bool = True,
+    use_cache: bool = True,
+):
+    """Compute a grid of Chai1 simulations over seed, diffusion timesteps and trunk recycles.
+
+    All the points run in parallel in one Modal app session. Values can be given as a list ("1,2,5"),
+    a range ("1-5") or a stepped range ("10:200:50").
+
+    Args:
+        fasta_file_name (str, optional): FASTA file name to use for all the points.
+            If not provided, uses the default input file.
+        seeds (str, optional): Seeds to sweep. Default is "42".
+        num_diffn_timesteps (str, optional): Numbers of diffusion timesteps to sweep. Default is "200".
+        num_trunk_recycles (str, optional): Numbers of trunk recycles to sweep. Default is "3".
+        options (list, optional): Options shared by all the points among "ESM_embeddings" and "MSA_server".
+            Default is ["ESM_embeddings"].
+        max_concurrency (int, optional): Maximum number of containers running at the same time. Default is 10.
+        share_setup (bool, optional): Run the points that only differ by seed in the same container so that
+            they share the model loading and the MSAs. Set to False to run every point in its own container.
+            Default is True.
+        use_cache (bool, optional): Reuse the results of identical previous runs if available. Default is True.
+
+    Yields:
+        pd.DataFrame: DataFrame of the model scores of all finished points with their config, sorted by aggregate score
+    """
+    import pandas as pd
+
+    if options is None:
+        options = ["ESM_embeddings"]
+    fasta_content = load_fasta_content(fasta_file_name)
+    base_config = {
+        "use_esm_embeddings": "ESM_embeddings" in options,
+        "use_msa_server": "MSA_server" in options,
+    }
+
+    tables = []
+
+    def ranked_table():
+        return pd.concat(tables).sort_values("Aggregate Score", ascending=False)
+
+    def add_table(config, run_id, table):
+        table.insert(0, "Run ID", run_id)
+        for position, key in enumerate(["seed", "num_diffn_timesteps", "num_trunk_recycles"]):
+            table.insert(position, key, config[key])
+        tables.append(table)
+
+    # Group the points that only differ by seed, serving identical points from the result cache
+    groups = {}
+    for timesteps, recycles, seed in product(
+        parse_sweep_values(num_diffn_timesteps), parse_sweep_values(num_trunk_recycles), parse_sweep_values(seeds)
+    ):
+        config = {**base_config, "num_diffn_timesteps": timesteps, "num_trunk_recycles": recycles, "seed": seed}
+        cache_key = result_cache.compute_cache_key(fasta_content, config)
+        entry = result_cache.lookup(cache_key) if use_cache else None
+        if entry is not None:
+            print(f"🧬 result cache hit for {config}, reusing run_id={entry['run_id']}")
+            add_table(config, entry["run_id"], build_results_dataframe(entry["run_id"], entry["number_of_models"]))
+        else:
+            groups.setdefault((timesteps, recycles), []).append((config, cache_key, new_run_id()))
+    print(f"🧬 sweep of {len(tables) + sum(map(len, groups.values()))} points, {len(tables)} from cache")
+    if tables:
+        yield ranked_table()
+    if not groups:
+        return
+
+    seq_hash = score_index.sequence_hash(fasta_content)
+
+    def store_point(config, cache_key, run_id, results):
+        scores, writes = save_results(run_id, results, seq_hash, config)
+        table = results_dataframe([model_row(run_id, ii, s) for ii, s in enumerate(scores)])
+        add_table(config, run_id, table)
+        wait_for_writes(writes)
+        prefetch_best_pdb(table)
+        result_cache.store(cache_key, run_id, len(results), config)
+
+    with app_session():
+        check_inference_dependencies(download_inference_dependencies)
+
+        # Every point has the same input, so the same GPU class. Without share_setup, every point is a call of its own.
+        calls = list(groups.values()) if share_setup else [[point] for group in groups.values() for point in group]
+        largest_call = max(map(len, calls))
+        decision = routing.route(fasta_content)
+        method = "inference_seeds" if share_setup else "inference_batch"
+
+        def make_function(max_containers):
+            service, _ = routed_service(fasta_content, largest_call, max_containers=max_containers)
+            return getattr(service, method)
+
+        points = {run_id: (config, cache_key) for call in calls for config, cache_key, run_id in call}
+        if share_setup:
+            args_list = [
+                (
+                    fasta_content,
+                    {**base_config, "num_diffn_timesteps": timesteps, "num_trunk_recycles": recycles},
+                    [(config["seed"], run_id) for config, _, run_id in call],
+                    WIRE_FORMAT,
+                )
+                for (timesteps, recycles), call in groups.items()
+            ]
+        else:
+            args_list = [
+                ([(fasta_content, config, run_id)], WIRE_FORMAT) for [(config, _, run_id)] in calls
+            ]
+
+        # Outputs are keyed by run ID, so they are handled in the order the calls finish
+        start = time.perf_counter()
+        for _, output in starmap_as_completed([(decision["name"], make_function, args_list)], max_concurrency):
+            if isinstance(output, Exception):
+                print(f"🧬 a sweep call failed: {output}")
+                continue
+            for run_id, results in output.items():
+                config, cache_key = points.pop(run_id)
+                if isinstance(results, Exception):
+                    routing.log_route(run_id, decision, time.perf_counter() - start, status="failed")
+                    print(f"🧬 sweep point {config} ({run_id=}) failed: {results}")
+                    continue
+                routing.log_route(run_id, decision, time.perf_counter() - start, inference_seconds(run_id))
+                store_point(config, cache_key, run_id, results)
+            yield ranked_table()
+
+        # Points of the failed calls
+        for run_id, (config, _) in points.items():
+            routing.log_route(run_id, decision, time.perf_counter() - start, status="failed")
+            print(f"🧬 sweep point {config} ({run_id=}) failed")
+
+
+# Functions to query the score index across all runs
+INDEX_COLUMNS = ["run_id", "model_index", "aggregate_score", "ptm", "iptm", "has_inter_chain_clashes", "config", "cif_file"]
+
+
+REPRESENTATIVE_COLUMNS = INDEX_COLUMNS[:2] + ["cluster_size", "max_rmsd", "min_tm"] + INDEX_COLUMNS[2:]
+
+
+def _index_dataframe(rows: list, columns: list=INDEX_COLUMNS):
+    """Build a DataFrame from score index rows, with the config as a JSON string."""
+    import pandas as pd
+
+    for row in rows:
+        row["config"] = json.dumps(row["config"]) if row["config"] is not None else ""
+    return pd.DataFrame(rows, columns=columns)
+
+
+def rank_models(
+    fasta_file_name: Optional[str] = "",
+    metric: str = "aggregate_score",
+    top_k: int = 10,
+    include_clashes: bool = False,
+):
+    """Rank the models of all previous runs by a score, e.g. the best iptm of a sequence across all seeds.
+
+    Args:
+        fasta_file_name (str, optional): Only rank the models of this FASTA input. If not provided, ranks all models.
+        metric (str, optional): Score to rank by: "aggregate_score", "ptm" or "iptm". Default is "aggregate_score".
+        top_k (int, optional): Number of models to return. Default is 10.
+        include_clashes (bool, optional): Keep the models with inter-chain clashes. Default is False.
+
+    Returns:
+        pd.DataFrame: Best models with their run ID, scores, config and CIF file name
+    """
+    seq_hash = score_index.sequence_hash(load_fasta_content(fasta_file_name)) if fasta_file_name else None
+    return _index_dataframe(score_index.query(seq_hash, metric, top_k, include_clashes))
+
+
+def filter_models(
+    fasta_file_name: Optional[str] = "",
+    min_aggregate_score: float = 0.0,
+    min_ptm: float = 0.0,
+    min_iptm: float = 0.0,
+    config_filter: Optional[str] = "",
+    include_clashes: bool = False,
+):
+    """Filter the models of all previous runs by minimum scores and config values.
+
+    Args:
+        fasta_file_name (str, optional): Only keep the models of this FASTA input. If not provided, uses all models.
+        min_aggregate_score (float, optional): Minimum aggregate score. Default is 0.
+        min_ptm (float, optional): Minimum pTM. Default is 0.
+        min_iptm (float, optional): Minimum ipTM. Default is 0.
+        config_filter (str, optional): JSON object of required config values, e.g. '{"seed": 42, "num_trunk_recycles": 3}'
+        include_clashes (bool, optional): Keep the models with inter-chain clashes. Default is False.
+
+    Returns:
+        pd.DataFrame: Matching models sorted by aggregate score
+    """
+    seq_hash = score_index.sequence_hash(load_fasta_content(fasta_file_name)) if fasta_file_name else None
+    rows = score_index.query(
+        seq_hash,
+        include_clashes=include_clashes,
+        min_scores={"aggregate_score": min_aggregate_score, "ptm": min_ptm, "iptm": min_iptm},
+        config_filter=json.loads(config_filter) if config_filter else None,
+    )
+    return _index_dataframe(rows)
+
+
+def representative_models(
+    fasta_file_name: Optional[str] = "",
+    rmsd_threshold: float = 2.0,
+    metric: str = "aggregate_score",
+    include_clashes: bool = False,
+):
+    """Cluster the models of all previous runs by structure and keep only the best model of each cluster.
+
+    Seeds and sweep points often give nearly identical structures: models of the same input within
+    rmsd_threshold of a better model are dropped. Models are superposed on their CA/P atoms.
+
+    Args:
+        fasta_file_name (str, optional): Only cluster the models of this FASTA input. If not provided, clusters all models.
+        rmsd_threshold (float, optional): Maximum RMSD in Angstrom between a model and the representative of its cluster. Default is 2.
+        metric (str, optional): Score choosing the representative of a cluster: "aggregate_score", "ptm" or "iptm". Default is "aggregate_score".
+        include_clashes (bool, optional): Keep the models with inter-chain clashes. Default is False.
+
+    Returns:
+        pd.DataFrame: One model per cluster with the cluster size, the largest RMSD and the smallest TM-like score
+            to the other members, sorted by metric
+    """
+    import structure_clustering
+
+    seq_hash = score_index.sequence_hash(load_fasta_content(fasta_file_name)) if fasta_file_name else None
+    rows = score_index.query(seq_hash, metric, include_clashes=include_clashes)
+    return _index_dataframe(structure_clustering.representatives(rows, rmsd_threshold, metric), REPRESENTATIVE_COLUMNS)
+
+
+# Function to report the time spent in each stage of the runs
+def job_metrics(run_id: Optional[str] = "") -> dict:
+    """Get the time spent in each stage of a run, or of all the runs, to spot slow stages and size capacity.
+
+    Stages: dependency check, model load, MSA, fold (embedding, trunk, diffusion and confidence), serialization,
+    transfer, local persistence and CIF to PDB conversion. Spans are stored in results/traces/spans.jsonl.
+
+    Args:
+        run_id (str, optional): Run to report. If not provided, summarizes all the runs.
+
+    Returns:
+        dict: For a run, the seconds of each stage, the GPU memory peak, the payload sizes and the spans.
+            For all runs, the number of spans and the p50/p95 and total seconds of each stage, and the p95 GPU memory peak.
+    """
+    if run_id and not any(span["source"] == "container" for span in tracing.read_spans(run_id)):
+        tracing.collect_container_spans(run_id)  # e.g. a submitted job whose result was not fetched yet
+    return tracing.job_metrics(run_id or None)
+
+
+# Function to get the structure of one model
+def fetch_model_cif(run_id: str, model_index: int=0) -> str:
+    """Get the CIF file of one model of a previous run, fetched from the chai1-preds volume if it is not available locally.
+
+    Args:
+        run_id (str): Run ID of the model, as in the results tables
+        model_index (int, optional): Index of the model in the run, from 0 to 4. Default is 0.
+
+    Returns:
+        str: Path to the local CIF file (.cif, or .cif.zst / .cif.gz if CHAI1_STRUCTURE_FORMAT compresses them)
+    """
+    return str(structure_format.fetch_cif_file(run_id, int(model_index)))
+
+
+# Function to plot the 3D protein structure
+def plot_protein(result_df, detail: str="full") -> str:
+    """Plot the 3D structure of a biomolecule using the DataFrame from compute_Chai1.
+
+    Args:
+        result_df (pd.DataFrame): DataFrame containing model information and scores
+        detail (str, optional): Level of detail: "full" for all atoms, "backbone", "trace" for the CA/P trace,
+            or "auto" for the coarsest level suited to the size of the structure. Default is "full".
+
+    Returns:
+        str: Path to the generated PDB file of the best model.
+    """
+    if result_df.empty:
+        return ""  # Return empty string instead of None for type safety
+    
+    # Get the CIF file path of the model with highest aggregate score (already sorted), fetched if needed
+    best_cif = structure_format.fetch_cif_file(*structure_format.parse_cif_file_name(result_df.iloc[0]["CIF File"]))
+    
+    # Convert CIF to PDB, reusing the conversion cached for the same content
+    return pdb_cache.to_pdb(best_cif, detail)
+
+
+def prefetch_best_pdb(result_df):
+    """Convert the best model of a results table in the background, so that viewing it later is a cache hit."""
+    if result_df.empty:
+        return
+    cif_file = Path("results/molecules") / result_df.iloc[0]["CIF File"]
+    if cif_file.exists():  # not with CHAI1_LAZY_STRUCTURES, the structure is fetched when viewed
+        pdb_cache.to_pdb_many([cif_file], wait=False)
+
+
+# Function to plot a CIF file
+def show_cif_file(cif_file, detail: str="auto"):
+    """Plot a 3D structure from a CIF file with the Molecule3D library.
+
+    Large structures are first shown as a CA/P trace or a backbone, then with all their atoms.
+
+    Args:
+        cif_file: A biomolecule structure file in CIF format, possibly zstd (.cif.zst) or gzip (.cif.gz)
+            compressed. This can be a file uploaded by the user. If None, the function will return None.
+        detail (str, optional): Level of detail: "auto" for a coarse level first on large structures then all atoms,
+            or only one of "trace", "backbone" and "full". Default is "auto".
+
+    Returns:
+        str or None: PDB file name if successful, None if no file was provided
+            or if conversion failed.
+    """
+    if not cif_file:
+        yield None
+        return
+    
+    cif_path = Path(cif_file.name)
+    yield from pdb_cache.iter_pdb_levels(cif_path, detail)  # converted once per file content and level
@@ -0,0 +1,122 @@
+# Import libraries
+from pathlib import Path
+from typing import Optional
+import json
+import threading
+import time
+
+# Define parameters for the job table
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+JOBS_FILE = results_dir / "jobs" / "jobs.json"
+
+# Job statuses
+SUBMITTED = "submitted"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+_lock = threading.Lock()  # Gradio runs handlers in worker threads
+
+
+def _read_jobs() -> dict:
+    if not JOBS_FILE.exists():
+        return {}
+    try:
+        return json.loads(JOBS_FILE.read_text())
+    except json.JSONDecodeError:
+        print("🧬 job table is corrupted, starting from an empty table")
+        return {}
+
+
+def _write_jobs(jobs: dict):
+    JOBS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = JOBS_FILE.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(jobs, indent=4))
+    tmp_file.replace(JOBS_FILE)  # atomic, readers never see a partial table
+
+
+def add_job(
+    run_id: str,
+    function_call_id: Optional[str],
+    fasta_file_name: str,
+    inference_config: dict,
+    cache_key: str,
+    sequence_hash: Optional[str] = None,
+    status: str = SUBMITTED,
+) -> dict:
+    """Register a job in the table.
+
+    Args:
+        run_id (str): Unique identifier for the inference run, key of the table
+        function_call_id (str, optional): ID of the spawned Modal function call, None if served from the cache
+        fasta_file_name (str): FASTA file name of the job
+        inference_config (dict): Inference parameters of the job
+        cache_key (str): Result cache key of the job
+        sequence_hash (str, optional): Hash of the input for the score index
+        status (str, optional): Initial status. Default is "submitted".
+
+    Returns:
+        dict: The job entry
+    """
+    now = time.time()
+    job = {
+        "run_id": run_id,
+        "function_call_id": function_call_id,
+        "fasta_file_name": str(fasta_file_name),
+        "inference_config": inference_config,
+        "cache_key": cache_key,
+        "sequence_hash": sequence_hash,
+        "status": status,
+        "submitted": now,
+        "updated": now,
+        "number_of_models": None,
+        "error": None,
+    }
+    with _lock:
+        jobs = _read_jobs()
+        jobs[run_id] = job
+        _write_jobs(jobs)
+    return job
+
+
+def get_job(run_id: str) -> Optional[dict]:
+    """Return the job entry of a run_id, None if unknown."""
+    with _lock:
+        return _read_jobs().get(run_id)
+
+
+def update_job(run_id: str, **fields) -> dict:
+    """Update fields of a job entry and return it."""
+    with _lock:
+        jobs = _read_jobs()
+        if run_id not in jobs:
+            raise KeyError(f"Unknown job {run_id}")
+        jobs[run_id].update(fields, updated=time.time())
+        _write_jobs(jobs)
+        return jobs[run_id]
+
+
+def remove_jobs(run_ids: list) -> int:
+    """Remove the entries of runs whose result files were deleted, e.g. evicted from the result cache.
+
+    Returns:
+        int: Number of jobs removed
+    """
+    with _lock:
+        jobs = _read_jobs()
+        removed = [run_id for run_id in run_ids if jobs.pop(run_id, None) is not None]
+        if removed:
+            _write_jobs(jobs)
+    return len(removed)
+
+
+def list_jobs(include_finished: bool = True) -> list:
+    """Return the job entries, most recent first."""
+    with _lock:
+        jobs = list(_read_jobs().values())
+    if not include_finished:
+        jobs = [job for job in jobs if job["status"] not in FINISHED_STATUSES]
+    return sorted(jobs, key=lambda job: job["submitted"], reverse=True)
@@ -0,0 +1,439 @@
+# Import libraries
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+import argparse
+import inspect
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import chai1_tools
+import routing
+import structure_format
+import tracing
+import weights_manifest
+from modal_app import CHAI_LAB_VERSION, INFERENCE_DEPENDENCIES
+
+# Define parameters of the latency benchmark
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+BENCHMARK_DIR = results_dir / "benchmarks"  # one latency-<time>.json report per run
+REGRESSION_TOLERANCE = 0.2  # relative p95 increase over the baseline reported as a regression
+
+# Stages of a compute_Chai1 call, in order. The remote ones are simulated by the stand-in service.
+STAGES = [
+    "app_startup",
+    "dependency_check",
+    "cold_start",
+    "inference",
+    "transfer",
+    "save_model",
+    "write_model",
+    "dataframe",
+    "pdb_conversion",
+    "time_to_first_model",
+    "compute_Chai1",
+    "select_best_model",
+    "plot_protein",
+    "show_cif_file",
+]
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+RESIDUE_ATOMS = [("N", "N", -0.53, 1.36), ("CA", "C", 0.0, 0.0), ("C", "C", 1.52, 0.0), ("O", "O", 2.14, -1.04), ("CB", "C", -0.53, -0.78)]
+
+
+class StageTimer:
+    """Thread-safe collection of the durations of each stage."""
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()  # compute_Chai1 runs in several threads and writes in the writer pool
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, function):
+        """Time each call of a function, or the full iteration of a generator function."""
+        if inspect.isgeneratorfunction(function):
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                yield from function(*args, **kwargs)
+                self.record(stage, time.perf_counter() - start)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+        return timed
+
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile, None for no values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def synthetic_fasta(residues: int, seed: int = 0) -> str:
+    """FASTA content of one protein chain of the given length."""
+    rng = random.Random(seed)
+    return ">protein|name=benchmark\n" + "".join(rng.choice(AMINO_ACIDS) for _ in range(residues)) + "\n"
+
+
+def synthetic_cif(residues: int, seed: int = 0) -> str:
+    """mmCIF text of a helical chain of ALA-like residues with 5 atoms each, jittered by the seed.
+
+    Different seeds give different file contents, so that the PDB cache never serves another model.
+    """
+    import math
+
+    rng = random.Random(seed)
+    lines = [
+        "data_benchmark",
+        "loop_",
+        *(f"_atom_site.{column}" for column in [
+            "group_PDB", "id", "type_symbol", "label_atom_id", "label_alt_id", "label_comp_id", "label_asym_id",
+            "label_entity_id", "label_seq_id", "pdbx_PDB_ins_code", "Cartn_x", "Cartn_y", "Cartn_z", "occupancy",
+            "B_iso_or_equiv", "auth_seq_id", "auth_asym_id", "pdbx_PDB_model_num",
+        ]),
+    ]
+    atom_id = 0
+    for residue in range(1, residues + 1):
+        angle = math.radians(100 * residue)  # 3.6 residues per turn, 1.5 Angstrom rise
+        x, y, z = 2.3 * math.cos(angle), 2.3 * math.sin(angle), 1.5 * residue
+        for name, element, dx, dy in RESIDUE_ATOMS:
+            atom_id += 1
+            lines.append(
+                f"ATOM {atom_id} {element} {name} . ALA A 1 {residue} ? "
+                f"{x + dx + rng.uniform(-0.1, 0.1):.3f} {y + dy + rng.uniform(-0.1, 0.1):.3f} {z + rng.uniform(-0.1, 0.1):.3f} "
+                f"1.00 {rng.uniform(20, 90):.2f} {residue} A 1"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_scores(seed: int = 0) -> bytes:
+    """Content of a scores.model_idx_N.npz file with the arrays read by the tools."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        aggregate_score=rng.uniform(0.2, 0.9, 1),
+        ptm=rng.uniform(0.2, 0.9, 1),
+        iptm=rng.uniform(0.2, 0.9, 1),
+        per_chain_ptm=rng.uniform(0.2, 0.9, (1, 1)),
+        per_chain_pair_iptm=rng.uniform(0.2, 0.9, (1, 1, 1)),
+        has_inter_chain_clashes=np.array([False]),
+        chain_chain_clashes=np.zeros((1, 1, 1), dtype=np.int64),
+    )
+    return buffer.getvalue()
+
+
+class LocalChai1Service:
+    """Local stand-in for Chai1Service, streaming synthetic models with simulated remote delays.
+
+    A pool of warm containers is shared by the calls: a call finding no idle container pays the cold start.
+    Transfer time is the payload size over the simulated bandwidth.
+    """
+
+    def __init__(self, timer: StageTimer, models: int, residues: int, cold_start_seconds: float,
+                 inference_seconds_per_model: float, bandwidth_mbps: float):
+        self.timer = timer
+        self.models = models
+        self.residues = residues
+        self.cold_start_seconds = cold_start_seconds
+        self.inference_seconds_per_model = inference_seconds_per_model
+        self.bandwidth_mbps = bandwidth_mbps
+        self.idle_containers = 0
+        self.inference_seconds = {}
+        self._lock = threading.Lock()
+        self.inference_stream = SimpleNamespace(remote_gen=self._inference_stream)
+
+    def _inference_stream(self, fasta_content: str, inference_config: dict, run_id: str, structure_format_name="text"):
+        with self._lock:
+            warm = self.idle_containers > 0
+            self.idle_containers -= warm
+        if not warm:
+            time.sleep(self.cold_start_seconds)
+            self.timer.record("cold_start", self.cold_start_seconds)
+        try:
+            start = time.perf_counter()
+            for ii in range(self.models):
+                time.sleep(self.inference_seconds_per_model)
+                self.timer.record("inference", self.inference_seconds_per_model)
+
+                seed = int(run_id, 16) * 8 + ii  # run IDs are hexadecimal
+                scores = synthetic_scores(seed)
+                cif = synthetic_cif(self.residues, seed)
+                if structure_format_name != "text":
+                    cif = structure_format.compress_structure(cif.encode(), structure_format_name)
+                transfer_seconds = (len(scores) + len(cif)) * 8 / (self.bandwidth_mbps * 1e6)
+                time.sleep(transfer_seconds)
+                self.timer.record("transfer", transfer_seconds)
+                yield ii, scores, cif
+            self.inference_seconds[run_id] = time.perf_counter() - start
+        finally:
+            with self._lock:
+                self.idle_containers += 1
+
+
+@contextmanager
+def stand_in(service: LocalChai1Service, timer: StageTimer, app_startup_seconds: float,
+             dependency_check_seconds: float, wire_format: str):
+    """Replace the Modal calls of chai1_tools by the stand-in service and time the local stages.
+
+    The attributes are restored on exit. The weights manifest check runs for real against a
+    stand-in download function, so only the first call of the process pays it.
+    """
+
+    @contextmanager
+    def app_session():
+        start = time.perf_counter()
+        time.sleep(app_startup_seconds)
+        timer.record("app_startup", time.perf_counter() - start)
+        yield
+
+    def download(force=False):
+        time.sleep(dependency_check_seconds)
+        return {dep: {"version": CHAI_LAB_VERSION} for dep in INFERENCE_DEPENDENCIES}
+
+    replaced = [
+        (chai1_tools, "app_session", app_session),
+        (chai1_tools, "download_inference_dependencies", SimpleNamespace(remote=download)),
+        (chai1_tools, "check_inference_dependencies", timer.wrap("dependency_check", chai1_tools.check_inference_dependencies)),
+        (chai1_tools, "routed_service", lambda fasta_content, *args, **kwargs: (service, routing.route(fasta_content))),
+        (chai1_tools, "inference_seconds", lambda run_id: service.inference_seconds.get(run_id)),
+        (chai1_tools, "WIRE_FORMAT", wire_format),
+        (chai1_tools, "save_model", timer.wrap("save_model", chai1_tools.save_model)),
+        (chai1_tools, "_write_model", timer.wrap("write_model", chai1_tools._write_model)),
+        (chai1_tools, "results_dataframe", timer.wrap("dataframe", chai1_tools.results_dataframe)),
+        (chai1_tools, "plot_protein", timer.wrap("pdb_conversion", chai1_tools.plot_protein)),
+        (tracing, "collect_container_spans", lambda run_id, n_shards=1: 0),  # the stand-in records no container spans
+    ]
+    original = [(module, name, getattr(module, name)) for module, name, _ in replaced]
+    for module, name, value in replaced:
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for module, name, value in original:
+            setattr(module, name, value)
+
+
+def run_tools(timer: StageTimer, run_id: str, results_df, models: int):
+    """Drive the post-processing tools on a finished run, as the viewer and the LLM would.
+
+    plot_protein is a PDB cache hit, the best model being converted during the run, while
+    show_cif_file converts the last model unless it is the best one.
+    """
+    timer.wrap("select_best_model", chai1_tools.select_best_model)(run_id, number_of_scores=models)
+    timer.wrap("plot_protein", chai1_tools.plot_protein)(results_df)
+    cif_file = structure_format.find_cif_file(structure_format.molecules_dir, run_id, models - 1)
+    for _ in timer.wrap("show_cif_file", chai1_tools.show_cif_file)(SimpleNamespace(name=str(cif_file)), "auto"):
+        pass
+
+
+def stage_report(timer: StageTimer, wall_seconds: float) -> dict:
+    """p50/p95 latency and throughput of each recorded stage."""
+    return {
+        stage: {
+            "calls": len(timer.durations[stage]),
+            "p50_seconds": percentile(timer.durations[stage], 0.5),
+            "p95_seconds": percentile(timer.durations[stage], 0.95),
+            "calls_per_second": len(timer.durations[stage]) / wall_seconds,
+        }
+        for stage in STAGES
+        if stage in timer.durations
+    }
+
+
+def benchmark_config(concurrency: int, models: int, residues: int, runs_per_worker: int, settings: dict) -> dict:
+    """Run concurrency workers each making runs_per_worker compute_Chai1 calls, then the tools on every run.
+
+    Returns:
+        dict: Wall time, runs per second and the report of each stage
+    """
+    timer = StageTimer()
+    service = LocalChai1Service(
+        timer, models, residues, settings["cold_start_seconds"], settings["inference_seconds_per_model"],
+        settings["bandwidth_mbps"],
+    )
+    fasta_file = Path("inputs") / f"benchmark-{residues}.fasta"
+    fasta_file.parent.mkdir(parents=True, exist_ok=True)
+    fasta_file.write_text(synthetic_fasta(residues))
+    config_file = Path("inputs") / "benchmark.json"
+    config_file.write_text(json.dumps({"num_trunk_recycles": 3, "num_diffn_timesteps": 200, "seed": 42}))
+
+    def compute(_):
+        start = time.perf_counter()
+        first = None
+        for results_df, _ in chai1_tools.compute_Chai1(str(fasta_file.resolve()), str(config_file.resolve()), use_cache=False):
+            if first is None:
+                first = time.perf_counter() - start
+                timer.record("time_to_first_model", first)
+        timer.record("compute_Chai1", time.perf_counter() - start)
+        run_id, _ = structure_format.parse_cif_file_name(results_df.iloc[0]["CIF File"])
+        return run_id, results_df
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:  # as the Gradio worker threads
+        with stand_in(service, timer, settings["app_startup_seconds"], settings["dependency_check_seconds"], settings["structure_format"]):
+            runs = list(pool.map(compute, range(concurrency * runs_per_worker)))
+        list(pool.map(lambda run: run_tools(timer, run[0], run[1], models), runs))
+    wall_seconds = time.perf_counter() - start
+
+    print(f"🧬 {len(runs)} runs of {models} models at concurrency {concurrency} in {wall_seconds:.2f}s")
+    return {
+        "concurrency": concurrency,
+        "models": models,
+        "runs": len(runs),
+        "wall_seconds": wall_seconds,
+        "runs_per_second": len(runs) / wall_seconds,
+        "stages": stage_report(timer, wall_seconds),
+    }
+
+
+def compare_reports(report: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """List the stages whose p95 latency grew by more than tolerance over the same configuration of a baseline report."""
+    baseline_results = {(result["concurrency"], result["models"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        reference = baseline_results.get((result["concurrency"], result["models"]))
+        if reference is None:
+            continue
+        for stage, stats in result["stages"].items():
+            before = reference["stages"].get(stage, {}).get("p95_seconds")
+            if before and before > 1e-3 and stats["p95_seconds"] > before * (1 + tolerance):
+                regressions.append(
+                    f"{stage} at concurrency {result['concurrency']} with {result['models']} models: "
+                    f"p95 {before:.3f}s -> {stats['p95_seconds']:.3f}s"
+                )
+    return regressions
+
+
+def benchmark(
+    concurrency: list = (1, 4),
+    models: list = (1, 5),
+    residues: int = 400,
+    runs_per_worker: int = 2,
+    structure_format_name: str = "text",
+    app_startup_seconds: float = 0.0,
+    dependency_check_seconds: float = 0.0,
+    cold_start_seconds: float = 0.0,
+    inference_seconds_per_model: float = 0.0,
+    bandwidth_mbps: float = 100.0,
+) -> dict:
+    """Measure the latency of each stage of compute_Chai1 and of the viewer tools without GPUs.
+
+    The Modal calls are replaced by LocalChai1Service, which returns synthetic score npz and CIF
+    payloads. The remote stages (app startup, dependency check, cold start, inference, transfer) only
+    take the simulated times given here, all zero but the transfer by default, so the report measures
+    the local stages: result writes, DataFrame builds and CIF to PDB conversions. The runs are made in
+    a temporary directory, the results of the app are left untouched.
+
+    Args:
+        concurrency (list, optional): Numbers of compute_Chai1 calls running at the same time. Default is (1, 4).
+        models (list, optional): Numbers of models per run. Default is (1, 5).
+        residues (int, optional): Residues of the synthetic chain, 5 atoms each. Default is 400.
+        runs_per_worker (int, optional): compute_Chai1 calls made by each concurrent worker. Default is 2.
+        structure_format_name (str, optional): Wire format of the CIF payloads, "text", "zstd" or "gzip". Default is "text".
+        app_startup_seconds (float, optional): Simulated app.run() startup per call. Default is 0.
+        dependency_check_seconds (float, optional): Simulated remote weights check, made once per process. Default is 0.
+        cold_start_seconds (float, optional): Simulated container cold start. Default is 0.
+        inference_seconds_per_model (float, optional): Simulated inference time of each model. Default is 0.
+        bandwidth_mbps (float, optional): Simulated bandwidth of the result transfer. Default is 100.
+
+    Returns:
+        dict: Settings and, for each concurrency and number of models, the p50/p95 latency and throughput of each stage
+    """
+    settings = {
+        "residues": residues,
+        "runs_per_worker": runs_per_worker,
+        "structure_format": structure_format.check_structure_format(structure_format_name),
+        "app_startup_seconds": app_startup_seconds,
+        "dependency_check_seconds": dependency_check_seconds,
+        "cold_start_seconds": cold_start_seconds,
+        "inference_seconds_per_model": inference_seconds_per_model,
+        "bandwidth_mbps": bandwidth_mbps,
+    }
+    cwd = Path.cwd()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)  # results/ and its caches are relative to the working directory
+        try:
+            for name in ["score", "molecules"]:
+                (results_dir / name).mkdir(parents=True)
+            benchmark_config(1, 1, residues, 1, settings)  # warm-up, imports pandas, numpy and gemmi
+            weights_manifest._checked_at = None  # the first measured run pays the dependency check
+            weights_manifest.MANIFEST_CACHE_FILE.unlink()
+            for n_workers in concurrency:
+                for n_models in models:
+                    results.append(benchmark_config(n_workers, n_models, residues, runs_per_worker, settings))
+        finally:
+            os.chdir(cwd)
+    return {"settings": settings, "time": time.time(), "results": results}
+
+
+def print_report(report: dict):
+    """Print the stage table of each configuration of a report."""
+    for result in report["results"]:
+        print(
+            f"\n🧬 concurrency {result['concurrency']}, {result['models']} models: "
+            f"{result['runs_per_second']:.2f} runs/s"
+        )
+        print(f"{'stage':>20} {'calls':>6} {'p50 (s)':>9} {'p95 (s)':>9} {'calls/s':>9}")
+        for stage, stats in result["stages"].items():
+            print(
+                f"{stage:>20} {stats['calls']:>6} {stats['p50_seconds']:>9.4f} "
+                f"{stats['p95_seconds']:>9.4f} {stats['calls_per_second']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark of compute_Chai1 with a local stand-in for Modal")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated numbers of concurrent calls")
+    parser.add_argument("--models", default="1,5", help="comma-separated numbers of models per run")
+    parser.add_argument("--residues", type=int, default=400)
+    parser.add_argument("--runs-per-worker", type=int, default=2)
+    parser.add_argument("--structure-format", default="text", choices=list(structure_format.STRUCTURE_SUFFIXES))
+    parser.add_argument("--app-startup", type=float, default=0.0, help="simulated seconds")
+    parser.add_argument("--dependency-check", type=float, default=0.0, help="simulated seconds")
+    parser.add_argument("--cold-start", type=float, default=0.0, help="simulated seconds")
+    parser.add_argument("--inference", type=float, default=0.0, help="simulated seconds per model")
+    parser.add_argument("--bandwidth", type=float, default=100.0, help="simulated Mbit/s")
+    parser.add_argument("--baseline", help="previous report to compare the p95 latencies with")
+    args = parser.parse_args()
+
+    report = benchmark(
+        concurrency=[int(value) for value in args.concurrency.split(",")],
+        models=[int(value) for value in args.models.split(",")],
+        residues=args.residues,
+        runs_per_worker=args.runs_per_worker,
+        structure_format_name=args.structure_format,
+        app_startup_seconds=args.app_startup,
+        dependency_check_seconds=args.dependency_check,
+        cold_start_seconds=args.cold_start,
+        inference_seconds_per_model=args.inference,
+        bandwidth_mbps=args.bandwidth,
+    )
+    print_report(report)
+
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    report_file = BENCHMARK_DIR / f"latency-{int(report['time'])}.json"
+    report_file.write_text(json.dumps(report, indent=4))
+    print(f"\n🧬 report written to {report_file}")
+
+    if args.baseline:
+        regressions = compare_reports(report, json.loads(Path(args.baseline).read_text()))
+        for regression in regressions:
+            print(f"🧬 regression: {regression}")
+        sys.exit(1 if regressions else 0)
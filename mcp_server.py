@@ -0,0 +1,131 @@
+# Import libraries
+import time
+
+PROCESS_START = time.perf_counter()  # before the imports, to measure them
+
+import functools
+import inspect
+import json
+import threading
+import typing
+from typing import Any, Dict, List, Tuple
+import gradio as gr
+import chai1_tools
+import result_cache
+import score_index
+
+IMPORT_SECONDS = time.perf_counter() - PROCESS_START
+
+# Value types of the MCP schema. gr.api builds the schema from the type hints and cannot parse
+# Optional or bare list and dict hints, so the tools are registered with these plain types.
+TABLE = List[Dict[str, Any]]  # DataFrames are returned as lists of records
+RECORD = Dict[str, Any]
+
+# Tools of the headless MCP server with the type of their output: the tools of app.py, without the interface-only plot tools
+MCP_TOOLS = [
+    (chai1_tools.create_fasta_file, str),
+    (chai1_tools.create_json_config, str),
+    (chai1_tools.compute_Chai1, Tuple[TABLE, str]),
+    (chai1_tools.compute_Chai1_batch, TABLE),
+    (chai1_tools.compute_Chai1_sweep, TABLE),
+    (chai1_tools.submit_chai1, str),
+    (chai1_tools.get_chai1_status, RECORD),
+    (chai1_tools.get_chai1_result, TABLE),
+    (chai1_tools.cancel_chai1, RECORD),
+    (chai1_tools.rank_models, TABLE),
+    (chai1_tools.filter_models, TABLE),
+    (chai1_tools.fetch_model_cif, str),
+    (chai1_tools.compute_Chai1_cascade, Tuple[TABLE, RECORD]),
+    (chai1_tools.representative_models, TABLE),
+    (chai1_tools.job_metrics, RECORD),
+]
+
+startup_timings = {"import_seconds": IMPORT_SECONDS, "ready_seconds": None, "first_tool_call": None}
+_lock = threading.Lock()  # tool calls run in worker threads
+
+
+def _record_call(tool_name: str):
+    """Log the time from the process start to the first tool call."""
+    with _lock:
+        if startup_timings["first_tool_call"] is not None:
+            return
+        startup_timings["first_tool_call"] = tool_name
+        startup_timings["first_tool_call_seconds"] = time.perf_counter() - PROCESS_START
+    print(f"🧬 first tool call ({tool_name}) {startup_timings['first_tool_call_seconds']:.2f}s after the process start")
+
+
+def plain_type(annotation):
+    """Type hint of a tool parameter that gr.api can turn into a schema: Optional[X] as X, a bare list as List[str]."""
+    if typing.get_origin(annotation) is typing.Union:
+        annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+    if annotation is list:
+        return List[str]
+    return annotation
+
+
+def to_json_value(value):
+    """Output of a tool as JSON values: DataFrames as lists of records."""
+    if isinstance(value, tuple):
+        return tuple(to_json_value(item) for item in value)
+    if hasattr(value, "to_json"):
+        return json.loads(value.to_json(orient="records"))
+    return value
+
+
+def mcp_tool(tool, returns):
+    """Wrap a tool with plain parameter and output types for the MCP schema, recording the first tool call.
+
+    Parameters defaulting to None default to an empty value instead, passed to the tool as None.
+    The docstring is kept for the descriptions of the MCP schema.
+    """
+    signature = inspect.signature(tool)
+    none_defaults = {name for name, param in signature.parameters.items() if param.default is None}
+    parameters = []
+    for name, param in signature.parameters.items():
+        annotation = plain_type(param.annotation)
+        default = param.default
+        if default is None:
+            default = [] if typing.get_origin(annotation) is list else annotation()
+        parameters.append(param.replace(annotation=annotation, default=default))
+
+    def arguments(args, kwargs):
+        bound = wrapper.__signature__.bind(*args, **kwargs)
+        return {name: None if name in none_defaults and not value else value for name, value in bound.arguments.items()}
+
+    if inspect.isgeneratorfunction(tool):
+        @functools.wraps(tool)
+        def wrapper(*args, **kwargs):
+            _record_call(tool.__name__)
+            for output in tool(**arguments(args, kwargs)):
+                yield to_json_value(output)
+    else:
+        @functools.wraps(tool)
+        def wrapper(*args, **kwargs):
+            _record_call(tool.__name__)
+            return to_json_value(tool(**arguments(args, kwargs)))
+
+    wrapper.__signature__ = signature.replace(parameters=parameters, return_annotation=returns)
+    wrapper.__annotations__ = {**{param.name: param.annotation for param in parameters}, "return": returns}
+    return wrapper
+
+
+def warm_up():
+    """Index the previous runs, off the startup path."""
+    score_index.rebuild(result_cache.entries())  # index the runs written before the score index existed
+
+
+# Register the tools as API endpoints only: no interface is built
+with gr.Blocks() as demo:
+    for tool, returns in MCP_TOOLS:
+        gr.api(mcp_tool(tool, returns), api_name=tool.__name__)
+
+# Launch the MCP server alone
+if __name__ == "__main__":
+    print(f"🧬 imports done in {IMPORT_SECONDS:.2f}s")
+    # Requested before the launch, so that the tool calls arriving while it opens wait for it
+    chai1_tools.start_app_session(background=True)
+    threading.Thread(target=warm_up, daemon=True).start()
+    demo.launch(mcp_server=True, prevent_thread_lock=True)
+    startup_timings["ready_seconds"] = time.perf_counter() - PROCESS_START
+    print(f"🧬 MCP server with {len(MCP_TOOLS)} tools ready {startup_timings['ready_seconds']:.2f}s after the process start")
+    demo.block_thread()
@@ -1,5 +1,8 @@
 # Import libraries
 from pathlib import Path
+import json
+import os
+import time
 import modal
 
 # Define parameters for the Modal app
@@ -7,8 +10,10 @@ here = Path(__file__).parent  # the directory of this file
 
 MINUTES = 60  # seconds
 
+CHAI_LAB_VERSION = "0.6.1"  # also recorded as the version of the weights in the manifest
+
 image = modal.Image.debian_slim(python_version="3.12").run_commands(
-    "uv pip install --system --compile-bytecode torch>=2.6.0 chai_lab==0.6.1 hf_transfer==0.1.8 "
+    f"uv pip install --system --compile-bytecode torch>=2.6.0 chai_lab=={CHAI_LAB_VERSION} hf_transfer==0.1.8 zstandard==0.23.0 "
 )
 
 chai_model_volume = (
@@ -29,90 +34,1091 @@ image = image.env(  # update the environment variables in the image to...
 chai_preds_volume = modal.Volume.from_name("chai1-preds", create_if_missing=True)
 preds_dir = Path("/preds")
 
+chai_msa_volume = modal.Volume.from_name("chai1-msas", create_if_missing=True)
+msas_dir = Path("/msas")  # one <chain set key>-<hash of the chain sequence>.aligned.pqt file per protein chain, see msa_store_key
+
+# MSA store settings, baked in the image environment so that the containers see them
+MSA_SERVER_URL = os.environ.get("CHAI1_MSA_SERVER_URL", "https://api.colabfold.com")  # a local stand-in can be used for tests
+MSA_CACHE_MAX_BYTES = int(os.environ.get("CHAI1_MSA_CACHE_MAX_BYTES", 20 * 1024**3))
+MSA_CACHE_MAX_AGE_DAYS = float(os.environ.get("CHAI1_MSA_CACHE_MAX_AGE_DAYS", 90))
+image = image.env(
+    {
+        "CHAI1_MSA_SERVER_URL": MSA_SERVER_URL,
+        "CHAI1_MSA_CACHE_MAX_BYTES": str(MSA_CACHE_MAX_BYTES),
+        "CHAI1_MSA_CACHE_MAX_AGE_DAYS": str(MSA_CACHE_MAX_AGE_DAYS),
+    }
+)
+
+chai_embeddings_volume = modal.Volume.from_name("chai1-embeddings", create_if_missing=True)
+embeddings_dir = Path("/embeddings")  # one <sha256 of the chain sequence>.npy file per protein chain
+
+# ESM embeddings store settings, baked in the image environment so that the containers see them
+ESM_CACHE_MAX_BYTES = int(os.environ.get("CHAI1_ESM_CACHE_MAX_BYTES", 50 * 1024**3))
+ESM_CACHE_MAX_AGE_DAYS = float(os.environ.get("CHAI1_ESM_CACHE_MAX_AGE_DAYS", 90))
+image = image.env(
+    {
+        "CHAI1_ESM_CACHE_MAX_BYTES": str(ESM_CACHE_MAX_BYTES),
+        "CHAI1_ESM_CACHE_MAX_AGE_DAYS": str(ESM_CACHE_MAX_AGE_DAYS),
+    }
+)
+
 # Define the Modal app
 app = modal.App("Chai1 inference")
 
-@app.function(
-    timeout=15 * MINUTES,
-    gpu="H100",
-    volumes={models_dir: chai_model_volume, preds_dir: chai_preds_volume},
-    image=image,
-)
-def chai1_inference(
-    fasta_content: str, inference_config: dict, run_id: str
-) -> list[(bytes, str)]:
-    from pathlib import Path
+N_DIFFUSION_SAMPLES = 5  # hard-coded in chai-1
+
+INFERENCE_DEPENDENCIES = [
+    "conformers_v1.apkl",
+    "models_v2/trunk.pt",
+    "models_v2/token_embedder.pt",
+    "models_v2/feature_embedding.pt",
+    "models_v2/diffusion_module.pt",
+    "models_v2/confidence_head.pt",
+]
+WEIGHTS_MANIFEST_FILE = models_dir / "manifest.json"
+WEIGHTS_BASE_URL = "https://chaiassets.com/chai1-inference-depencencies/"  # sic
+
+# Reference SHA-256 checksums of the weights at CHAI_LAB_VERSION. A download that does not match its
+# reference, or the checksum advertised by the server, is discarded. The checksum of a download is
+# never used as a reference, and weights downloaded without any reference are recorded as unverified.
+# CHAI1_WEIGHTS_SHA256 pins them as a JSON object {dependency: sha256}, baked in the image environment.
+WEIGHTS_SHA256 = {dep: None for dep in INFERENCE_DEPENDENCIES}
+WEIGHTS_SHA256.update(json.loads(os.environ.get("CHAI1_WEIGHTS_SHA256", "{}")))
+image = image.env({"CHAI1_WEIGHTS_SHA256": json.dumps({dep: sha for dep, sha in WEIGHTS_SHA256.items() if sha})})
+
+# Downloader settings
+DOWNLOAD_CONNECTIONS = 8  # concurrent range requests per file
+DOWNLOAD_PART_SIZE = 64 * 1024 * 1024  # bytes per range request
+DOWNLOAD_BUFFER_SIZE = 4 * 1024 * 1024  # bytes buffered before each write
+DOWNLOAD_RETRIES = 5  # attempts per range
+
+# Compression of the CIF files sent back to the client, see structure_format.py for the decoding side
+ZSTD_LEVEL = 9  # mmCIF compresses ~6-8x, higher levels cost CPU time for little gain
+GZIP_LEVEL = 6
+
+# Warm pool settings of the inference service, tunable without code changes
+CHAI1_MIN_CONTAINERS = int(os.environ.get("CHAI1_MIN_CONTAINERS", 0))  # containers kept warm even when idle
+CHAI1_BUFFER_CONTAINERS = int(os.environ.get("CHAI1_BUFFER_CONTAINERS", 0))  # extra idle containers while busy
+CHAI1_SCALEDOWN_WINDOW = int(os.environ.get("CHAI1_SCALEDOWN_WINDOW", 5 * MINUTES))  # idle time before shutdown
+
+service_timings = modal.Dict.from_name("chai1-service-timings", create_if_missing=True)
+msa_stats = modal.Dict.from_name("chai1-msa-stats", create_if_missing=True)
+esm_stats = modal.Dict.from_name("chai1-esm-stats", create_if_missing=True)
+job_spans = modal.Dict.from_name("chai1-job-spans", create_if_missing=True)  # container spans of each run, see tracing.py
+
+# Stages timed inside chai1.run_inference, by the component they run
+COMPONENT_STAGES = {
+    "feature_embedding": "embedding",
+    "token_embedder": "embedding",
+    "trunk": "trunk",
+    "diffusion_module": "diffusion",
+    "confidence_head": "confidence",
+}
+component_seconds = {}  # time spent in each stage of COMPONENT_STAGES since the container started
+pending_model_load = []  # model load span of the container, reported by its first run
+
+
+def protein_chains(fasta_content: str) -> list[str]:
+    """List the protein sequences of a Chai-1 FASTA input, the only chains with MSAs."""
+    chains = []
+    for record in fasta_content.strip().split(">")[1:]:
+        header, _, sequence = record.partition("\n")
+        if header.strip().lower().startswith("protein"):
+            chains.append("".join(sequence.split()).upper())
+    return chains
+
+
+def msa_store_key(chains: list[str]) -> str:
+    """Key of the alignments of a set of protein chains in the MSA store.
+
+    The MSA server pairs the alignments of the chains of a complex: the pairing keys of the rows of
+    a chain only hold together with the rows of its partner chains from the same query. Alignments
+    are thus stored per set of protein chains, so that the rows of a chain computed with other
+    partners are never mixed with the current ones.
+    """
+    import hashlib
+
+    return hashlib.sha256("\n".join(sorted(set(chains))).encode()).hexdigest()[:16]
+
+
+def prepare_msas(fasta_content: str, run_msa_dir: Path, msa_server_url: str = MSA_SERVER_URL) -> dict:
+    """Gather the MSAs of the protein chains of an input from the MSA store into run_msa_dir.
+
+    The alignments are stored per set of protein chains, see msa_store_key. If the store misses a
+    chain of the set, the whole set is requested from the MSA server, so that its chains are
+    paired with each other, and the alignments are added to the store for the next runs.
+
+    Args:
+        fasta_content (str): FASTA content of the run
+        run_msa_dir (Path): Directory passed to chai1.run_inference as msa_directory
+        msa_server_url (str, optional): MSA server to query for the missing chains
+
+    Returns:
+        dict: Number of cache hits and misses of the run
+    """
+    import shutil
+    import tempfile
+
+    from chai_lab.data.dataset.msas.colabfold import generate_colabfold_msas
+    from chai_lab.data.parsing.msas.aligned_pqt import hash_sequence
+
+    chai_msa_volume.reload()  # see the alignments committed by other containers
+    run_msa_dir.mkdir(parents=True, exist_ok=True)
+
+    chains = sorted(set(protein_chains(fasta_content)))
+    store_key = msa_store_key(chains)
+    store_files = {sequence: msas_dir / f"{store_key}-{hash_sequence(sequence)}.aligned.pqt" for sequence in chains}
+    missing = [] if all(f.exists() for f in store_files.values()) else chains
+    print(f"🧬 MSA store: {len(chains) - len(missing)} hits, {len(missing)} misses")
+
+    if missing:
+        new_msa_dir = Path(tempfile.mkdtemp(prefix=f"{run_msa_dir.name}-"))  # generate_colabfold_msas needs an empty directory
+        try:
+            generate_colabfold_msas(protein_seqs=missing, msa_dir=new_msa_dir, msa_server_url=msa_server_url)
+            for sequence in missing:
+                new_file = new_msa_dir / f"{hash_sequence(sequence)}.aligned.pqt"
+                tmp_file = store_files[sequence].with_name(f"{store_files[sequence].name}.tmp")
+                shutil.copy(new_file, tmp_file)
+                tmp_file.replace(store_files[sequence])  # concurrent containers never read a partial file
+        finally:
+            shutil.rmtree(new_msa_dir, ignore_errors=True)
+    for sequence, store_file in store_files.items():
+        os.utime(store_file)  # mark as recently used for the eviction
+        shutil.copy(store_file, run_msa_dir / f"{hash_sequence(sequence)}.aligned.pqt")
+    if missing:
+        evict_store(msas_dir, "*.aligned.pqt", MSA_CACHE_MAX_BYTES, MSA_CACHE_MAX_AGE_DAYS, msa_stats)
+    if chains:
+        chai_msa_volume.commit()  # persist the new alignments and the access times of the hits
+
+    stats = {"hits": len(chains) - len(missing), "misses": len(missing)}
+    for key, value in stats.items():
+        msa_stats[key] = msa_stats.get(key, 0) + value
+    return stats
+
+
+def msa_store_stats() -> dict:
+    """Return the hit, miss and eviction counts of the MSA store."""
+    stats = {key: msa_stats.get(key, 0) for key in ["hits", "misses", "evictions"]}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def evict_store(store_dir: Path, pattern: str, max_bytes: int, max_age_days: float, stats) -> int:
+    """Remove expired files of a store, then least recently used ones until the store fits max_bytes.
+
+    Files are ordered by modification time, which the stores refresh on every hit. Sidecar files
+    sharing the stem of an evicted file (e.g. <hash>.json) are removed with it.
+
+    Returns:
+        int: Number of evicted files
+    """
+    now = time.time()
+    files = sorted(store_dir.glob(pattern), key=lambda f: f.stat().st_mtime)
+    total_bytes = sum(f.stat().st_size for f in files)
+    evicted = 0
+    for store_file in files:
+        expired = now - store_file.stat().st_mtime > max_age_days * 24 * 3600
+        if not expired and total_bytes <= max_bytes:
+            continue
+        total_bytes -= store_file.stat().st_size
+        store_file.unlink()
+        store_file.with_suffix(".json").unlink(missing_ok=True)
+        evicted += 1
+    if evicted:
+        print(f"🧬 evicted {evicted} files from {store_dir}")
+        stats["evictions"] = stats.get("evictions", 0) + evicted
+    return evicted
+
+
+def install_esm_embedding_cache():
+    """Serve the ESM embeddings of protein chains from the embeddings store.
+
+    Wraps chai_lab's per-sequence ESM function so that only the sequences missing from the store
+    are embedded on the GPU. New embeddings are saved as .npy arrays, memory-mapped when read,
+    together with the GPU time they took so that the time saved by each hit can be reported.
+    """
+    import hashlib
+    import json
+
+    import numpy as np
+    import torch
+    from chai_lab.data.dataset.embeddings import esm
+    from chai_lab.data.dataset.embeddings.embedding_context import EmbeddingContext
+
+    if not hasattr(esm, "_get_esm_contexts_for_sequences"):
+        print("🧬 chai_lab does not expose _get_esm_contexts_for_sequences, ESM embeddings won't be cached")
+        return
+    compute_embeddings = esm._get_esm_contexts_for_sequences
+
+    def cached_embeddings(prot_sequences, device):
+        try:
+            chai_embeddings_volume.reload()  # see the embeddings committed by other containers
+        except RuntimeError as e:
+            print(f"🧬 could not reload the embeddings volume: {e}")
+
+        contexts, missing, saved_seconds = {}, [], 0.0
+        for sequence in prot_sequences:
+            embedding_file = embeddings_dir / f"{hashlib.sha256(sequence.encode()).hexdigest()}.npy"
+            if embedding_file.exists():
+                os.utime(embedding_file)  # mark as recently used for the eviction
+                # the tensor shares the mapped pages, copy-on-write so that torch gets a writable array,
+                # and the file is only read when chai_lab moves the embeddings to the device
+                embeddings = np.load(embedding_file, mmap_mode="c")
+                contexts[sequence] = EmbeddingContext(esm_embeddings=torch.from_numpy(embeddings))
+                if embedding_file.with_suffix(".json").exists():
+                    saved_seconds += json.loads(embedding_file.with_suffix(".json").read_text())["compute_seconds"]
+            else:
+                missing.append(sequence)
+
+        if missing:
+            start = time.perf_counter()
+            new_contexts = compute_embeddings(set(missing), device)
+            compute_seconds = time.perf_counter() - start
+            total_length = sum(len(sequence) for sequence in missing)
+            for sequence, context in new_contexts.items():
+                embedding_file = embeddings_dir / f"{hashlib.sha256(sequence.encode()).hexdigest()}.npy"
+                tmp_file = embedding_file.with_suffix(".tmp.npy")
+                np.save(tmp_file, context.esm_embeddings.cpu().numpy())
+                tmp_file.replace(embedding_file)  # concurrent containers never read a partial file
+                embedding_file.with_suffix(".json").write_text(json.dumps({
+                    "length": len(sequence),
+                    "compute_seconds": compute_seconds * len(sequence) / total_length,  # share of the batch
+                }))
+                contexts[sequence] = context
+            evict_store(embeddings_dir, "*.npy", ESM_CACHE_MAX_BYTES, ESM_CACHE_MAX_AGE_DAYS, esm_stats)
+
+        print(f"🧬 ESM store: {len(contexts) - len(missing)} hits, {len(missing)} misses, {saved_seconds:.1f} GPU-seconds saved")
+        esm_stats["hits"] = esm_stats.get("hits", 0) + len(contexts) - len(missing)
+        esm_stats["misses"] = esm_stats.get("misses", 0) + len(missing)
+        esm_stats["gpu_seconds_saved"] = esm_stats.get("gpu_seconds_saved", 0.0) + saved_seconds
+        if prot_sequences:
+            chai_embeddings_volume.commit()  # persist the new embeddings and the access times of the hits
+        return contexts
+
+    esm._get_esm_contexts_for_sequences = cached_embeddings
+
+
+def install_component_timers():
+    """Time the embedding, trunk, diffusion and confidence stages of chai1.run_inference.
+
+    Wraps chai_lab's load_exported so that the forward of each component it returns adds its time to
+    component_seconds, under the stage of the component in COMPONENT_STAGES. The GPU is synchronized
+    after each forward so that the asynchronous kernels are counted in their stage. run_chai1 reports
+    the time of each stage during the run as a container span.
+    """
+    import functools
 
     import torch
     from chai_lab import chai1
 
-    N_DIFFUSION_SAMPLES = 5  # hard-coded in chai-1
+    if not hasattr(chai1, "load_exported"):
+        print("🧬 chai_lab does not expose load_exported, embedding, trunk, diffusion and confidence won't be timed")
+        return
+    load_exported = chai1.load_exported
+
+    @functools.wraps(load_exported)
+    def timed_load_exported(comp_key, *args, **kwargs):
+        component = load_exported(comp_key, *args, **kwargs)
+        if getattr(component, "timed_stage", None) is not None:
+            return component  # memoized component, already timed
+        stage = COMPONENT_STAGES.get(Path(str(comp_key)).stem, Path(str(comp_key)).stem)
+        forward = component.forward
+
+        @functools.wraps(forward)
+        def timed_forward(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                output = forward(*args, **kwargs)
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+                return output
+            finally:
+                component_seconds[stage] = component_seconds.get(stage, 0.0) + time.perf_counter() - start
+
+        component.forward = timed_forward
+        component.timed_stage = stage
+        return component
+
+    chai1.load_exported = timed_load_exported
+
+
+def container_span(run_id: str, stage: str, start: float, seconds: float, **attributes) -> dict:
+    """Span of a stage run in the container, collected by the client with tracing.collect_container_spans."""
+    return {"run_id": run_id, "stage": stage, "source": "container", "start": start, "seconds": seconds, **attributes}
+
+
+def esm_store_stats() -> dict:
+    """Return the hit, miss and eviction counts of the ESM embeddings store and the GPU-seconds it saved."""
+    return {key: esm_stats.get(key, 0) for key in ["hits", "misses", "evictions", "gpu_seconds_saved"]}
+
+
+def encode_structure(cif_file: Path, structure_format: str = "text"):
+    """Read a CIF file in the wire format requested by the client.
+
+    Args:
+        cif_file (Path): mmCIF file written by Chai-1
+        structure_format (str, optional): "text" for the mmCIF string, "zstd" or "gzip" for compressed bytes,
+            None to leave the structure on the chai1-preds volume
 
-    fasta_file = Path("/tmp/inputs.fasta")
+    Returns:
+        str, bytes or None: The structure in the requested format
+    """
+    if structure_format is None:
+        return None
+    if structure_format == "text":
+        return cif_file.read_text()
+    if structure_format == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(cif_file.read_bytes())
+    if structure_format == "gzip":
+        import gzip
+
+        return gzip.compress(cif_file.read_bytes(), compresslevel=GZIP_LEVEL)
+    raise ValueError(f"Unknown structure format {structure_format!r}")
+
+
+def shard_plan(n_shards: int) -> list[(int, int)]:
+    """Split the N_DIFFUSION_SAMPLES samples of a run into at most n_shards (offset, number of samples) shards."""
+    n_shards = max(1, min(int(n_shards), N_DIFFUSION_SAMPLES))
+    base, extra = divmod(N_DIFFUSION_SAMPLES, n_shards)
+    plan, offset = [], 0
+    for shard_index in range(n_shards):
+        num_samples = base + (shard_index < extra)
+        plan.append((offset, num_samples))
+        offset += num_samples
+    return plan
+
+
+def shard_seed(seed, shard_index: int):
+    """Seed of a shard, derived from the seed of the run so that the shards sample different trajectories."""
+    import hashlib
+
+    if seed is None or shard_index == 0:
+        return seed
+    digest = hashlib.sha256(f"{seed}:{shard_index}".encode()).digest()
+    return int.from_bytes(digest[:4], "big") % 2**31
+
+
+def run_chai1(
+    fasta_content: str,
+    inference_config: dict,
+    run_id: str,
+    structure_format: str = "text",
+    num_samples: int = N_DIFFUSION_SAMPLES,
+    output_dir: Path = None,
+    **extra_options,
+) -> list[(bytes, str)]:
+    """Run Chai-1 inference inside the GPU container and read back the scores and CIF files.
+
+    The CIF files are returned as text, or as compressed bytes if structure_format is "zstd" or "gzip".
+    If structure_format is None only the scores are returned, the client fetches the CIF files it
+    needs from /preds/<run_id> on the chai1-preds volume.
+    """
+    import torch
+    from chai_lab import chai1
+
+    fasta_file = Path(f"/tmp/{run_id}.fasta")
     fasta_file.write_text(fasta_content.strip())
 
-    output_dir = Path("/preds") / run_id
+    output_dir = output_dir or preds_dir / run_id
+    if num_samples != N_DIFFUSION_SAMPLES:
+        extra_options = {**extra_options, "num_diffn_samples": num_samples}
 
+    spans = [pending_model_load.pop()] if pending_model_load else []
+    for span in spans:
+        span["run_id"] = run_id
+
+    # Serve the MSAs from the store instead of querying the MSA server for every chain
+    if inference_config.get("use_msa_server") and "msa_directory" not in extra_options:
+        run_msa_dir = Path(f"/tmp/{run_id}-msas")
+        start, wall_start = time.perf_counter(), time.time()
+        msa_counts = prepare_msas(fasta_content, run_msa_dir, inference_config.get("msa_server_url", MSA_SERVER_URL))
+        spans.append(container_span(run_id, "msa", wall_start, time.perf_counter() - start, **msa_counts))
+        extra_options = {**extra_options, "use_msa_server": False, "msa_directory": run_msa_dir}
+
+    start, wall_start = time.perf_counter(), time.time()
+    components_before = dict(component_seconds)
+    torch.cuda.reset_peak_memory_stats()
     chai1.run_inference(
         fasta_file=fasta_file,
         output_dir=output_dir,
         device=torch.device("cuda"),
-        **inference_config,
+        **{**inference_config, **extra_options},
     )
+    spans.append(container_span(
+        run_id, "fold", wall_start, time.perf_counter() - start,
+        gpu_memory_peak_bytes=torch.cuda.max_memory_allocated(), num_samples=num_samples,
+    ))
+    for stage, seconds in component_seconds.items():
+        spans.append(container_span(run_id, stage, wall_start, seconds - components_before.get(stage, 0.0)))
 
     print(
-        f"🧬 done, results written to /{output_dir.relative_to('/preds')} on remote volume"
+        f"🧬 done, results written to /{output_dir.relative_to(preds_dir)} on remote volume"
     )
 
+    if structure_format is None:
+        chai_preds_volume.commit()  # make the CIF files visible to the client right away
+
     results = []
-    for ii in range(N_DIFFUSION_SAMPLES):
+    start, wall_start = time.perf_counter(), time.time()
+    for ii in range(num_samples):
         scores = (output_dir / f"scores.model_idx_{ii}.npz").read_bytes()
-        cif = (output_dir / f"pred.model_idx_{ii}.cif").read_text()
+        cif = encode_structure(output_dir / f"pred.model_idx_{ii}.cif", structure_format)
 
         results.append((scores, cif))
+    spans.append(container_span(
+        run_id, "serialization", wall_start, time.perf_counter() - start,
+        payload_bytes=sum(len(scores) + len(cif or b"") for scores, cif in results), structure_format=structure_format,
+    ))
 
+    job_spans[run_id] = spans
     return results
 
-@app.function(volumes={models_dir: chai_model_volume})
-async def download_inference_dependencies(force=False):
+
+@app.cls(
+    timeout=60 * MINUTES,  # per input, a seed group of a sweep runs several inferences in one call
+    gpu="H100",
+    volumes={
+        models_dir: chai_model_volume,
+        preds_dir: chai_preds_volume,
+        msas_dir: chai_msa_volume,
+        embeddings_dir: chai_embeddings_volume,
+    },
+    image=image,
+    min_containers=CHAI1_MIN_CONTAINERS,
+    buffer_containers=CHAI1_BUFFER_CONTAINERS,
+    scaledown_window=CHAI1_SCALEDOWN_WINDOW,
+)
+class Chai1Service:
+    """Chai-1 inference service keeping the model weights resident on the GPU between calls."""
+
+    @modal.enter()
+    def load_models(self):
+        """Import torch and chai_lab and load the model components once per container."""
+        import asyncio
+        import functools
+
+        start = time.perf_counter()
+
+        # Check the weights here instead of in a separate container before each call
+        if not weights_manifest_is_valid(read_weights_manifest()):
+            print("🧬 weights missing or outdated on the volume, downloading them")
+            asyncio.run(fetch_inference_dependencies())
+            chai_model_volume.commit()
+
+        import torch
+        from chai_lab import chai1
+
+        install_component_timers()
+
+        # Keep the exported components in memory instead of reloading them from the volume on every call
+        if hasattr(chai1, "load_exported") and not hasattr(chai1.load_exported, "cache_info"):
+            chai1.load_exported = functools.lru_cache(maxsize=None)(chai1.load_exported)
+            device = torch.device("cuda")
+            for dep in INFERENCE_DEPENDENCIES:
+                if dep.endswith(".pt"):
+                    chai1.load_exported(Path(dep).name, device)
+        else:
+            print("🧬 chai_lab does not expose load_exported, weights will be loaded by each inference")
+
+        install_esm_embedding_cache()
+
+        self.container_start_time = time.time()
+        self.setup_seconds = time.perf_counter() - start
+        pending_model_load.append(container_span(None, "model_load", self.container_start_time - self.setup_seconds, self.setup_seconds))
+        self.number_of_calls = 0
+        print(f"🧬 models loaded in {self.setup_seconds:.1f}s")
+
+    def _record_timing(self, run_id: str, inference_seconds: float):
+        """Store the timing of a call so that cold and warm starts can be compared."""
+        service_timings[run_id] = {
+            "cold_start": self.number_of_calls == 0,
+            "setup_seconds": self.setup_seconds if self.number_of_calls == 0 else 0.0,
+            "inference_seconds": inference_seconds,
+            "container_age_seconds": time.time() - self.container_start_time,
+            "time": time.time(),
+        }
+        self.number_of_calls += 1
+
+    @modal.method()
+    def inference(
+        self, fasta_content: str, inference_config: dict, run_id: str, structure_format: str = "text"
+    ) -> list[(bytes, str)]:
+        start = time.perf_counter()
+        results = run_chai1(fasta_content, inference_config, run_id, structure_format)
+        self._record_timing(run_id, time.perf_counter() - start)
+        return results
+
+    @modal.method()
+    def inference_stream(
+        self, fasta_content: str, inference_config: dict, run_id: str, structure_format: str = "text"
+    ):
+        """Run Chai-1 inference and yield (model_index, scores, cif) as soon as each model is on /preds/<run_id>."""
+        import threading
+
+        start = time.perf_counter()
+        output_dir = preds_dir / run_id
+        errors = []
+
+        def target():
+            try:
+                # The models are read and encoded by the stream, run_chai1 only leaves them on the volume
+                run_chai1(fasta_content, inference_config, run_id, structure_format=None)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+
+        pending = list(range(N_DIFFUSION_SAMPLES))
+        sizes = {}
+        serialization_seconds, payload_bytes = 0.0, 0
+        while pending:
+            done = not thread.is_alive()
+            if done and errors:
+                raise errors[0]
+            for ii in list(pending):
+                score_file = output_dir / f"scores.model_idx_{ii}.npz"
+                cif_file = output_dir / f"pred.model_idx_{ii}.cif"
+                if not (score_file.exists() and cif_file.exists()):
+                    continue
+                # Only ship files whose size is stable between two polls, i.e. fully written
+                size = (score_file.stat().st_size, cif_file.stat().st_size)
+                if done or sizes.get(ii) == size:
+                    print(f"🧬 model {ii} of {run_id=} is ready")
+                    encode_start = time.perf_counter()
+                    if structure_format is None:
+                        chai_preds_volume.commit()
+                    scores, cif = score_file.read_bytes(), encode_structure(cif_file, structure_format)
+                    serialization_seconds += time.perf_counter() - encode_start
+                    payload_bytes += len(scores) + len(cif or b"")
+                    yield ii, scores, cif
+                    pending.remove(ii)
+                sizes[ii] = size
+            if pending and done:
+                raise FileNotFoundError(f"Chai-1 finished without writing models {pending} for {run_id=}")
+            if pending:
+                time.sleep(0.5)
+        thread.join()
+        self._record_timing(run_id, time.perf_counter() - start)
+        # The streamed models are encoded here, not by run_chai1
+        stream_span = container_span(
+            run_id, "serialization", time.time() - serialization_seconds, serialization_seconds,
+            payload_bytes=payload_bytes, structure_format=structure_format, streamed=True,
+        )
+        job_spans[run_id] = [span for span in job_spans.get(run_id, []) if span["stage"] != "serialization"] + [stream_span]
+
+    @modal.method()
+    def inference_seeds(
+        self,
+        fasta_content: str,
+        inference_config: dict,
+        seeds_and_run_ids: list[(int, str)],
+        structure_format: str = "text",
+    ) -> dict[str, list[(bytes, str)]]:
+        """Run the same input and config for several seeds in one container.
+
+        The container, the imports and the model weights are shared by all the seeds, and the
+        MSAs computed for the first seed are served from the MSA store to the next ones.
+        """
+        results = {}
+        for seed, run_id in seeds_and_run_ids:
+            print(f"🧬 running seed {seed} with {run_id=}")
+            start = time.perf_counter()
+            results[run_id] = run_chai1(fasta_content, {**inference_config, "seed": seed}, run_id, structure_format)
+            self._record_timing(run_id, time.perf_counter() - start)
+        return results
+
+    @modal.method()
+    def inference_shard(
+        self,
+        fasta_content: str,
+        inference_config: dict,
+        run_id: str,
+        shard_index: int,
+        n_shards: int,
+        structure_format: str = "text",
+    ) -> list[(int, bytes, str)]:
+        """Run one shard of the diffusion samples of a run, see shard_plan.
+
+        Each shard runs the trunk itself with a seed derived by shard_seed, then copies its samples
+        to /preds/<run_id> under their index in the run, so that a sharded run has the usual
+        model_idx_0..4 layout.
+
+        Returns:
+            list: (model index in the run, scores, cif) of the samples of the shard
+        """
+        import shutil
+
+        start = time.perf_counter()
+        offset, num_samples = shard_plan(n_shards)[shard_index]
+        shard_config = {**inference_config, "seed": shard_seed(inference_config.get("seed"), shard_index)}
+        print(f"🧬 running samples {offset} to {offset + num_samples - 1} of {run_id=}")
+        shard_dir = preds_dir / run_id / f"shard_{shard_index}"
+        results = run_chai1(
+            fasta_content, shard_config, f"{run_id}-shard_{shard_index}", structure_format, num_samples, shard_dir
+        )
+
+        for ii in range(num_samples):
+            shutil.copyfile(shard_dir / f"scores.model_idx_{ii}.npz", preds_dir / run_id / f"scores.model_idx_{offset + ii}.npz")
+            shutil.copyfile(shard_dir / f"pred.model_idx_{ii}.cif", preds_dir / run_id / f"pred.model_idx_{offset + ii}.cif")
+        chai_preds_volume.commit()
+
+        self._record_timing(f"{run_id}/shard_{shard_index}", time.perf_counter() - start)
+        return [(offset + ii, scores, cif) for ii, (scores, cif) in enumerate(results)]
+
+    @modal.method()
+    def inference_batch(
+        self, jobs: list[(str, dict, str)], structure_format: str = "text"
+    ) -> dict[str, list[(bytes, str)]]:
+        """Run several (fasta_content, inference_config, run_id) jobs one after the other in one container.
+
+        Used for small inputs, which do not fill the GPU on their own. A failed job returns its
+        exception instead of failing the other jobs of the batch.
+        """
+        results = {}
+        for fasta_content, inference_config, run_id in jobs:
+            print(f"🧬 running {run_id=} of a batch of {len(jobs)}")
+            start = time.perf_counter()
+            try:
+                results[run_id] = run_chai1(fasta_content, inference_config, run_id, structure_format)
+            except Exception as e:
+                results[run_id] = e
+                continue
+            self._record_timing(run_id, time.perf_counter() - start)
+        return results
+
+
+@app.function(volumes={preds_dir: chai_preds_volume}, image=image)
+def fetch_structures(run_id: str, model_indices: list[int] = None, structure_format: str = "text") -> dict:
+    """Read the CIF files of a run from the chai1-preds volume in the requested wire format.
+
+    Returns:
+        dict: Model index -> structure as text or compressed bytes
+    """
+    output_dir = preds_dir / run_id
+    if model_indices is None:
+        model_indices = range(N_DIFFUSION_SAMPLES)
+    return {ii: encode_structure(output_dir / f"pred.model_idx_{ii}.cif", structure_format) for ii in model_indices}
+
+
+@app.local_entrypoint()
+def benchmark_structure_formats(run_id: str, repeats: int = 3):
+    """Compare the payload size and transfer time of the structure formats on the models of a run.
+
+    The transfer time is the round trip of fetch_structures plus the local decoding, i.e. what
+    compute_Chai1 pays per run on top of the inference. Run it with
+    `modal run modal_app.py::benchmark_structure_formats --run-id <run_id>`.
+    """
+    from structure_format import STRUCTURE_SUFFIXES, decode_structure
+
+    fetch_structures.remote(run_id)  # start a container so that the first format is not penalized
+
+    report = {}
+    for structure_format in STRUCTURE_SUFFIXES:
+        transfer_seconds, decode_seconds = [], []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            structures = fetch_structures.remote(run_id, structure_format=structure_format)
+            transfer_seconds.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            texts = [decode_structure(payload) for payload in structures.values()]
+            decode_seconds.append(time.perf_counter() - start)
+        report[structure_format] = {
+            "payload_bytes": sum(len(payload) for payload in structures.values()),
+            "text_bytes": sum(len(text.encode()) for text in texts),
+            "transfer_seconds": sorted(transfer_seconds)[len(transfer_seconds) // 2],
+            "decode_seconds": sorted(decode_seconds)[len(decode_seconds) // 2],
+        }
+
+    text = report["text"]
+    for structure_format, row in report.items():
+        total = row["transfer_seconds"] + row["decode_seconds"]
+        print(
+            f"🧬 {structure_format:>5}: {row['payload_bytes'] / 1024**2:8.2f} MiB "
+            f"({row['payload_bytes'] / text['payload_bytes']:.0%} of text), "
+            f"transfer {row['transfer_seconds']:.2f}s + decode {row['decode_seconds']:.3f}s = {total:.2f}s "
+            f"(text {text['transfer_seconds'] + text['decode_seconds']:.2f}s)"
+        )
+    return report
+
+
+@app.local_entrypoint()
+def benchmark_diffusion_shards(
+    fasta_files: str = "inputs/fasta/chai1_default_input.fasta",
+    config_file: str = "inputs/config/chai1_quick_inference.json",
+    shards: str = "1,5",
+):
+    """Compare the latency of runs in one container and with their diffusion samples spread over several containers.
+
+    Pass a short and a long input to see where sharding pays off, e.g.
+    `modal run modal_app.py::benchmark_diffusion_shards --fasta-files short.fasta,long.fasta --shards 1,2,5`.
+    Latencies include the container start, as paid by a user of compute_Chai1.
+    """
+    import json
+    from uuid import uuid4
+
+    inference_config = json.loads(Path(config_file).read_text())
+    service = Chai1Service()
+    report = {}
+    for fasta_file in fasta_files.split(","):
+        fasta_content = Path(fasta_file).read_text()
+        for n_shards in map(int, shards.split(",")):
+            run_id = str(uuid4())
+            start = time.perf_counter()
+            if n_shards <= 1:
+                service.inference.remote(fasta_content, inference_config, run_id)
+            else:
+                list(service.inference_shard.starmap(
+                    [(fasta_content, inference_config, run_id, ii, n_shards) for ii in range(len(shard_plan(n_shards)))]
+                ))
+            seconds = time.perf_counter() - start
+            report[f"{Path(fasta_file).name} x{n_shards}"] = seconds
+            print(f"🧬 {Path(fasta_file).name}: {n_shards} shard(s) in {seconds:.1f}s ({run_id=})")
+    return report
+
+
+def service_timings_report() -> dict:
+    """Summarize the recorded call timings of Chai1Service, comparing cold and warm starts.
+
+    Returns:
+        dict: Number of calls, mean setup time and mean inference time for cold and warm starts
+    """
+    records = [record for _, record in service_timings.items()]
+    report = {}
+    for name, cold_start in [("cold", True), ("warm", False)]:
+        selected = [record for record in records if record["cold_start"] == cold_start]
+        report[name] = {
+            "calls": len(selected),
+            "mean_setup_seconds": sum(r["setup_seconds"] for r in selected) / max(len(selected), 1),
+            "mean_inference_seconds": sum(r["inference_seconds"] for r in selected) / max(len(selected), 1),
+        }
+    return report
+
+
+# Name of the deployed app (`modal deploy modal_app.py`), used by the asynchronous job tools
+DEPLOYED_APP_NAME = os.environ.get("CHAI1_APP_NAME", app.name)
+
+
+def deployed_service(**options):
+    """Look up the Chai1Service of the deployed app, whose spawned calls outlive the caller process.
+
+    Options such as gpu and timeout override the ones of the class, see routing.service_options.
+    """
+    service = modal.Cls.from_name(DEPLOYED_APP_NAME, "Chai1Service")
+    if options:
+        service = service.with_options(**options)
+    return service()
+
+
+def deployed_function(name: str):
+    """Look up a function of the deployed app by name."""
+    return modal.Function.from_name(DEPLOYED_APP_NAME, name)
+
+
+def read_weights_manifest() -> dict:
+    """Read the manifest of the weights stored on the chai1-models volume, empty if there is none."""
+    import json
+
+    if not WEIGHTS_MANIFEST_FILE.exists():
+        return {}
+    return json.loads(WEIGHTS_MANIFEST_FILE.read_text())
+
+
+def stale_dependencies(manifest: dict) -> list:
+    """List the dependencies to download: missing files, files whose size differs from the manifest
+    (e.g. interrupted downloads), files recorded for another version and files whose recorded
+    checksum differs from the pinned one."""
+    stale = []
+    for dep in INFERENCE_DEPENDENCIES:
+        entry = manifest.get(dep)
+        local_path = models_dir / dep
+        if not local_path.exists():
+            stale.append(dep)
+        elif entry is not None and (
+            entry["version"] != CHAI_LAB_VERSION
+            or local_path.stat().st_size != entry["size"]
+            or WEIGHTS_SHA256[dep] not in (None, entry["sha256"])
+        ):
+            stale.append(dep)
+    return stale
+
+
+def weights_manifest_is_valid(manifest: dict) -> bool:
+    """Check that every dependency is in the manifest and matches the files on disk."""
+    return all(dep in manifest for dep in INFERENCE_DEPENDENCIES) and not stale_dependencies(manifest)
+
+
+def file_checksums(path: Path, algorithms: tuple = ("sha256",)) -> dict:
+    """Compute the checksums of a file with large reads, in one pass for all the algorithms."""
+    import hashlib
+
+    hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    with open(path, "rb") as f:
+        while chunk := f.read(DOWNLOAD_BUFFER_SIZE):
+            for h in hashes.values():
+                h.update(chunk)
+    return {algorithm: h.hexdigest() for algorithm, h in hashes.items()}
+
+
+def file_sha256(path: Path) -> str:
+    """Compute the SHA-256 checksum of a file with large reads."""
+    return file_checksums(path)["sha256"]
+
+
+def server_checksum(headers) -> tuple:
+    """Checksum advertised by the server in the response headers, as (algorithm, hex digest).
+
+    Looks at x-checksum-sha256, x-amz-checksum-sha256, the md5 of x-goog-hash and the ETag when it is
+    a plain SHA-256 or MD5 digest (single-part uploads). Returns (None, None) if there is none.
+    """
+    import base64
+    import re
+
+    if headers.get("x-checksum-sha256"):
+        return "sha256", headers["x-checksum-sha256"].strip().lower()
+    if headers.get("x-amz-checksum-sha256"):
+        return "sha256", base64.b64decode(headers["x-amz-checksum-sha256"]).hex()
+    for item in headers.get("x-goog-hash", "").split(","):
+        algorithm, _, value = item.strip().partition("=")
+        if algorithm == "md5" and value:
+            return "md5", base64.b64decode(value).hex()
+    etag = headers.get("ETag", "").strip().strip('"').lower()
+    if re.fullmatch(r"[0-9a-f]{64}", etag):
+        return "sha256", etag
+    if re.fullmatch(r"[0-9a-f]{32}", etag):
+        return "md5", etag
+    return None, None
+
+
+def update_weights_manifest(downloads: dict) -> dict:
+    """Record the name, size, SHA-256 checksum, version and verification of the weights on the volume.
+
+    Checksums of the files just downloaded are taken from `downloads` (dependency -> download_file stats),
+    the others are only computed for files missing from the manifest or resized. A file is verified if its
+    checksum matched the pinned one or the one advertised by the server.
+    """
+    manifest = read_weights_manifest()
+    for dep in INFERENCE_DEPENDENCIES:
+        local_path = models_dir / dep
+        if not local_path.exists():
+            manifest.pop(dep, None)
+            continue
+        size = local_path.stat().st_size
+        entry = manifest.get(dep)
+        if dep in downloads:
+            entry = {"name": dep, "size": size, "sha256": downloads[dep]["sha256"], "verified": downloads[dep]["verified"]}
+        elif entry is None or entry["size"] != size:
+            sha256 = file_sha256(local_path)
+            entry = {"name": dep, "size": size, "sha256": sha256, "verified": sha256 == WEIGHTS_SHA256[dep]}
+        entry["version"] = CHAI_LAB_VERSION
+        manifest[dep] = entry
+    WEIGHTS_MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
+    WEIGHTS_MANIFEST_FILE.write_text(json.dumps(manifest, indent=4))
+    return manifest
+
+
+async def fetch_inference_dependencies(force=False, base_url: str = WEIGHTS_BASE_URL) -> dict:
+    """Download the missing weights to the models volume and return the updated manifest.
+
+    `base_url` can point to a local HTTP server to test the downloader without the real assets.
+    """
     import asyncio
 
     import aiohttp
 
-    base_url = "https://chaiassets.com/chai1-inference-depencencies/"  # sic
-    inference_dependencies = [
-        "conformers_v1.apkl",
-        "models_v2/trunk.pt",
-        "models_v2/token_embedder.pt",
-        "models_v2/feature_embedding.pt",
-        "models_v2/diffusion_module.pt",
-        "models_v2/confidence_head.pt",
-    ]
+    inference_dependencies = INFERENCE_DEPENDENCIES
 
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
     }
 
     # launch downloads concurrently
-    async with aiohttp.ClientSession(headers=headers) as session:
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
         tasks = []
+        downloaded = []
+        manifest = read_weights_manifest()
+        stale = stale_dependencies(manifest)
         for dep in inference_dependencies:
             local_path = models_dir / dep
-            if force or not local_path.exists():
+            if force or dep in stale:
                 url = base_url + dep
+                # only a pinned or previously verified checksum is a reference, never the one of an unverified download
+                entry = manifest.get(dep)
+                expected_sha256 = WEIGHTS_SHA256[dep]
+                if expected_sha256 is None and entry and entry.get("verified") and entry["version"] == CHAI_LAB_VERSION:
+                    expected_sha256 = entry["sha256"]
                 print(f"🧬 downloading {dep}")
-                tasks.append(download_file(session, url, local_path))
+                tasks.append(download_file(session, url, local_path, expected_sha256=expected_sha256))
+                downloaded.append(dep)
 
         # run all of the downloads and await their completion
-        await asyncio.gather(*tasks)
+        stats = await asyncio.gather(*tasks)
+
+    return update_weights_manifest(dict(zip(downloaded, stats)))
+
+
+@app.function(volumes={models_dir: chai_model_volume})
+async def download_inference_dependencies(force=False) -> dict:
+    manifest = read_weights_manifest()
+    if not force and weights_manifest_is_valid(manifest):
+        return manifest  # nothing to download, no need to commit the volume
+
+    manifest = await fetch_inference_dependencies(force=force)
 
     chai_model_volume.commit()  # ensures models are visible on remote filesystem before exiting, otherwise takes a few seconds, racing with inference
+    return manifest
+
+
+async def download_file(
+    session,
+    url: str,
+    local_path: Path,
+    expected_sha256: str = None,
+    connections: int = DOWNLOAD_CONNECTIONS,
+    part_size: int = DOWNLOAD_PART_SIZE,
+    retries: int = DOWNLOAD_RETRIES,
+) -> dict:
+    """Download a file with concurrent HTTP range requests, resuming an interrupted download.
+
+    Data goes to `<name>.part`, the completed ranges are recorded in `<name>.part.json` and the
+    file is only renamed to `local_path` once complete and verified, so a partial file is never
+    taken for a downloaded one. Servers without range support, or not sending the size of the file,
+    are downloaded in one stream. A file whose size and checksum are both unknown is never finalized.
+
+    Args:
+        session (aiohttp.ClientSession): HTTP session
+        url (str): URL of the file
+        local_path (Path): Destination of the file
+        expected_sha256 (str, optional): SHA-256 to verify, the download is discarded on mismatch. The checksum
+            advertised by the server in the HEAD response, if any, is verified too.
+        connections (int, optional): Number of concurrent range requests for this file
+        part_size (int, optional): Size of each range request in bytes
+        retries (int, optional): Number of attempts per range before giving up
+
+    Returns:
+        dict: Size in bytes, duration in seconds, throughput in MB/s, SHA-256 of the file and whether it was
+            verified against a reference checksum
+    """
+    import asyncio
+    import json
+
+    import aiohttp
 
+    start = time.perf_counter()
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = local_path.with_name(local_path.name + ".part")
+    progress_path = local_path.with_name(local_path.name + ".part.json")
 
-async def download_file(session, url: str, local_path: Path):
-    async with session.get(url) as response:
+    async with session.head(url, allow_redirects=True) as response:
         response.raise_for_status()
-        local_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(local_path, "wb") as f:
-            while chunk := await response.content.read(8192):
-                f.write(chunk)
\ No newline at end of file
+        size = int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+        server_algorithm, server_digest = server_checksum(response.headers)
+    # Range requests need the size of the file, servers not sending it are downloaded in one stream
+    accepts_ranges = bool(size) and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    # Resume from the ranges completed by a previous attempt on the same file size
+    progress = {"size": size, "done": []}
+    if progress_path.exists() and part_path.exists():
+        previous = json.loads(progress_path.read_text())
+        if previous["size"] == size:
+            progress = previous
+    if progress["done"]:
+        print(f"🧬 resuming {local_path.name}, {len(progress['done'])} parts already downloaded")
+    elif part_path.exists():
+        part_path.unlink()
+    with open(part_path, "ab") as f:
+        f.truncate(size or 0)  # preallocate so that parts can be written at their offset
+
+    fd = os.open(part_path, os.O_WRONLY)
+    progress_lock = asyncio.Lock()
+
+    async def write_at(data: bytes, offset: int):
+        await asyncio.to_thread(os.pwrite, fd, data, offset)  # keep disk writes off the event loop
+
+    async def fetch_range(first: int, last: int, semaphore: asyncio.Semaphore):
+        offset = first
+        async with semaphore:
+            for attempt in range(retries):
+                try:
+                    headers = {"Range": f"bytes={offset}-{last}"} if accepts_ranges else {}
+                    async with session.get(url, headers=headers) as response:
+                        response.raise_for_status()
+                        if accepts_ranges and response.status != 206:
+                            raise aiohttp.ClientPayloadError(f"expected a partial response, got {response.status}")
+                        if size is None and "Content-Length" in response.headers:
+                            progress["size"] = int(response.headers["Content-Length"])  # size known from the stream only
+                        buffer = bytearray()
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_BUFFER_SIZE):
+                            buffer += chunk
+                            if len(buffer) >= DOWNLOAD_BUFFER_SIZE:
+                                await write_at(bytes(buffer), offset)
+                                offset += len(buffer)
+                                buffer.clear()
+                        if buffer:
+                            await write_at(bytes(buffer), offset)
+                            offset += len(buffer)
+                    if accepts_ranges and offset != last + 1:
+                        raise aiohttp.ClientPayloadError(f"range {first}-{last} ended at {offset}")
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == retries - 1:
+                        raise
+                    if not accepts_ranges:
+                        offset = first  # no way to resume within a plain stream
+                    print(f"🧬 retrying {local_path.name} from byte {offset} after error: {e}")
+                    await asyncio.sleep(2**attempt)
+        async with progress_lock:
+            progress["done"].append(first)
+            await asyncio.to_thread(progress_path.write_text, json.dumps(progress))
+
+    try:
+        if accepts_ranges:
+            semaphore = asyncio.Semaphore(connections)
+            ranges = [
+                (first, min(first + part_size, size) - 1)
+                for first in range(0, size, part_size)
+                if first not in progress["done"]
+            ]
+            await asyncio.gather(*(fetch_range(first, last, semaphore) for first, last in ranges))
+        else:
+            await fetch_range(0, None, asyncio.Semaphore(1))
+    finally:
+        os.close(fd)
+    size = progress["size"]
+
+    # Verify the file against the pinned and the server checksums before making it visible under its final name
+    references = [("sha256", expected_sha256, "pinned"), (server_algorithm, server_digest, "server")]
+    references = [(algorithm, digest, source) for algorithm, digest, source in references if digest is not None]
+    algorithms = tuple({"sha256"} | {algorithm for algorithm, _, _ in references})
+    checksums = await asyncio.to_thread(file_checksums, part_path, algorithms)
+    if size is not None and part_path.stat().st_size != size:
+        raise IOError(f"{local_path.name} has {part_path.stat().st_size} bytes, expected {size}")
+    if size is None and not references:
+        part_path.unlink()
+        progress_path.unlink(missing_ok=True)
+        raise IOError(f"neither the size nor a checksum of {local_path.name} is known, the download cannot be verified")
+    for algorithm, digest, source in references:
+        if checksums[algorithm] != digest:
+            part_path.unlink()
+            progress_path.unlink(missing_ok=True)
+            raise IOError(f"{algorithm} mismatch for {local_path.name}: got {checksums[algorithm]}, expected {digest} ({source})")
+    if not references:
+        print(f"🧬 no reference checksum for {local_path.name}, recorded as unverified")
+    os.replace(part_path, local_path)
+    progress_path.unlink(missing_ok=True)
+
+    seconds = time.perf_counter() - start
+    downloaded_bytes = local_path.stat().st_size
+    throughput = downloaded_bytes / 1e6 / max(seconds, 1e-9)
+    print(f"🧬 downloaded {local_path.name}: {downloaded_bytes / 1e6:.1f} MB in {seconds:.1f}s ({throughput:.1f} MB/s)")
+    return {
+        "bytes": downloaded_bytes,
+        "seconds": seconds,
+        "throughput_mb_s": throughput,
+        "sha256": checksums["sha256"],
+        "verified": bool(references),
+    }
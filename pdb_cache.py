@@ -0,0 +1,250 @@
+# Import libraries
+from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor
+import hashlib
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from structure_format import read_structure, strip_structure_suffix
+
+# Define parameters for the CIF to PDB conversion cache
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+PDB_CACHE_DIR = results_dir / "cache" / "pdb"  # one <sha256 of the CIF file>/<name>.pdb per converted structure
+PDB_CACHE_MAX_ENTRIES = int(os.environ.get("CHAI1_PDB_CACHE_MAX_ENTRIES", 500))
+PDB_CACHE_MAX_BYTES = int(os.environ.get("CHAI1_PDB_CACHE_MAX_BYTES", 1024**3))
+PDB_CONVERSION_WORKERS = int(os.environ.get("CHAI1_PDB_CONVERSION_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Level of detail: large structures are first shown as a trace or a backbone, then with all their atoms
+LOD_BACKBONE_ATOMS = int(os.environ.get("CHAI1_LOD_BACKBONE_ATOMS", 10_000))  # above, the backbone comes first
+LOD_TRACE_ATOMS = int(os.environ.get("CHAI1_LOD_TRACE_ATOMS", 50_000))  # above, the CA/P trace comes first
+DETAIL_SUFFIXES = {"trace": ".trace.pdb", "backbone": ".backbone.pdb", "full": ".pdb"}
+TRACE_ATOMS = {"CA", "P"}
+BACKBONE_ATOMS = {"N", "CA", "C", "O", "P", "OP1", "OP2", "O5'", "C5'", "C4'", "C3'", "O3'"}
+
+_lock = threading.Lock()  # Gradio runs handlers in worker threads
+_pool = None  # created on the first batch conversion
+
+
+def content_hash(cif_file: Path) -> str:
+    """SHA-256 of the content of a structure file, so that a changed file never gets a stale PDB."""
+    digest = hashlib.sha256()
+    with open(cif_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _detail_of(pdb_file: Path) -> str:
+    for detail in ["trace", "backbone"]:
+        if pdb_file.name.endswith(DETAIL_SUFFIXES[detail]):
+            return detail
+    return "full"
+
+
+def _cached_pdb_file(key: str, detail: str = "full"):
+    """Return the cached PDB file of a content hash and mark it as recently used, None on a miss."""
+    for pdb_file in (PDB_CACHE_DIR / key).glob("*.pdb"):
+        if _detail_of(pdb_file) == detail:
+            os.utime(pdb_file)  # the modification time orders the eviction
+            return pdb_file
+    return None
+
+
+def _coarsen(structure, detail: str):
+    """Keep the CA/P trace or the backbone of the polymer residues, ligands are kept whole."""
+    names = TRACE_ATOMS if detail == "trace" else BACKBONE_ATOMS
+    for model in structure:
+        for chain in model:
+            for residue in chain:
+                if residue.het_flag == "H":
+                    continue
+                for ii in reversed(range(len(residue))):
+                    if residue[ii].name not in names:
+                        del residue[ii]
+    structure.remove_empty_chains()
+
+
+def _write_pdb(structure, pdb_file: str, detail: str = "full"):
+    if detail != "full":
+        structure = structure.clone()
+        _coarsen(structure, detail)
+    tmp_file = Path(pdb_file).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    structure.write_minimal_pdb(str(tmp_file))
+    tmp_file.replace(pdb_file)  # atomic, the viewer never reads a partial file
+
+
+def _convert_file(cif_file: str, pdb_file: str, detail: str = "full") -> str:
+    """Convert one structure file to PDB. Top-level so that the process pool can pickle it."""
+    _write_pdb(read_structure(cif_file), pdb_file, detail)
+    return pdb_file
+
+
+def _target_pdb_file(cif_file: Path, key: str, detail: str = "full") -> Path:
+    pdb_file = PDB_CACHE_DIR / key / (strip_structure_suffix(cif_file).name + DETAIL_SUFFIXES[detail])
+    pdb_file.parent.mkdir(parents=True, exist_ok=True)
+    return pdb_file
+
+
+def detail_levels(atom_count: int) -> list:
+    """Levels of detail to render in order for a structure of atom_count atoms, the last one is always "full"."""
+    if atom_count > LOD_TRACE_ATOMS:
+        return ["trace", "full"]
+    if atom_count > LOD_BACKBONE_ATOMS:
+        return ["backbone", "full"]
+    return ["full"]
+
+
+def iter_pdb_levels(cif_file, detail: str = "auto"):
+    """Convert a structure file to PDB level by level, coarsest first, reusing the cached conversions.
+
+    The structure is read with gemmi at most once. Payload size and time since the call are logged
+    for each level, the first one being the time to first render in the viewer.
+
+    Args:
+        cif_file (str or Path): mmCIF file, possibly zstd or gzip compressed
+        detail (str, optional): "auto" to follow detail_levels, or one of "trace", "backbone" and "full". Default is "auto".
+
+    Yields:
+        str: Path to the PDB file of each level in results/cache/pdb
+    """
+    start = time.perf_counter()
+    cif_file = Path(cif_file)
+    key = content_hash(cif_file)
+    structure = None
+
+    if detail == "auto":
+        count_file = PDB_CACHE_DIR / key / "atom_count"
+        if count_file.exists():
+            atom_count = int(count_file.read_text())
+        else:
+            structure = read_structure(cif_file)
+            atom_count = structure[0].count_atom_sites()
+            count_file.parent.mkdir(parents=True, exist_ok=True)
+            count_file.write_text(str(atom_count))
+        levels = detail_levels(atom_count)
+    elif detail in DETAIL_SUFFIXES:
+        levels = [detail]
+    else:
+        raise ValueError(f"Unknown level of detail {detail!r}, expected auto or one of {list(DETAIL_SUFFIXES)}")
+
+    for level in levels:
+        pdb_file = _cached_pdb_file(key, level)
+        if pdb_file is None:
+            if structure is None:
+                structure = read_structure(cif_file)
+            pdb_file = _target_pdb_file(cif_file, key, level)
+            _write_pdb(structure, str(pdb_file), level)
+        print(
+            f"🧬 {level} PDB of {cif_file.name}: {pdb_file.stat().st_size / 1024:.0f} KiB "
+            f"ready after {time.perf_counter() - start:.2f}s"
+        )
+        yield str(pdb_file)
+    evict()
+
+
+def to_pdb(cif_file, detail: str = "full") -> str:
+    """Convert a structure file to PDB for the Molecule3D viewer, reusing the cached conversion of identical content.
+
+    Args:
+        cif_file (str or Path): mmCIF file, possibly zstd or gzip compressed
+        detail (str, optional): "full", "backbone", "trace", or "auto" for the first level of detail_levels. Default is "full".
+
+    Returns:
+        str: Path to the PDB file in results/cache/pdb
+    """
+    levels = iter_pdb_levels(cif_file, detail)
+    pdb_file = next(levels)
+    levels.close()
+    evict()
+    return pdb_file
+
+
+def benchmark_levels(cif_file) -> dict:
+    """Measure the payload size and conversion time of each level of detail of a structure, without the cache.
+
+    Returns:
+        dict: Level -> atoms, payload bytes and seconds to read and convert the structure
+    """
+    import tempfile
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for level in DETAIL_SUFFIXES:
+            pdb_file = Path(tmp_dir) / f"structure{DETAIL_SUFFIXES[level]}"
+            start = time.perf_counter()
+            _convert_file(str(cif_file), str(pdb_file), level)
+            seconds = time.perf_counter() - start
+            report[level] = {
+                "atoms": sum(line.startswith(("ATOM", "HETATM")) for line in pdb_file.read_text().splitlines()),
+                "payload_bytes": pdb_file.stat().st_size,
+                "seconds": seconds,
+            }
+            print(f"🧬 {level:>8}: {report[level]['atoms']} atoms, {report[level]['payload_bytes'] / 1024:.0f} KiB, {seconds:.2f}s")
+    return report
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn rather than fork, the Gradio process runs many threads
+            _pool = ProcessPoolExecutor(
+                max_workers=PDB_CONVERSION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def to_pdb_many(cif_files: list, wait: bool = True) -> list:
+    """Convert many structure files to PDB in a process pool, off the Gradio threads.
+
+    Args:
+        cif_files (list): mmCIF files, possibly zstd or gzip compressed
+        wait (bool, optional): Wait for the conversions. If False, they warm the cache in the
+            background and the futures are returned. Default is True.
+
+    Returns:
+        list: Paths to the PDB files, or futures resolving to them if wait is False
+    """
+    results = []
+    for cif_file in map(Path, cif_files):
+        key = content_hash(cif_file)
+        pdb_file = _cached_pdb_file(key)
+        if pdb_file is not None:
+            future = Future()
+            future.set_result(str(pdb_file))
+        else:
+            pdb_file = _target_pdb_file(cif_file, key)
+            future = _get_pool().submit(_convert_file, str(cif_file), str(pdb_file))
+            future.add_done_callback(lambda _: evict())
+        results.append(future)
+    if not wait:
+        return results
+    return [future.result() for future in results]
+
+
+def evict():
+    """Delete the least recently used conversions until the size limits hold."""
+    with _lock:
+        entries = []
+        for entry_dir in PDB_CACHE_DIR.glob("*"):
+            pdb_files = list(entry_dir.glob("*.pdb"))
+            if not pdb_files:
+                continue
+            last_use = max(f.stat().st_mtime for f in pdb_files)
+            entries.append((last_use, sum(f.stat().st_size for f in pdb_files), entry_dir))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > PDB_CACHE_MAX_ENTRIES or total_bytes > PDB_CACHE_MAX_BYTES):
+            _, size, entry_dir = entries.pop(0)
+            total_bytes -= size
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for cif_file in sys.argv[1:]:
+        benchmark_levels(cif_file)
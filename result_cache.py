@@ -0,0 +1,204 @@
+# Import libraries
+from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+import time
+from structure_format import cif_file_name, find_cif_file, pdb_file_name
+
+# Define parameters for the result cache
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+CACHE_INDEX_FILE = results_dir / "cache" / "index.json"
+CACHE_MAX_ENTRIES = int(os.environ.get("CHAI1_CACHE_MAX_ENTRIES", 200))
+CACHE_MAX_AGE_DAYS = float(os.environ.get("CHAI1_CACHE_MAX_AGE_DAYS", 30))
+CACHE_MAX_BYTES = int(os.environ.get("CHAI1_CACHE_MAX_BYTES", 2 * 1024**3))
+
+_lock = threading.Lock()  # Gradio runs handlers in worker threads
+
+
+def normalize_fasta(fasta_content: str) -> str:
+    """Normalize a FASTA string so that formatting differences don't change the cache key.
+
+    Headers are kept as-is (they carry the molecule type), sequence lines are joined,
+    stripped of whitespace and upper-cased. SMILES records are kept case-sensitive.
+
+    Args:
+        fasta_content (str): Raw FASTA content
+
+    Returns:
+        str: Normalized FASTA content
+    """
+    records = []
+    header, sequence = None, []
+    for line in fasta_content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(">"):
+            if header is not None:
+                records.append((header, "".join(sequence)))
+            header, sequence = line, []
+        else:
+            sequence.append("".join(line.split()))
+    if header is not None:
+        records.append((header, "".join(sequence)))
+
+    normalized = []
+    for header, sequence in records:
+        if not header[1:].lower().startswith("ligand"):
+            sequence = sequence.upper()
+        normalized.append(f"{header}\n{sequence}")
+    return "\n".join(normalized)
+
+
+def canonicalize_config(inference_config: dict) -> str:
+    """Serialize an inference config in a canonical form (sorted keys, no whitespace).
+
+    Args:
+        inference_config (dict): Chai-1 inference parameters, seed included
+
+    Returns:
+        str: Canonical JSON string
+    """
+    return json.dumps(inference_config, sort_keys=True, separators=(",", ":"))
+
+
+def compute_cache_key(fasta_content: str, inference_config: dict) -> str:
+    """Compute the content-addressed key of a Chai-1 job.
+
+    Args:
+        fasta_content (str): Raw FASTA content
+        inference_config (dict): Chai-1 inference parameters
+
+    Returns:
+        str: SHA-256 hex digest of the normalized FASTA and canonical config
+    """
+    payload = normalize_fasta(fasta_content) + "\n#config\n" + canonicalize_config(inference_config)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def run_files(run_id: str, number_of_models: int):
+    """List the score and CIF files written locally for a run, whatever the storage format of the CIF files."""
+    files = []
+    for ii in range(number_of_models):
+        files.append(Path(results_dir, "score") / f"{run_id}-scores.model_idx_{ii}.npz")
+        molecules_dir = Path(results_dir, "molecules")
+        files.append(find_cif_file(molecules_dir, run_id, ii) or molecules_dir / cif_file_name(run_id, ii, "text"))
+    return files
+
+
+def _read_index() -> dict:
+    if not CACHE_INDEX_FILE.exists():
+        return {}
+    try:
+        return json.loads(CACHE_INDEX_FILE.read_text())
+    except json.JSONDecodeError:
+        print("🧬 result cache index is corrupted, starting from an empty cache")
+        return {}
+
+
+def _write_index(index: dict):
+    CACHE_INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = CACHE_INDEX_FILE.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(index, indent=4))
+    tmp_file.replace(CACHE_INDEX_FILE)  # atomic, readers never see a partial index
+
+
+def entries() -> dict:
+    """Return all the cache entries by cache key."""
+    with _lock:
+        return _read_index()
+
+
+def lookup(cache_key: str) -> Optional[dict]:
+    """Return the cache entry of a job if all of its result files are still on disk.
+
+    Args:
+        cache_key (str): Key from compute_cache_key
+
+    Returns:
+        dict or None: Cache entry with the run_id and number of models, None on a miss
+    """
+    with _lock:
+        index = _read_index()
+        entry = index.get(cache_key)
+        if entry is None:
+            return None
+        # Only the score files are required, missing CIF files are fetched from the chai1-preds volume
+        score_files = [f for f in run_files(entry["run_id"], entry["number_of_models"]) if f.suffix == ".npz"]
+        if not all(f.exists() for f in score_files):
+            print(f"🧬 result cache entry {cache_key[:12]} has missing files, dropping it")
+            del index[cache_key]
+            _write_index(index)
+            return None
+        entry["last_used"] = time.time()
+        entry["hits"] = entry.get("hits", 0) + 1
+        _write_index(index)
+        return entry
+
+
+def store(cache_key: str, run_id: str, number_of_models: int, inference_config: dict):
+    """Record the result files of a finished run and apply the eviction policy.
+
+    Args:
+        cache_key (str): Key from compute_cache_key
+        run_id (str): Run identifier of the stored results
+        number_of_models (int): Number of score/CIF pairs written for the run
+        inference_config (dict): Inference parameters, stored for reference
+    """
+    size = sum(f.stat().st_size for f in run_files(run_id, number_of_models) if f.exists())
+    now = time.time()
+    with _lock:
+        index = _read_index()
+        index[cache_key] = {
+            "run_id": run_id,
+            "number_of_models": number_of_models,
+            "inference_config": inference_config,
+            "bytes": size,
+            "created": now,
+            "last_used": now,
+            "hits": 0,
+        }
+        _evict(index, now, keep=cache_key)
+        _write_index(index)
+
+
+def _evict(index: dict, now: float, keep: Optional[str] = None):
+    """Drop expired entries, then least recently used ones until the size limits hold.
+
+    The result files of an evicted run are deleted from results/, together with its rows in the
+    score index and the job table, which would otherwise point to missing files. The entry being
+    stored (`keep`) and the entries sharing its run are never evicted, even if it is over the limits alone.
+    """
+    import jobs
+    import score_index
+
+    kept_run_id = index[keep]["run_id"] if keep in index else None
+    candidates = [key for key in index if key != keep and index[key]["run_id"] != kept_run_id]
+    evicted = [
+        key for key in candidates
+        if now - index[key]["created"] > CACHE_MAX_AGE_DAYS * 24 * 3600
+    ]
+    by_last_use = sorted(
+        (key for key in candidates if key not in evicted), key=lambda key: index[key]["last_used"]
+    )
+    kept = [key for key in index if key not in candidates]
+    total_bytes = sum(index[key]["bytes"] for key in by_last_use + kept)
+    while by_last_use and (len(by_last_use) + len(kept) > CACHE_MAX_ENTRIES or total_bytes > CACHE_MAX_BYTES):
+        key = by_last_use.pop(0)
+        total_bytes -= index[key]["bytes"]
+        evicted.append(key)
+
+    run_ids = []
+    for key in evicted:
+        entry = index.pop(key)
+        print(f"🧬 evicting run {entry['run_id']} from the result cache")
+        for f in run_files(entry["run_id"], entry["number_of_models"]):
+            f.unlink(missing_ok=True)
+            pdb_file_name(f).unlink(missing_ok=True)  # converted next to the CIF files before the PDB cache
+        run_ids.append(entry["run_id"])
+    score_index.remove_runs(run_ids)
+    jobs.remove_jobs(run_ids)
@@ -0,0 +1,141 @@
+# Import libraries
+from pathlib import Path
+from typing import Optional
+import json
+import os
+import re
+import threading
+import time
+
+# Define parameters for the routing of the jobs
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+ROUTING_LOG_FILE = results_dir / "routing" / "routing.jsonl"
+ROUTING_TABLE_FILE = os.environ.get("CHAI1_ROUTING_TABLE")  # JSON file replacing DEFAULT_ROUTING_TABLE
+
+# Cost table: the first class whose max_tokens covers the input is used. Chai-1 handles up to 2048 tokens.
+# batch_size is the number of jobs of the class sent to one container call by the batch tools.
+DEFAULT_ROUTING_TABLE = [
+    {"name": "small", "max_tokens": 512, "gpu": "L40S", "timeout_minutes": 15, "batch_size": 4},
+    {"name": "medium", "max_tokens": 1024, "gpu": "A100-80GB", "timeout_minutes": 30, "batch_size": 2},
+    {"name": "large", "max_tokens": 2048, "gpu": "H100", "timeout_minutes": 60, "batch_size": 1},
+]
+
+# Atoms of a SMILES string: bracket atoms, two-letter halogens, organic subset and aromatic atoms
+SMILES_ATOM = re.compile(r"\[[^\]]+\]|Br|Cl|[BCNOPSFI]|[bcnops]")
+
+_lock = threading.Lock()  # Gradio runs handlers in worker threads
+
+
+def load_routing_table() -> list:
+    """Read the cost table from CHAI1_ROUTING_TABLE if set, sorted by max_tokens."""
+    table = DEFAULT_ROUTING_TABLE
+    if ROUTING_TABLE_FILE:
+        table = json.loads(Path(ROUTING_TABLE_FILE).read_text())
+    return sorted(table, key=lambda row: row["max_tokens"])
+
+
+def count_tokens(fasta_content: str) -> dict:
+    """Count the Chai-1 tokens of a FASTA input: one per residue or nucleotide, one per heavy atom of a ligand.
+
+    Args:
+        fasta_content (str): FASTA content with protein, dna, rna or ligand (SMILES) records
+
+    Returns:
+        dict: Number of tokens per record type and in total
+    """
+    counts = {}
+    for record in fasta_content.strip().split(">")[1:]:
+        header, _, sequence = record.partition("\n")
+        entity_type = header.split("|")[0].strip().lower()
+        sequence = "".join(sequence.split())
+        if entity_type == "ligand":
+            tokens = sum(atom.upper() not in ("[H]", "H") for atom in SMILES_ATOM.findall(sequence))
+        else:
+            tokens = len(sequence)
+        counts[entity_type] = counts.get(entity_type, 0) + tokens
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+def route(fasta_content: str, table: Optional[list] = None) -> dict:
+    """Pick the GPU class, timeout and batch size of a job from the cost table.
+
+    Inputs larger than every class go to the last one.
+
+    Returns:
+        dict: The class of the cost table with the token counts of the input
+    """
+    table = table or load_routing_table()
+    tokens = count_tokens(fasta_content)
+    for row in table:
+        if tokens["total"] <= row["max_tokens"]:
+            break
+    decision = {**row, "tokens": tokens}
+    print(f"🧬 routing {tokens['total']} tokens to {row['name']} ({row['gpu']}, {row['timeout_minutes']} min)")
+    return decision
+
+
+def service_options(decision: dict, jobs_per_call: int = 1) -> dict:
+    """Modal options of Chai1Service for a routing decision, the timeout covering jobs_per_call jobs."""
+    return {"gpu": decision["gpu"], "timeout": int(decision["timeout_minutes"] * 60 * jobs_per_call)}
+
+
+def log_route(run_id: str, decision: dict, latency_seconds: float, inference_seconds: Optional[float] = None, status: str = "completed"):
+    """Append a routing decision and its latency to results/routing/routing.jsonl.
+
+    Args:
+        run_id (str): Unique identifier for the inference run
+        decision (dict): Routing decision from route
+        latency_seconds (float): Wall time of the remote call seen by the client
+        inference_seconds (float, optional): Time of the inference in the container, from the service timings
+        status (str, optional): "completed", "failed" or "timeout". Default is "completed".
+    """
+    record = {
+        "run_id": run_id,
+        "class": decision["name"],
+        "gpu": decision["gpu"],
+        "timeout_minutes": decision["timeout_minutes"],
+        "tokens": decision["tokens"]["total"],
+        "latency_seconds": round(latency_seconds, 2),
+        "inference_seconds": None if inference_seconds is None else round(inference_seconds, 2),
+        "status": status,
+        "time": time.time(),
+    }
+    with _lock:
+        ROUTING_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(ROUTING_LOG_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def routing_report() -> dict:
+    """Summarize the routing log per class, to tune the cost table.
+
+    Returns:
+        dict: Per class: number of calls, failures, token range and p50/p95 latency and inference time
+    """
+    if not ROUTING_LOG_FILE.exists():
+        return {}
+    with _lock:
+        records = [json.loads(line) for line in ROUTING_LOG_FILE.read_text().splitlines() if line.strip()]
+
+    def percentile(values, q):
+        values = sorted(v for v in values if v is not None)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+    report = {}
+    for name in sorted({record["class"] for record in records}):
+        selected = [record for record in records if record["class"] == name]
+        completed = [record for record in selected if record["status"] == "completed"]
+        report[name] = {
+            "calls": len(selected),
+            "failures": len(selected) - len(completed),
+            "gpus": sorted({record["gpu"] for record in selected}),
+            "min_tokens": min(record["tokens"] for record in selected),
+            "max_tokens": max(record["tokens"] for record in selected),
+            "p50_latency_seconds": percentile([r["latency_seconds"] for r in completed], 0.5),
+            "p95_latency_seconds": percentile([r["latency_seconds"] for r in completed], 0.95),
+            "p50_inference_seconds": percentile([r["inference_seconds"] for r in completed], 0.5),
+            "p95_inference_seconds": percentile([r["inference_seconds"] for r in completed], 0.95),
+        }
+    return report
@@ -0,0 +1,179 @@
+# Import libraries
+from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import sqlite3
+import time
+from result_cache import normalize_fasta
+from structure_format import cif_file_name, find_cif_file
+
+# Define parameters for the score index
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+INDEX_FILE = results_dir / "score_index.sqlite"
+METRICS = ["aggregate_score", "ptm", "iptm"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    run_id TEXT NOT NULL,
+    model_index INTEGER NOT NULL,
+    sequence_hash TEXT,
+    config TEXT,
+    aggregate_score REAL,
+    ptm REAL,
+    iptm REAL,
+    has_inter_chain_clashes INTEGER,
+    cif_file TEXT,
+    created REAL,
+    PRIMARY KEY (run_id, model_index)
+);
+CREATE INDEX IF NOT EXISTS models_sequence ON models (sequence_hash, aggregate_score);
+CREATE INDEX IF NOT EXISTS models_aggregate_score ON models (aggregate_score);
+CREATE INDEX IF NOT EXISTS models_iptm ON models (iptm);
+"""
+
+
+def connect() -> sqlite3.Connection:
+    """Open the index, creating it if needed. One connection per call keeps Gradio threads independent."""
+    INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(INDEX_FILE, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+    connection.executescript(SCHEMA)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def sequence_hash(fasta_content: str) -> str:
+    """Hash of the normalized FASTA content, identifying the same input across runs."""
+    return hashlib.sha256(normalize_fasta(fasta_content).encode()).hexdigest()
+
+
+def add_model(
+    run_id: str,
+    model_index: int,
+    scores: dict,
+    seq_hash: Optional[str],
+    inference_config: Optional[dict],
+    cif_file: str,
+):
+    """Add (or replace) the scores of one model in the index.
+
+    Args:
+        run_id (str): Unique identifier for the inference run
+        model_index (int): Index of the model in the run
+        scores (dict): Score arrays of the model, as in the scores.model_idx_N.npz files
+        seq_hash (str, optional): Hash of the input, from sequence_hash
+        inference_config (dict, optional): Inference parameters of the run
+        cif_file (str): CIF file name of the model
+    """
+    with connect() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                model_index,
+                seq_hash,
+                json.dumps(inference_config, sort_keys=True) if inference_config is not None else None,
+                float(scores["aggregate_score"][0]),
+                float(scores["ptm"][0]),
+                float(scores["iptm"][0]),
+                int(bool(scores["has_inter_chain_clashes"][0])),
+                cif_file,
+                time.time(),
+            ),
+        )
+
+
+def query(
+    seq_hash: Optional[str] = None,
+    metric: str = "aggregate_score",
+    top_k: Optional[int] = None,
+    include_clashes: bool = False,
+    min_scores: Optional[dict] = None,
+    config_filter: Optional[dict] = None,
+) -> list:
+    """Rank and filter the indexed models.
+
+    Args:
+        seq_hash (str, optional): Only models of this input
+        metric (str, optional): Metric to rank by, among aggregate_score, ptm and iptm. Default is "aggregate_score".
+        top_k (int, optional): Maximum number of models to return
+        include_clashes (bool, optional): Keep models with inter-chain clashes. Default is False.
+        min_scores (dict, optional): Minimum value per metric, e.g. {"iptm": 0.8}
+        config_filter (dict, optional): Required config values, e.g. {"seed": 42}
+
+    Returns:
+        list: Rows of the index as dicts, best first
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+    conditions, parameters = [], []
+    if seq_hash:
+        conditions.append("sequence_hash = ?")
+        parameters.append(seq_hash)
+    if not include_clashes:
+        conditions.append("has_inter_chain_clashes = 0")
+    for name, value in (min_scores or {}).items():
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric {name!r}, expected one of {METRICS}")
+        conditions.append(f"{name} >= ?")
+        parameters.append(value)
+    for key, value in (config_filter or {}).items():
+        conditions.append("json_extract(config, ?) = ?")
+        parameters.extend([f"$.{key}", value])
+
+    sql = "SELECT * FROM models"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {metric} DESC"
+    if top_k:
+        sql += " LIMIT ?"
+        parameters.append(int(top_k))
+
+    with connect() as connection:
+        rows = [dict(row) for row in connection.execute(sql, parameters)]
+    for row in rows:
+        row["config"] = json.loads(row["config"]) if row["config"] else None
+    return rows
+
+
+def remove_runs(run_ids: list) -> int:
+    """Remove the models of runs whose result files were deleted, e.g. evicted from the result cache.
+
+    Returns:
+        int: Number of models removed
+    """
+    if not run_ids:
+        return 0
+    with connect() as connection:
+        cursor = connection.execute(
+            f"DELETE FROM models WHERE run_id IN ({', '.join('?' * len(run_ids))})", list(run_ids)
+        )
+    return cursor.rowcount
+
+
+def rebuild(cache_index: Optional[dict] = None) -> int:
+    """Index the score files already in results/score that are missing from the index.
+
+    Configs are recovered from the result cache entries when available, sequence hashes are unknown.
+
+    Returns:
+        int: Number of models added
+    """
+    from numpy import load
+
+    configs = {entry["run_id"]: entry["inference_config"] for entry in (cache_index or {}).values()}
+    with connect() as connection:
+        indexed = {(row[0], row[1]) for row in connection.execute("SELECT run_id, model_index FROM models")}
+    added = 0
+    for score_file in sorted(Path(results_dir, "score").glob("*-scores.model_idx_*.npz")):
+        run_id, _, model_index = score_file.stem.partition("-scores.model_idx_")
+        if (run_id, int(model_index)) in indexed:
+            continue
+        cif_file = find_cif_file(Path(results_dir, "molecules"), run_id, int(model_index))
+        cif_file = cif_file.name if cif_file else cif_file_name(run_id, int(model_index), "text")
+        add_model(run_id, int(model_index), load(str(score_file)), None, configs.get(run_id), cif_file)
+        added += 1
+    print(f"🧬 added {added} models to the score index")
+    return added
@@ -0,0 +1,140 @@
+# Import libraries
+from pathlib import Path
+import numpy as np
+from structure_format import decode_structure, fetch_cif_file
+
+# Define parameters for the structural comparison of the models
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+COORDINATES_DIR = results_dir / "cache" / "coordinates"  # one <run_id>-<model_index>.npy array per model
+REPRESENTATIVE_ATOMS = ["CA", "P"]  # one atom per residue or nucleotide of the polymer chains
+PAIR_BATCH_BYTES = 64 * 1024**2  # size of the coordinate blocks of a batch of pairs
+
+
+def load_coordinates(cif_file) -> np.ndarray:
+    """Read the CA/P coordinates of the polymer chains of a structure file into a float32 array.
+
+    The atom_site columns are read straight from the mmCIF table, without building a gemmi
+    structure or looping over the atoms in Python.
+
+    Args:
+        cif_file (str or Path): mmCIF file, possibly zstd or gzip compressed
+
+    Returns:
+        np.ndarray: (number of residues, 3) coordinates in chain order
+    """
+    import gemmi
+
+    block = gemmi.cif.read_string(decode_structure(Path(cif_file).read_bytes())).sole_block()
+
+    def column(name):
+        return np.array(list(block.find_values(f"_atom_site.{name}")))
+
+    mask = (column("group_PDB") == "ATOM") & np.isin(column("label_atom_id"), REPRESENTATIVE_ATOMS)
+    model_numbers = column("pdbx_PDB_model_num")
+    if len(model_numbers):
+        mask &= model_numbers == model_numbers[0]  # first model only
+    return np.stack([column(f"Cartn_{axis}")[mask].astype(np.float32) for axis in "xyz"], axis=1)
+
+
+def model_coordinates(run_id: str, model_index: int) -> np.ndarray:
+    """CA/P coordinates of a model, cached as a .npy file in results/cache/coordinates."""
+    cache_file = COORDINATES_DIR / f"{run_id}-{model_index}.npy"
+    if cache_file.exists():
+        return np.load(cache_file)
+    coordinates = load_coordinates(fetch_cif_file(run_id, model_index))
+    COORDINATES_DIR.mkdir(parents=True, exist_ok=True)
+    np.save(cache_file, coordinates)
+    return coordinates
+
+
+def pairwise_similarity(coordinates: np.ndarray):
+    """Superposed RMSD and TM-like score of every pair of models, computed in vectorized batches of pairs.
+
+    Each pair is superposed with the Kabsch algorithm (batched SVD of the 3x3 covariance matrices).
+    The TM-like score uses the TM-score weighting on the RMSD-optimal superposition.
+
+    Args:
+        coordinates (np.ndarray): (number of models, number of atoms, 3) coordinates, same atoms in the same order
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (models, models) RMSD in Angstrom and TM-like score between 0 and 1
+    """
+    centered = coordinates - coordinates.mean(axis=1, keepdims=True)
+    number_of_models, number_of_atoms = centered.shape[:2]
+    d0 = max(0.5, 1.24 * np.cbrt(max(number_of_atoms, 19) - 15) - 1.8)
+
+    rmsd = np.zeros((number_of_models, number_of_models), dtype=np.float32)
+    tm = np.ones((number_of_models, number_of_models), dtype=np.float32)
+    first, second = np.triu_indices(number_of_models, k=1)
+    batch_size = max(1, PAIR_BATCH_BYTES // (number_of_atoms * 3 * 4 * 3))
+    for start in range(0, len(first), batch_size):
+        i, j = first[start:start + batch_size], second[start:start + batch_size]
+        a, b = centered[i], centered[j]
+
+        # Optimal rotation of a onto b: R^T = U diag(1, 1, d) V^T with a^T b = U S V^T
+        u, _, vt = np.linalg.svd(np.einsum("pni,pnj->pij", a, b))
+        d = np.sign(np.linalg.det(u @ vt))
+        u[:, :, 2] *= d[:, None]
+        distances = np.linalg.norm(np.einsum("pni,pij->pnj", a, u @ vt) - b, axis=2)
+
+        rmsd[i, j] = rmsd[j, i] = np.sqrt((distances**2).mean(axis=1))
+        tm[i, j] = tm[j, i] = (1 / (1 + (distances / d0) ** 2)).mean(axis=1)
+    return rmsd, tm
+
+
+def cluster(rmsd: np.ndarray, scores: np.ndarray, rmsd_threshold: float = 2.0):
+    """Greedy clustering: the best scored model left starts a cluster with all the models within rmsd_threshold.
+
+    Returns:
+        Tuple[np.ndarray, list]: Cluster label of each model and index of the representative of each cluster
+    """
+    labels = np.full(len(scores), -1)
+    representatives = []
+    for index in np.argsort(-scores, kind="stable"):
+        if labels[index] >= 0:
+            continue
+        labels[(labels < 0) & (rmsd[index] <= rmsd_threshold)] = len(representatives)
+        representatives.append(int(index))
+    return labels, representatives
+
+
+def representatives(rows: list, rmsd_threshold: float = 2.0, metric: str = "aggregate_score") -> list:
+    """Keep the best model of each cluster of near-identical structures.
+
+    Models are only compared with the models of the same input (same sequence hash and number of
+    residues), so seeds and sweep points of one complex are deduplicated together. Models without a
+    sequence hash, as indexed by score_index.rebuild, are only compared with the models of their run.
+
+    Args:
+        rows (list): Models from score_index.query
+        rmsd_threshold (float, optional): Maximum RMSD in Angstrom to a representative. Default is 2.
+        metric (str, optional): Score choosing the representative of a cluster. Default is "aggregate_score".
+
+    Returns:
+        list: Representative rows with their cluster size and the RMSD / TM-like score of their farthest member
+    """
+    groups = {}
+    for row in rows:
+        coordinates = model_coordinates(row["run_id"], row["model_index"])
+        group = row["sequence_hash"] if row["sequence_hash"] is not None else ("run", row["run_id"])
+        groups.setdefault((group, len(coordinates)), []).append((row, coordinates))
+
+    selected = []
+    for (_, number_of_atoms), members in groups.items():
+        if number_of_atoms < 3:
+            selected.extend({**row, "cluster_size": 1, "max_rmsd": 0.0, "min_tm": 1.0} for row, _ in members)
+            continue
+        rmsd, tm = pairwise_similarity(np.stack([coordinates for _, coordinates in members]))
+        scores = np.array([row[metric] for row, _ in members], dtype=np.float64)
+        labels, cluster_representatives = cluster(rmsd, scores, rmsd_threshold)
+        for label, index in enumerate(cluster_representatives):
+            in_cluster = labels == label
+            selected.append({
+                **members[index][0],
+                "cluster_size": int(in_cluster.sum()),
+                "max_rmsd": round(float(rmsd[index, in_cluster].max()), 2),
+                "min_tm": round(float(tm[index, in_cluster].min()), 3),
+            })
+    print(f"🧬 {len(selected)} representatives out of {len(rows)} models")
+    return sorted(selected, key=lambda row: row[metric], reverse=True)
@@ -0,0 +1,154 @@
+# Import libraries
+from pathlib import Path
+from typing import Optional, Tuple, Union
+import gzip
+import os
+
+# Define parameters of the structure files
+STRUCTURE_SUFFIXES = {  # wire and storage formats of the CIF files and their suffixes
+    "text": ".cif",
+    "zstd": ".cif.zst",
+    "gzip": ".cif.gz",
+}
+STRUCTURE_FORMAT = os.environ.get("CHAI1_STRUCTURE_FORMAT", "text")  # format of the CIF files in results/molecules
+LAZY_STRUCTURES = os.environ.get("CHAI1_LAZY_STRUCTURES", "0") == "1"  # return scores only, fetch CIF files on demand
+WIRE_FORMAT = None if LAZY_STRUCTURES else STRUCTURE_FORMAT  # format requested from the inference service
+
+molecules_dir = Path("results") / "molecules"  # same location as the files written by compute_Chai1
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def check_structure_format(structure_format: str) -> str:
+    """Raise a ValueError if the structure format is unknown, return it otherwise."""
+    if structure_format not in STRUCTURE_SUFFIXES:
+        raise ValueError(f"Unknown structure format {structure_format!r}, expected one of {list(STRUCTURE_SUFFIXES)}")
+    return structure_format
+
+
+def payload_format(payload: Union[str, bytes]) -> str:
+    """Detect the format of a structure returned by the inference service from its content."""
+    if isinstance(payload, str):
+        return "text"
+    if payload.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if payload.startswith(GZIP_MAGIC):
+        return "gzip"
+    return "text"
+
+
+def decode_structure(payload: Union[str, bytes]) -> str:
+    """Decode a structure in any of the supported formats to mmCIF text.
+
+    Args:
+        payload (str or bytes): mmCIF text, or zstd/gzip compressed mmCIF
+
+    Returns:
+        str: mmCIF text
+    """
+    structure_format = payload_format(payload)
+    if structure_format == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(payload).decode()
+    if structure_format == "gzip":
+        return gzip.decompress(payload).decode()
+    return payload if isinstance(payload, str) else payload.decode()
+
+
+def compress_structure(cif_text: bytes, structure_format: str = STRUCTURE_FORMAT) -> bytes:
+    """Encode mmCIF text in a storage format, the client-side counterpart of modal_app.encode_structure."""
+    if check_structure_format(structure_format) == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(cif_text)
+    if structure_format == "gzip":
+        return gzip.compress(cif_text)
+    return cif_text
+
+
+def cif_file_name(run_id: str, model_index: int, structure_format: str = STRUCTURE_FORMAT) -> str:
+    """File name of a model in results/molecules for the given storage format."""
+    return f"{run_id}-preds.model_idx_{model_index}{STRUCTURE_SUFFIXES[check_structure_format(structure_format)]}"
+
+
+def parse_cif_file_name(cif_file: Union[str, Path]) -> Tuple[str, int]:
+    """Recover the run ID and model index from a file name built by cif_file_name."""
+    run_id, _, model_index = strip_structure_suffix(cif_file).name.rpartition("-preds.model_idx_")
+    return run_id, int(model_index)
+
+
+def find_cif_file(molecules_dir: Path, run_id: str, model_index: int) -> Optional[Path]:
+    """Find the CIF file of a model whatever its storage format, None if it is missing."""
+    for structure_format in STRUCTURE_SUFFIXES:
+        cif_file = Path(molecules_dir) / cif_file_name(run_id, model_index, structure_format)
+        if cif_file.exists():
+            return cif_file
+    return None
+
+
+def fetch_cif_file(run_id: str, model_index: int, output_dir: Path = molecules_dir) -> Path:
+    """Return the local CIF file of a model, fetching it from the chai1-preds volume on a miss.
+
+    results/molecules acts as a read-through cache of /preds/<run_id> on the volume: runs made with
+    CHAI1_LAZY_STRUCTURES=1 only bring back their scores, and the CIF files of evicted or missing
+    models are fetched the first time a tool or the viewer needs them.
+
+    Args:
+        run_id (str): Unique identifier for the inference run
+        model_index (int): Index of the model in the run
+        output_dir (Path, optional): Local directory of the CIF files. Default is results/molecules.
+
+    Returns:
+        Path: Local CIF file, stored in the CHAI1_STRUCTURE_FORMAT format
+    """
+    cif_file = find_cif_file(output_dir, run_id, model_index)
+    if cif_file is not None:
+        return cif_file
+
+    from modal_app import chai_preds_volume
+
+    print(f"🧬 fetching model {model_index} of {run_id=} from the chai1-preds volume")
+    cif_text = b"".join(chai_preds_volume.read_file(f"{run_id}/pred.model_idx_{model_index}.cif"))
+
+    cif_file = Path(output_dir) / cif_file_name(run_id, model_index)
+    cif_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cif_file.with_name(cif_file.name + ".tmp")
+    tmp_file.write_bytes(compress_structure(cif_text))
+    tmp_file.replace(cif_file)  # atomic, concurrent readers never see a partial file
+    return cif_file
+
+
+def strip_structure_suffix(cif_file: Union[str, Path]) -> Path:
+    """Remove the .cif, .cif.zst or .cif.gz suffix of a structure file."""
+    cif_file = Path(cif_file)
+    for suffix in sorted(STRUCTURE_SUFFIXES.values(), key=len, reverse=True):
+        if cif_file.name.endswith(suffix):
+            return cif_file.with_name(cif_file.name[: -len(suffix)])
+    return cif_file.with_suffix("")
+
+
+def pdb_file_name(cif_file: Union[str, Path]) -> Path:
+    """PDB file converted from a structure file by the viewer, next to it."""
+    stripped = strip_structure_suffix(cif_file)
+    return stripped.with_name(stripped.name + ".pdb")
+
+
+def read_structure(cif_file: Union[str, Path]):
+    """Read a structure file in any of the supported formats with gemmi.
+
+    Args:
+        cif_file (str or Path): mmCIF file, possibly zstd or gzip compressed
+
+    Returns:
+        gemmi.Structure: The structure
+    """
+    import gemmi
+
+    with open(cif_file, "rb") as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    if payload_format(magic) == "text":
+        return gemmi.read_structure(str(cif_file))
+    document = gemmi.cif.read_string(decode_structure(Path(cif_file).read_bytes()))
+    return gemmi.make_structure_from_block(document.sole_block())
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("modal")
+pytest.importorskip("gradio")
+
+import chai1_tools
+
+
+class FakeApp:
+    """Stand-in for the Modal app, failing like Modal if a second app.run() is entered while one is running."""
+
+    def __init__(self, startup_seconds: float):
+        self.startup_seconds = startup_seconds
+        self.running = 0
+        self.runs = 0
+        self.lock = threading.Lock()
+
+    def run(self):
+        app = self
+
+        class Run:
+            def __enter__(self):
+                with app.lock:
+                    if app.running:
+                        raise RuntimeError("App is already running")
+                    app.running += 1
+                    app.runs += 1
+                time.sleep(app.startup_seconds)
+                return self
+
+            def __exit__(self, *args):
+                with app.lock:
+                    app.running -= 1
+
+        return Run()
+
+
+@pytest.fixture
+def fake_app(monkeypatch):
+    app = FakeApp(startup_seconds=0.3)
+    monkeypatch.setattr(chai1_tools, "app", app)
+    monkeypatch.setattr(chai1_tools, "_app_session", None)
+    monkeypatch.setattr(chai1_tools, "_app_session_opening", None)
+    return app
+
+
+def test_tool_call_during_startup_waits_for_the_session(fake_app):
+    chai1_tools.start_app_session(background=True)
+    errors = []
+
+    def tool_call():
+        try:
+            with chai1_tools.app_session():
+                assert chai1_tools._app_session is not None
+        except Exception as e:
+            errors.append(e)
+
+    calls = [threading.Thread(target=tool_call) for _ in range(3)]
+    for call in calls:
+        call.start()
+    for call in calls:
+        call.join()
+
+    assert errors == []
+    assert fake_app.runs == 1
+
+
+def test_start_app_session_is_idempotent(fake_app):
+    chai1_tools.start_app_session(background=True)
+    chai1_tools.start_app_session()  # waits for the session opened in the background
+    chai1_tools.start_app_session()
+    assert fake_app.runs == 1 and chai1_tools._app_session is not None
+
+
+def test_without_session_each_tool_call_runs_the_app(fake_app):
+    fake_app.startup_seconds = 0
+    with chai1_tools.app_session():
+        pass
+    with chai1_tools.app_session():
+        pass
+    assert fake_app.runs == 2 and fake_app.running == 0
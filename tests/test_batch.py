@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("modal")
+pytest.importorskip("gradio")
+
+import chai1_tools
+
+
+class FakeFunction:
+    """Stand-in for a Modal method, finishing each call after the number of seconds given as its first argument."""
+
+    def __init__(self):
+        self.calls = []
+
+    def starmap(self, args_list, order_outputs=True, return_exceptions=False):
+        assert order_outputs is False and return_exceptions is True
+        self.calls.append((time.perf_counter(), list(args_list)))
+        finished = []
+        lock = threading.Condition()
+
+        def run(seconds, value):
+            time.sleep(seconds)
+            with lock:
+                finished.append(RuntimeError(value) if value == "fail" else value)
+                lock.notify()
+
+        for args in args_list:
+            threading.Thread(target=run, args=args).start()
+        for _ in args_list:
+            with lock:
+                while not finished:
+                    lock.wait()
+                yield finished.pop(0)
+
+
+def test_split_fasta_complexes_keeps_the_records_of_a_complex_together():
+    fasta = ">protein|name=receptor\nMKT\nAAV\n>ligand|name=drug\nCCO\n\n>protein|name=other\nGGG\n//\n>protein|name=last\nPPP\n"
+    complexes = chai1_tools.split_fasta_complexes(fasta)
+    assert complexes == [
+        ("receptor+drug", ">protein|name=receptor\nMKT\nAAV\n>ligand|name=drug\nCCO"),
+        ("other", ">protein|name=other\nGGG"),
+        ("last", ">protein|name=last\nPPP"),
+    ]
+    assert [name for name, _ in chai1_tools.split_fasta_complexes(fasta.replace("\n\n", "\n"))] == ["receptor+drug+other", "last"]
+
+
+def test_split_fasta_complexes_rejects_a_complex_without_header():
+    with pytest.raises(Exception, match="FASTA header"):
+        chai1_tools.split_fasta_complexes(">protein|name=a\nMKT\n\nAAV\n")
+
+
+def test_starmap_as_completed_yields_outputs_as_they_finish():
+    slow_class, fast_class = FakeFunction(), FakeFunction()
+    caps = {}
+
+    def factory(tag, function):
+        def make_function(max_containers):
+            caps[tag] = max_containers
+            return function
+        return make_function
+
+    start = time.perf_counter()
+    outputs = []
+    for tag, output in chai1_tools.starmap_as_completed([
+        ("slow", factory("slow", slow_class), [(0.5, "slow"), (0.05, "fail")]),
+        ("fast", factory("fast", fast_class), [(0.1, "fast-1"), (0.2, "fast-2")]),
+    ], max_concurrency=4):
+        outputs.append((tag, output if not isinstance(output, Exception) else "failed", time.perf_counter() - start))
+
+    assert [(tag, output) for tag, output, _ in outputs] == [
+        ("slow", "failed"), ("fast", "fast-1"), ("fast", "fast-2"), ("slow", "slow")
+    ]
+    # Both classes were dispatched at once, and the fast outputs did not wait for the slow call
+    assert abs(slow_class.calls[0][0] - fast_class.calls[0][0]) < 0.1
+    assert outputs[2][2] < 0.4
+    assert caps == {"slow": 2, "fast": 2}
+
+
+def test_starmap_as_completed_queues_the_tags_beyond_the_cap():
+    functions = {tag: FakeFunction() for tag in ["a", "b", "c"]}
+    caps = {}
+
+    def factory(tag):
+        def make_function(max_containers):
+            caps[tag] = max_containers
+            assert sum(caps.values()) - sum(caps[t] for t in finished) <= 2
+            return functions[tag]
+        return make_function
+
+    finished = []
+    outputs = []
+    for tag, output in chai1_tools.starmap_as_completed(
+        [(tag, factory(tag), [(0.1 * (ii + 1), tag)]) for ii, tag in enumerate(functions)], max_concurrency=2
+    ):
+        finished.append(tag)
+        outputs.append(output)
+
+    assert sorted(outputs) == ["a", "b", "c"]
+    # c waited for a to finish and free its container
+    assert functions["c"].calls[0][0] - functions["a"].calls[0][0] >= 0.1
+
+
+def test_container_caps_never_exceed_the_concurrency():
+    assert chai1_tools.container_caps({"small": 6, "large": 2}, 8) == {"small": 6, "large": 2}
+    assert chai1_tools.container_caps({"small": 30, "large": 1}, 10) == {"small": 9, "large": 1}
+    assert chai1_tools.container_caps({"a": 5, "b": 5}, 3) == {"a": 2, "b": 1}
+    assert chai1_tools.container_caps({"a": 1, "b": 1}, 10) == {"a": 1, "b": 1}
+    for calls, cap in [({"a": 5, "b": 5, "c": 5}, 4), ({"a": 7, "b": 3, "c": 1, "d": 1}, 5), ({"a": 100, "b": 1}, 2)]:
+        caps = chai1_tools.container_caps(calls, cap)
+        assert sum(caps.values()) <= cap and all(caps.values())
+
+
+def test_container_caps_queue_the_tags_beyond_the_cap():
+    caps = chai1_tools.container_caps({"a": 4, "b": 1, "c": 1, "d": 1}, 2)
+    assert caps == {"a": 1, "b": 1, "c": 0, "d": 0}
+    assert chai1_tools.container_caps({"a": 4}, 0) == {"a": 0}
+
+
+def test_sharded_runs_record_their_timing_under_the_run_id(monkeypatch):
+    timings = {}
+
+    class FakeShard:
+        def starmap(self, args_list, order_outputs=True):
+            for _, _, run_id, shard_index, _, _ in args_list:
+                timings[f"{run_id}/shard_{shard_index}"] = {
+                    "cold_start": shard_index == 0, "setup_seconds": 5.0 if shard_index == 0 else 0.0,
+                    "inference_seconds": 10.0 + shard_index, "container_age_seconds": 20.0, "time": 100.0 + shard_index,
+                }
+                yield [(shard_index, b"scores", "cif")]
+
+    service = type("FakeService", (), {"inference_shard": FakeShard()})
+    monkeypatch.setattr(chai1_tools, "service_timings", timings)
+
+    models = list(chai1_tools.sharded_inference(service, ">protein|A\nAAA", {}, "run", 3))
+
+    assert [ii for ii, _, _ in models] == [0, 1, 2]
+    assert chai1_tools.inference_seconds("run") == 33.0
+    assert chai1_tools.inference_seconds("run", wall=True) == 12.0
+    assert timings["run"]["cold_start"] and timings["run"]["shards"] == 3
@@ -0,0 +1,66 @@
+from contextlib import nullcontext
+
+import pytest
+
+pytest.importorskip("modal")
+pytest.importorskip("gradio")
+pd = pytest.importorskip("pandas")
+
+import chai1_tools
+
+SCORES = {"has_inter_chain_clashes": [False], "aggregate_score": [0.9], "ptm": [0.9], "iptm": [0.9]}
+DECISION = {"name": "small", "gpu": "L40S", "timeout_minutes": 10, "batch_size": 4, "tokens": {"total": 3}}
+
+
+class FakeInferenceBatch:
+    """Stand-in for Chai1Service().inference_batch, recording 7 seconds of inference per job."""
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    def starmap(self, args_list, order_outputs=True, return_exceptions=False):
+        for jobs, _ in args_list:
+            for _, _, run_id in jobs:
+                self.timings[run_id] = {"inference_seconds": 7.0}
+            yield {run_id: [(b"scores", "cif")] for _, _, run_id in jobs}
+
+
+@pytest.fixture
+def cascade(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # The cached input still has the timing of the run that produced it in the persistent Modal Dict
+    timings = {"cached-run": {"inference_seconds": 100.0}}
+    service = type("FakeService", (), {"inference_batch": FakeInferenceBatch(timings)})
+
+    monkeypatch.setattr(chai1_tools, "service_timings", timings)
+    monkeypatch.setattr(chai1_tools, "load_batch_inputs", lambda *args: [("cached.fasta", ">protein|A\nAAA"), ("new.fasta", ">protein|B\nBBB")])
+    monkeypatch.setattr(chai1_tools, "load_inference_config", lambda name: {"num_diffn_timesteps": 200 if "default" in name else 50})
+    monkeypatch.setattr(chai1_tools.result_cache, "compute_cache_key", lambda fasta, config: fasta)
+    monkeypatch.setattr(
+        chai1_tools.result_cache, "lookup",
+        lambda key: {"run_id": "cached-run", "number_of_models": 1} if key.endswith("AAA") else None,
+    )
+    monkeypatch.setattr(chai1_tools.result_cache, "store", lambda *args: None)
+    monkeypatch.setattr(chai1_tools, "build_results_dataframe", lambda run_id, n: chai1_tools.results_dataframe([chai1_tools.model_row(run_id, 0, SCORES)]))
+    monkeypatch.setattr(chai1_tools, "save_results", lambda run_id, results, *args: ([SCORES for _ in results], []))
+    monkeypatch.setattr(chai1_tools, "prefetch_best_pdb", lambda table: None)
+    monkeypatch.setattr(chai1_tools, "app_session", nullcontext)
+    monkeypatch.setattr(chai1_tools, "check_inference_dependencies", lambda function: False)
+    monkeypatch.setattr(chai1_tools.routing, "route", lambda fasta: DECISION)
+    monkeypatch.setattr(chai1_tools.routing, "log_route", lambda *args, **kwargs: None)
+    monkeypatch.setattr(chai1_tools.Chai1Service, "with_options", lambda **options: service)
+    return chai1_tools.compute_Chai1_cascade
+
+
+def test_run_batch_flags_cache_hits(cascade):
+    outputs = list(chai1_tools.run_batch([("cached.fasta", ">protein|A\nAAA"), ("new.fasta", ">protein|B\nBBB")], {}))
+    assert [(name, cached) for name, _, _, cached in outputs] == [("cached.fasta", True), ("new.fasta", False)]
+
+
+def test_cascade_does_not_count_the_gpu_time_of_cache_hits(cascade):
+    *_, (table, report) = cascade(["cached.fasta", "new.fasta"], threshold=0.5)
+
+    assert len(table) == 4  # both inputs escalated, the cached one served from the cache in both passes
+    assert report["quick_gpu_seconds"] == 7.0
+    assert report["full_gpu_seconds"] == 7.0
+    assert report["all_full_gpu_seconds"] == 14.0
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("modal")
+pytest.importorskip("gradio")
+pytest.importorskip("pandas")
+
+import chai1_tools
+import mcp_server
+from gradio.mcp import GradioMCPServer
+
+
+def test_every_tool_has_a_parseable_schema():
+    server = GradioMCPServer(mcp_server.demo, "")
+    api_info = mcp_server.demo.get_api_info()
+    assert len(api_info["named_endpoints"]) == len(mcp_server.MCP_TOOLS)
+
+    tools = json.loads(asyncio.run(server.get_complete_schema(None)).body)
+    assert sorted(tool["name"] for tool in tools) == sorted(tool.__name__ for tool, _ in mcp_server.MCP_TOOLS)
+    schemas = {tool["name"]: tool for tool in tools}
+    assert schemas["compute_Chai1"]["inputSchema"]["properties"]["fasta_file_name"]["type"] == "string"
+    assert schemas["compute_Chai1_sweep"]["inputSchema"]["properties"]["options"]["type"] == "array"
+    assert schemas["create_json_config"]["description"].startswith("Create")
+
+
+def test_tool_calls_return_json_values(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = GradioMCPServer(mcp_server.demo, "")
+
+    def call(name, *inputs):
+        block_fn = server.get_block_fn_from_endpoint_name(f"/{name}")
+        return asyncio.run(mcp_server.demo.process_api(block_fn=block_fn, inputs=list(inputs), request=None))["data"]
+
+    assert call("job_metrics", "") == [{"runs": 0, "stages": {}, "p95_gpu_memory_peak_bytes": None}]
+    assert call("rank_models", "", "aggregate_score", 10, False) == [[]]
+
+
+def test_empty_values_are_passed_as_none(monkeypatch):
+    received = {}
+
+    def tool(name: chai1_tools.Optional[str] = None, options: chai1_tools.Optional[list] = None, seed: int = 42) -> str:
+        """Test tool."""
+        received.update(name=name, options=options, seed=seed)
+        return "done"
+
+    wrapper = mcp_server.mcp_tool(tool, str)
+    assert wrapper("", []) == "done"
+    assert received == {"name": None, "options": None, "seed": 42}
+    assert wrapper("file.fasta", ["MSA_server"], 1) == "done"
+    assert received == {"name": "file.fasta", "options": ["MSA_server"], "seed": 1}
@@ -0,0 +1,81 @@
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("modal")
+
+import modal_app
+
+
+class FakeVolume:
+    def reload(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def msa_server(tmp_path, monkeypatch):
+    """Fake chai_lab MSA modules, recording the queries sent to the MSA server."""
+    queries = []
+
+    def hash_sequence(sequence):
+        return f"hash-{sequence}"
+
+    def generate_colabfold_msas(protein_seqs, msa_dir, msa_server_url):
+        # same check as chai_lab 0.6.1
+        assert msa_dir.exists() and not any(msa_dir.iterdir()), "msa_dir must exist and be empty"
+        queries.append(sorted(protein_seqs))
+        for sequence in protein_seqs:
+            # the paired rows of a chain only hold with the partner chains of the same query
+            (msa_dir / f"{hash_sequence(sequence)}.aligned.pqt").write_text(f"{sequence} paired with {sorted(protein_seqs)}")
+
+    modules = {
+        "chai_lab": {},
+        "chai_lab.data": {},
+        "chai_lab.data.dataset": {},
+        "chai_lab.data.dataset.msas": {},
+        "chai_lab.data.dataset.msas.colabfold": {"generate_colabfold_msas": generate_colabfold_msas},
+        "chai_lab.data.parsing": {},
+        "chai_lab.data.parsing.msas": {},
+        "chai_lab.data.parsing.msas.aligned_pqt": {"hash_sequence": hash_sequence},
+    }
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        monkeypatch.setitem(sys.modules, name, module)
+
+    monkeypatch.setattr(modal_app, "msas_dir", tmp_path / "store")
+    monkeypatch.setattr(modal_app, "chai_msa_volume", FakeVolume())
+    monkeypatch.setattr(modal_app, "msa_stats", {})
+    (tmp_path / "store").mkdir()
+    return queries
+
+
+def test_cache_miss_generates_msas_in_an_empty_directory(tmp_path, msa_server):
+    run_dir = tmp_path / "run"
+    stats = modal_app.prepare_msas(">protein|A\nAAA\n>ligand|L\nCCO\n", run_dir)
+    assert stats == {"hits": 0, "misses": 1}
+    assert msa_server == [["AAA"]]
+    assert (run_dir / "hash-AAA.aligned.pqt").read_text() == "AAA paired with ['AAA']"
+
+    # Second run served from the store, also into a fresh directory for the next miss
+    stats = modal_app.prepare_msas(">protein|A\nAAA\n>ligand|L\nCCCO\n", tmp_path / "run2")
+    assert stats == {"hits": 1, "misses": 0}
+    assert msa_server == [["AAA"]]
+
+
+def test_paired_alignments_are_not_reused_with_other_partners(tmp_path, msa_server):
+    modal_app.prepare_msas(">protein|A\nAAA\n>protein|B\nBBB\n", tmp_path / "run1")
+    stats = modal_app.prepare_msas(">protein|A\nAAA\n>protein|C\nCCC\n", tmp_path / "run2")
+
+    # The whole chain set is queried again, so A is paired with C and not with B
+    assert stats == {"hits": 0, "misses": 2}
+    assert msa_server == [["AAA", "BBB"], ["AAA", "CCC"]]
+    assert (tmp_path / "run2" / "hash-AAA.aligned.pqt").read_text() == "AAA paired with ['AAA', 'CCC']"
+
+    # The same complex in another order is a hit
+    stats = modal_app.prepare_msas(">protein|C\nCCC\n>protein|A\nAAA\n", tmp_path / "run3")
+    assert stats == {"hits": 2, "misses": 0}
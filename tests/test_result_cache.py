@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import result_cache
+import score_index
+
+SCORES = {"aggregate_score": [0.8], "ptm": [0.8], "iptm": [0.7], "has_inter_chain_clashes": [False]}
+
+
+def write_run(run_id: str, size: int):
+    for folder, name in [("score", f"{run_id}-scores.model_idx_0.npz"), ("molecules", f"{run_id}-pred.model_idx_0.cif")]:
+        Path("results", folder).mkdir(parents=True, exist_ok=True)
+        Path("results", folder, name).write_bytes(b"x" * size)
+    score_index.add_model(run_id, 0, SCORES, "hash", {}, f"{run_id}-pred.model_idx_0.cif")
+
+
+def indexed_runs():
+    return {row["run_id"] for row in score_index.query(None, "aggregate_score", 10, True)}
+
+
+def test_store_never_evicts_the_entry_being_stored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(result_cache, "CACHE_MAX_BYTES", 1000)
+
+    write_run("old", 100)
+    result_cache.store("old-key", "old", 1, {})
+    write_run("new", 2000)  # over the size limit on its own
+    result_cache.store("new-key", "new", 1, {})
+
+    assert result_cache.lookup("new-key")["run_id"] == "new"
+    assert Path("results/score/new-scores.model_idx_0.npz").exists()
+    assert indexed_runs() == {"new"}
+    # the older entry is evicted to make room, with its files and index rows
+    assert result_cache.lookup("old-key") is None
+    assert not Path("results/score/old-scores.model_idx_0.npz").exists()
+
+
+def test_store_evicts_the_least_recently_used_entries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(result_cache, "CACHE_MAX_ENTRIES", 2)
+
+    for run_id in ["a", "b", "c"]:
+        write_run(run_id, 10)
+        result_cache.store(f"{run_id}-key", run_id, 1, {})
+
+    assert set(result_cache.entries()) == {"b-key", "c-key"}
+    assert indexed_runs() == {"b", "c"}
@@ -0,0 +1,25 @@
+import numpy as np
+
+import structure_clustering
+
+COORDINATES = np.arange(30, dtype=np.float32).reshape(10, 3) ** 1.5
+
+
+def row(run_id, model_index, sequence_hash, score):
+    return {"run_id": run_id, "model_index": model_index, "sequence_hash": sequence_hash, "aggregate_score": score}
+
+
+def test_rebuilt_rows_are_only_clustered_within_their_run(monkeypatch):
+    monkeypatch.setattr(structure_clustering, "model_coordinates", lambda run_id, model_index: COORDINATES)
+    rows = [
+        # Rebuilt from the cache: no sequence hash, unrelated inputs of the same size
+        row("rebuilt-a", 0, None, 0.9), row("rebuilt-a", 1, None, 0.8), row("rebuilt-b", 0, None, 0.7),
+        # Fresh runs of one input
+        row("fresh-1", 0, "hash", 0.6), row("fresh-2", 0, "hash", 0.5),
+    ]
+
+    selected = structure_clustering.representatives(rows)
+
+    assert [(row["run_id"], row["model_index"], row["cluster_size"]) for row in selected] == [
+        ("rebuilt-a", 0, 2), ("rebuilt-b", 0, 1), ("fresh-1", 0, 2),
+    ]
@@ -0,0 +1,86 @@
+import functools
+import json
+import sys
+import time
+import types
+
+import pytest
+
+pytest.importorskip("modal")
+
+import modal_app
+import tracing
+
+
+class FakeComponent:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def forward(self, *args, **kwargs):
+        time.sleep(self.seconds)
+        return args
+
+
+@pytest.fixture
+def fake_chai_lab(tmp_path, monkeypatch):
+    """Fake torch and chai_lab.chai1, whose run_inference runs each exported component like chai_lab 0.6.1."""
+    torch = types.ModuleType("torch")
+    torch.device = lambda name: name
+    torch.cuda = types.SimpleNamespace(
+        is_available=lambda: False, reset_peak_memory_stats=lambda: None, max_memory_allocated=lambda: 1024, synchronize=lambda: None
+    )
+    loads = []
+
+    def load_exported(comp_key, device):
+        loads.append(comp_key)
+        return FakeComponent(0.05 if comp_key == "diffusion_module.pt" else 0.01)
+
+    chai1 = types.ModuleType("chai_lab.chai1")
+    chai1.load_exported = load_exported
+
+    def run_inference(fasta_file, output_dir, device, **kwargs):
+        for comp_key in ["feature_embedding.pt", "token_embedder.pt", "trunk.pt", "diffusion_module.pt", "confidence_head.pt"]:
+            chai1.load_exported(comp_key, device).forward()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for ii in range(modal_app.N_DIFFUSION_SAMPLES):
+            (output_dir / f"scores.model_idx_{ii}.npz").write_bytes(b"scores")
+            (output_dir / f"pred.model_idx_{ii}.cif").write_text("data_model")
+
+    chai1.run_inference = run_inference
+    chai_lab = types.ModuleType("chai_lab")
+    chai_lab.chai1 = chai1
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    monkeypatch.setitem(sys.modules, "chai_lab", chai_lab)
+    monkeypatch.setitem(sys.modules, "chai_lab.chai1", chai1)
+
+    monkeypatch.setattr(modal_app, "preds_dir", tmp_path / "preds")
+    monkeypatch.setattr(modal_app, "job_spans", {})
+    monkeypatch.setattr(modal_app, "component_seconds", {})
+    monkeypatch.setattr(modal_app, "pending_model_load", [])
+    monkeypatch.setattr(tracing, "TRACE_FILE", tmp_path / "traces" / "spans.jsonl")
+    return chai1, loads
+
+
+def test_component_spans_show_up_in_the_trace_file(fake_chai_lab):
+    chai1, loads = fake_chai_lab
+    # Same order as Chai1Service.load_models: timers first, then the memoized components
+    modal_app.install_component_timers()
+    chai1.load_exported = functools.lru_cache(maxsize=None)(chai1.load_exported)
+
+    for run_id in ["run-1", "run-2"]:
+        modal_app.run_chai1(">protein|A\nAAA", {}, run_id)
+        assert tracing.collect_container_spans(run_id) > 0
+
+    assert len(loads) == 5  # memoized, loaded by the first run only
+    with open(tracing.TRACE_FILE) as f:
+        spans = [json.loads(line) for line in f]
+    for run_id in ["run-1", "run-2"]:
+        stages = {span["stage"]: span for span in spans if span["run_id"] == run_id}
+        assert {"fold", "embedding", "trunk", "diffusion", "confidence", "serialization"} <= set(stages)
+        assert all(stages[stage]["source"] == "container" for stage in ["embedding", "trunk", "diffusion", "confidence"])
+        # each run only counts its own forward passes, once
+        assert 0.05 <= stages["diffusion"]["seconds"] < 0.1
+        assert 0.02 <= stages["embedding"]["seconds"] < 0.05
+
+    metrics = tracing.job_metrics("run-2")
+    assert metrics["stage_seconds"]["trunk"] > 0
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+
+import pytest
+
+pytest.importorskip("modal")
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+import modal_app
+
+PAYLOAD = b"chai-1 weights" * 1000
+
+
+def serve(handler, coroutine_function):
+    """Run coroutine_function(base_url) against a local HTTP server answering every request with handler."""
+
+    async def main():
+        server = web.Application()
+        server.router.add_route("*", "/{name:.*}", handler)
+        runner = web.AppRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await coroutine_function(f"http://127.0.0.1:{port}/")
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def serve_and_run(coroutine_function, headers: dict):
+    """Serve PAYLOAD with the given headers and run coroutine_function(base_url)."""
+
+    async def handler(request):
+        return web.Response(body=b"" if request.method == "HEAD" else PAYLOAD, headers={"Content-Length": str(len(PAYLOAD)), **headers})
+
+    return serve(handler, coroutine_function)
+
+
+def serve_without_size_and_run(coroutine_function):
+    """Serve PAYLOAD with range support but without Content-Length, the body being sent in chunks."""
+
+    async def handler(request):
+        body = PAYLOAD
+        status = 200
+        if "Range" in request.headers:
+            first, last = request.headers["Range"].removeprefix("bytes=").split("-")
+            body, status = PAYLOAD[int(first):int(last) + 1], 206
+        response = web.StreamResponse(status=status, headers={"Accept-Ranges": "bytes"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        if request.method != "HEAD":
+            await response.write(body)
+        await response.write_eof()
+        return response
+
+    return serve(handler, coroutine_function)
+
+
+def download(tmp_path, headers: dict, expected_sha256=None):
+    async def run(base_url):
+        async with aiohttp.ClientSession() as session:
+            return await modal_app.download_file(session, base_url + "trunk.pt", tmp_path / "trunk.pt", expected_sha256=expected_sha256)
+
+    return serve_and_run(run, headers)
+
+
+def test_download_matching_the_pinned_checksum_is_verified(tmp_path):
+    stats = download(tmp_path, {}, expected_sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    assert stats["verified"] and (tmp_path / "trunk.pt").read_bytes() == PAYLOAD
+
+
+def test_download_not_matching_the_pinned_checksum_fails(tmp_path):
+    with pytest.raises(IOError, match="pinned"):
+        download(tmp_path, {}, expected_sha256="0" * 64)
+    assert not (tmp_path / "trunk.pt").exists() and not (tmp_path / "trunk.pt.part").exists()
+
+
+def test_download_not_matching_the_server_checksum_fails(tmp_path):
+    with pytest.raises(IOError, match="server"):
+        download(tmp_path, {"ETag": f'"{hashlib.md5(b"other").hexdigest()}"'})
+    assert download(tmp_path, {"ETag": f'"{hashlib.md5(PAYLOAD).hexdigest()}"'})["verified"]
+
+
+def test_download_without_reference_is_unverified_and_never_becomes_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(modal_app, "models_dir", tmp_path)
+    monkeypatch.setattr(modal_app, "WEIGHTS_MANIFEST_FILE", tmp_path / "manifest.json")
+    monkeypatch.setattr(modal_app, "INFERENCE_DEPENDENCIES", ["trunk.pt"])
+    monkeypatch.setattr(modal_app, "WEIGHTS_SHA256", {"trunk.pt": None})
+
+    manifest = serve_and_run(lambda base_url: modal_app.fetch_inference_dependencies(base_url=base_url), {})
+    assert manifest["trunk.pt"]["sha256"] == hashlib.sha256(PAYLOAD).hexdigest()
+    assert manifest["trunk.pt"]["verified"] is False
+
+    # An interrupted download is fetched again without taking the unverified checksum as its reference
+    expected = []
+    original = modal_app.download_file
+
+    async def recording_download_file(session, url, local_path, expected_sha256=None, **kwargs):
+        expected.append(expected_sha256)
+        return await original(session, url, local_path, expected_sha256=expected_sha256, **kwargs)
+
+    monkeypatch.setattr(modal_app, "download_file", recording_download_file)
+    (tmp_path / "trunk.pt").write_bytes(PAYLOAD[:10])
+    serve_and_run(lambda base_url: modal_app.fetch_inference_dependencies(base_url=base_url), {})
+    assert expected == [None]
+
+
+def test_recorded_checksum_other_than_the_pinned_one_is_stale(tmp_path, monkeypatch):
+    monkeypatch.setattr(modal_app, "models_dir", tmp_path)
+    monkeypatch.setattr(modal_app, "INFERENCE_DEPENDENCIES", ["trunk.pt"])
+    (tmp_path / "trunk.pt").write_bytes(PAYLOAD)
+    manifest = {"trunk.pt": {"name": "trunk.pt", "size": len(PAYLOAD), "sha256": "bad", "version": modal_app.CHAI_LAB_VERSION}}
+    monkeypatch.setattr(modal_app, "WEIGHTS_SHA256", {"trunk.pt": None})
+    assert modal_app.stale_dependencies(manifest) == []
+    monkeypatch.setattr(modal_app, "WEIGHTS_SHA256", {"trunk.pt": hashlib.sha256(PAYLOAD).hexdigest()})
+    assert modal_app.stale_dependencies(manifest) == ["trunk.pt"]
+
+
+def download_without_size(tmp_path, expected_sha256=None):
+    async def run(base_url):
+        async with aiohttp.ClientSession() as session:
+            return await modal_app.download_file(session, base_url + "trunk.pt", tmp_path / "trunk.pt", expected_sha256=expected_sha256)
+
+    return serve_without_size_and_run(run)
+
+
+def test_download_without_content_length_is_fetched_whole(tmp_path):
+    stats = download_without_size(tmp_path, expected_sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    assert stats["verified"] and (tmp_path / "trunk.pt").read_bytes() == PAYLOAD
+
+
+def test_download_without_size_nor_checksum_is_not_finalized(tmp_path):
+    with pytest.raises(IOError, match="cannot be verified"):
+        download_without_size(tmp_path)
+    assert not (tmp_path / "trunk.pt").exists() and not (tmp_path / "trunk.pt.part").exists()
@@ -0,0 +1,159 @@
+# Import libraries
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Optional
+import json
+import threading
+import time
+
+# Define parameters for the traces of the inference jobs
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+TRACE_FILE = results_dir / "traces" / "spans.jsonl"  # one span per line, client and container spans of every run
+
+# Stages of a run in order. Container spans are recorded by modal_app.run_chai1, the others by the client.
+STAGES = [
+    "dependency_check",  # client, weights manifest check before the first run of the process
+    "model_load",  # container, weights loaded on the GPU, reported by the first run of each container
+    "msa",  # container, MSAs served from the store or the MSA server
+    "fold",  # container, chai1.run_inference with the GPU memory peak
+    "embedding",  # container, feature and token embedding inside the fold
+    "trunk",  # container, trunk recycles inside the fold
+    "diffusion",  # container, diffusion steps inside the fold
+    "confidence",  # container, confidence head inside the fold
+    "serialization",  # container, score and CIF files read and encoded for the wire
+    "transfer",  # client, time waiting for the remote results not spent in the container: scheduling, cold start and transfer
+    "persistence",  # client, score and CIF files written to results/
+    "conversion",  # client, CIF to PDB conversion for the viewer
+]
+
+_lock = threading.Lock()  # spans are recorded from the Gradio handlers and the writer pool
+
+
+def record_span(run_id: str, stage: str, seconds: float, start: Optional[float] = None, source: str = "client", **attributes):
+    """Append a span to results/traces/spans.jsonl.
+
+    Args:
+        run_id (str): Unique identifier for the inference run
+        stage (str): One of STAGES
+        seconds (float): Duration of the stage
+        start (float, optional): Start time of the stage as a UNIX timestamp. Default is now minus seconds.
+        source (str, optional): "client" or "container". Default is "client".
+        **attributes: Payload sizes, GPU memory peak, model index, ...
+    """
+    record = {
+        "run_id": run_id,
+        "stage": stage,
+        "source": source,
+        "start": start if start is not None else time.time() - seconds,
+        "seconds": round(seconds, 4),
+        **attributes,
+    }
+    with _lock:
+        TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(TRACE_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def span(run_id: str, stage: str, **attributes):
+    """Record the duration of the block as a span. Attributes known inside the block can be added to the yielded dict."""
+    start, wall_start = time.perf_counter(), time.time()
+    attributes = dict(attributes)
+    try:
+        yield attributes
+    finally:
+        record_span(run_id, stage, time.perf_counter() - start, wall_start, **attributes)
+
+
+def timed_iter(iterable, timing: dict):
+    """Yield the items of an iterable, adding the time spent waiting for each of them to timing["wait_seconds"]."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timing["wait_seconds"] = timing.get("wait_seconds", 0.0) + time.perf_counter() - start
+        yield item
+
+
+def collect_container_spans(run_id: str, n_shards: int = 1) -> int:
+    """Move the container spans of a run from the chai1-job-spans Modal Dict to the trace file.
+
+    Sharded runs record their spans under <run_id>-shard_<index>.
+
+    Returns:
+        int: Number of spans collected
+    """
+    from modal_app import job_spans
+
+    keys = {None: run_id} if n_shards <= 1 else {ii: f"{run_id}-shard_{ii}" for ii in range(n_shards)}
+    collected = 0
+    for shard_index, key in keys.items():
+        try:
+            spans = job_spans.pop(key)
+        except KeyError:
+            continue
+        for record in spans:
+            shard = {} if shard_index is None else {"shard_index": shard_index}
+            record_span(**{**record, **shard, "run_id": run_id})
+        collected += len(spans)
+    return collected
+
+
+def read_spans(run_id: Optional[str] = None) -> list:
+    """Read the spans of the trace file, only the ones of a run if run_id is given."""
+    if not TRACE_FILE.exists():
+        return []
+    with _lock:
+        lines = TRACE_FILE.read_text().splitlines()
+    spans = [json.loads(line) for line in lines if line.strip()]
+    return [record for record in spans if run_id is None or record["run_id"] == run_id]
+
+
+def job_metrics(run_id: Optional[str] = None) -> dict:
+    """Summarize the spans of one run, or of all the runs to size capacity.
+
+    Args:
+        run_id (str, optional): Run to report. If not provided, all the runs of the trace file.
+
+    Returns:
+        dict: For a run, its spans, the time of each stage, the GPU memory peak and the payload sizes.
+            For all runs, per stage: number of spans, p50/p95 and total seconds, and the p95 GPU memory peak.
+    """
+    spans = read_spans(run_id)
+
+    def percentile(values, q):
+        values = sorted(v for v in values if v is not None)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+    stages = [stage for stage in STAGES if any(record["stage"] == stage for record in spans)]
+    if run_id is not None:
+        return {
+            "run_id": run_id,
+            "stage_seconds": {
+                stage: round(sum(r["seconds"] for r in spans if r["stage"] == stage), 4) for stage in stages
+            },
+            "gpu_memory_peak_bytes": max((r["gpu_memory_peak_bytes"] for r in spans if "gpu_memory_peak_bytes" in r), default=None),
+            "payload_bytes": {
+                stage: sum(r["payload_bytes"] for r in spans if r["stage"] == stage and "payload_bytes" in r)
+                for stage in stages
+                if any("payload_bytes" in r for r in spans if r["stage"] == stage)
+            },
+            "spans": spans,
+        }
+
+    report = {"runs": len({record["run_id"] for record in spans}), "stages": {}}
+    for stage in stages:
+        seconds = [r["seconds"] for r in spans if r["stage"] == stage]
+        report["stages"][stage] = {
+            "spans": len(seconds),
+            "p50_seconds": percentile(seconds, 0.5),
+            "p95_seconds": percentile(seconds, 0.95),
+            "total_seconds": round(sum(seconds), 2),
+        }
+    report["p95_gpu_memory_peak_bytes"] = percentile([r.get("gpu_memory_peak_bytes") for r in spans], 0.95)
+    return report
@@ -0,0 +1,56 @@
+# Import libraries
+from pathlib import Path
+import json
+import os
+import threading
+import time
+from modal_app import CHAI_LAB_VERSION, INFERENCE_DEPENDENCIES
+
+# Define parameters for the local copy of the weights manifest
+results_dir = Path("results")  # same location as the files written by compute_Chai1
+
+MANIFEST_CACHE_FILE = results_dir / "cache" / "weights_manifest.json"
+MANIFEST_TTL_SECONDS = float(os.environ.get("CHAI1_MANIFEST_TTL", 24 * 3600))
+
+_lock = threading.Lock()  # Gradio runs handlers in worker threads
+_checked_at = None  # last successful check in this process
+
+
+def _manifest_is_current(manifest: dict) -> bool:
+    """Check that the manifest covers every dependency at the current chai_lab version."""
+    return all(
+        dep in manifest and manifest[dep]["version"] == CHAI_LAB_VERSION for dep in INFERENCE_DEPENDENCIES
+    )
+
+
+def check_inference_dependencies(download_function, force: bool = False) -> bool:
+    """Run the remote dependency check only when the local copy of the weights manifest is stale.
+
+    The inference containers verify the weights at startup anyway, this check only makes sure they
+    are downloaded ahead of time once per process or once per CHAI1_MANIFEST_TTL seconds.
+
+    Args:
+        download_function: Modal download_inference_dependencies function (local or deployed app)
+        force (bool, optional): Run the remote check even if the manifest is fresh. Default is False.
+
+    Returns:
+        bool: True if the remote check was run
+    """
+    global _checked_at
+    with _lock:
+        now = time.time()
+        if not force:
+            if _checked_at is not None and now - _checked_at < MANIFEST_TTL_SECONDS:
+                return False
+            if MANIFEST_CACHE_FILE.exists():
+                cached = json.loads(MANIFEST_CACHE_FILE.read_text())
+                if now - cached["checked"] < MANIFEST_TTL_SECONDS and _manifest_is_current(cached["manifest"]):
+                    _checked_at = cached["checked"]
+                    return False
+
+        print("🧬 weights manifest is stale, checking inference dependencies")
+        manifest = download_function.remote(force=False)
+        MANIFEST_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        MANIFEST_CACHE_FILE.write_text(json.dumps({"checked": now, "manifest": manifest}, indent=4))
+        _checked_at = now
+        return True